@@ -1,252 +1,172 @@
-from atproto import Client, models, AtUri
 import csv
 import time
 import os
 from datetime import datetime
 import traceback
 import html
-import configparser
-import requests 
-import uuid     
+import argparse
+import json
 from urllib.parse import urlparse 
+from archive import (
+    XRPC_REQUESTS_PER_SECOND, fetch_all_user_posts_from_repo, fetch_all_user_posts_sync, load_credentials, login_to_bluesky,
+    resolve_post_asset_paths, submit_record_row_assets
+)
+from asset_store import AssetDownloadPool, AssetStore, resolve_asset_placeholder
+from checkpoint import CHECKPOINT_FILENAME, CHECKPOINT_ROWS_FILENAME, FetchCheckpoint
+from rate_limiter import RateLimiter
+from csv_sink import StreamingCsvWriter, iter_csv_rows, iter_jsonl_rows, read_jsonl_rows_at
+from repo_export import resolve_pds_endpoint
+from post_hydration import PostHydrator, collect_referenced_uris
+from archive_db import ARCHIVE_DB_FILENAME, ArchiveDatabase, archive_item_key
+from search_index import SEARCH_BOX_HTML, SearchIndexWriter
+from run_metrics import RUN_REPORT_FILENAME, metrics
+from batch_archive import BATCH_STATUS_FILENAME_TEMPLATE, read_target_list, resolve_targets, run_batch, summarize_batch
+from follow_stream import JETSTREAM_URL, FollowState, JetstreamFollower, event_to_change
+from feed_window import AUTHOR_FEED_FILTERS, FeedWindow
+from post_record import PostRecord
+from thread_tree import ThreadIndexEntry, apply_thread_depths, thread_display_order
+from media_cache import MediaCache
+from archive_package import PACKAGE_FORMATS, move_folder_into_package, open_archive_package, package_filepath_for, package_format_error
 # No longer need 'import atproto' just for version for the footer
 
 # --- Configuration ---
-CONFIG_FILE = 'config.ini'
+# Credentials, login, feed paging and extraction are shared with app-csv.py and the headless CLI in archive.py
 ASSETS_FOLDER_NAME = 'assets' # Just the name of the subfolder
 # OUTPUT_FILENAME_TEMPLATE_CSV and _HTML will be used for basenames inside the archive folder
 OUTPUT_FILENAME_CSV = "archive_data.csv" 
 OUTPUT_FILENAME_HTML = "profile_archive.html"
-POSTS_PER_REQUEST_LIMIT = 100
-REQUEST_DELAY_SECONDS = 1 
-IMAGE_DOWNLOAD_DELAY_SECONDS = 0.5 
+MERGED_ROWS_FILENAME = "merged_rows.jsonl" # Scratch file used by --stream --update to thread old and new rows together
+CSV_FIELDNAMES = [
+    'profile_user_handle', 'profile_user_did', 'item_type', 'uri', 'cid', 
+    'created_at', 'text', 'langs', 'author_handle', 'author_did', 'author_display_name', 
+    'author_local_avatar_path', 'reply_count', 'repost_count', 'like_count', 
+    'reply_to_post_uri', 'reply_root_post_uri', 'embed_type', 'embed_local_image_paths', 
+    'embed_image_alts', 'embed_external_url', 'embed_external_title', 
+    'embed_external_description', 'embed_quote_post_uri'
+]
+HTML_POSTS_PER_PAGE = 1000 # Larger timelines are split into pages behind an index page (0 = always a single page)
+CDN_REQUESTS_PER_SECOND = 20 # Local pacing for image downloads across all download workers
+MEDIA_DOWNLOAD_WORKERS = 8 # Size of the background media download pool
+MEDIA_MAX_CONCURRENT_PER_HOST = 4 # Politeness limit: parallel downloads allowed against any single host
+MEDIA_CACHE_MAX_GB = 10 # Default size limit of a --media-cache folder before its least recently used files are evicted
+HYDRATION_BATCHES_IN_FLIGHT = 4 # getPosts calls (25 URIs each) running at once while hydrating reply parents and quoted posts
+BATCH_ACCOUNT_WORKERS = 4 # Accounts archived at once in --batch mode (they share the rate limiters and the media download pool)
+FOLLOW_FLUSH_SECONDS = 2 # --follow writes buffered events to the archive database at least this often...
+FOLLOW_FLUSH_EVENTS = 100 # ...or as soon as this many are buffered
+FOLLOW_RENDER_INTERVAL_SECONDS = 60 # Minimum time between CSV/HTML re-renders of a followed archive (it is rendered once more on exit)
 
 # --- Helper Functions ---
 
-def load_credentials():
-    config = configparser.ConfigParser()
-    if not os.path.exists(CONFIG_FILE):
-        print(f"Error: Credentials file '{CONFIG_FILE}' not found."); return None, None
-    try:
-        config.read(CONFIG_FILE)
-        handle = config.get('BlueskyCredentials', 'handle')
-        app_password = config.get('BlueskyCredentials', 'app_password')
-        if not handle or not app_password or handle == "your_login_handle.bsky.social" or app_password == "xxxx-xxxx-xxxx-xxxx":
-            print(f"Error: Please update your actual credentials in '{CONFIG_FILE}'."); return None, None
-        return handle, app_password
-    except Exception as e:
-        print(f"Error reading credentials from '{CONFIG_FILE}': {e}"); return None, None
-
-def login_to_bluesky(user_login_handle, app_password):
-    client = Client()
-    try:
-        session_data = client.login(user_login_handle, app_password)
-        runner_did = session_data.did; runner_handle = session_data.handle
-        profile_params = models.AppBskyActorGetProfile.Params(actor=runner_did)
-        profile_details_response = client.app.bsky.actor.get_profile(params=profile_params)
-        display_name = profile_details_response.display_name
-        if not display_name: display_name = runner_handle 
-        print(f"Successfully logged in as script runner: {display_name} (@{runner_handle})")
-        print(f"Script runner DID: {runner_did}")
-        return client, runner_did, runner_handle
-    except Exception as e:
-        print(f"Login failed for script runner ({user_login_handle}): {e}"); return None, None, None
-
-def download_image(image_url, assets_dir_full_path_for_saving): # Renamed for clarity
-    """Downloads an image and saves it, returning a relative path like 'assets/filename.ext' for HTML."""
-    if not image_url: return None
-    try:
-        original_filename_part = image_url.split('/')[-1].split('@')[0].split('?')[0] 
-        file_ext = os.path.splitext(original_filename_part)[1].lower()
-        valid_extensions = ['.jpeg', '.jpg', '.png', '.gif', '.webp']
-        if file_ext not in valid_extensions or len(file_ext) > 5 : 
-            try:
-                head_resp = requests.head(image_url, timeout=5, allow_redirects=True)
-                head_resp.raise_for_status()
-                content_type = head_resp.headers.get('content-type')
-                if content_type:
-                    if 'jpeg' in content_type or 'jpg' in content_type: file_ext = '.jpg'
-                    elif 'png' in content_type: file_ext = '.png'
-                    elif 'gif' in content_type: file_ext = '.gif'
-                    elif 'webp' in content_type: file_ext = '.webp'
-                    else: file_ext = '.jpg' 
-                else: file_ext = '.jpg' 
-            except requests.exceptions.RequestException: file_ext = '.jpg' 
-        unique_id = str(uuid.uuid4().hex[:8]) 
-        filename_base = ''.join(c if c.isalnum() or c in ['_','-'] else '' for c in original_filename_part.rsplit('.',1)[0])[:30]
-        if not filename_base: filename_base = "image" 
-        local_filename_only = f"{filename_base}_{unique_id}{file_ext}"
-        local_filepath_full_for_saving = os.path.join(assets_dir_full_path_for_saving, local_filename_only)
-        print(f"    Downloading: {image_url} -> {local_filename_only}")
-        img_response = requests.get(image_url, stream=True, timeout=20) 
-        img_response.raise_for_status()
-        with open(local_filepath_full_for_saving, 'wb') as f:
-            for chunk in img_response.iter_content(chunk_size=8192): f.write(chunk)
-        time.sleep(IMAGE_DOWNLOAD_DELAY_SECONDS) 
-        return os.path.join(ASSETS_FOLDER_NAME, local_filename_only) # Crucially, return relative path for HTML
-    except requests.exceptions.RequestException as e:
-        print(f"    Error downloading {image_url}: {e}"); return None
-    except IOError as e:
-        print(f"    Error saving image from {image_url}: {e}"); return None
-    except Exception as e: 
-        print(f"    Unexpected error downloading/saving {image_url}: {e}"); return None
-
-def extract_post_details_for_csv(feed_view_post_item, profile_did_of_archived_user, profile_handle_of_archived_user, assets_dir_full_path):
-    # ... (This function remains largely the same, ensuring it uses assets_dir_full_path for download_image)
-    post = feed_view_post_item.post 
-    record = post.record 
-    original_post_author = post.author
-    item_type = "post" 
-    if isinstance(feed_view_post_item.reason, models.AppBskyFeedDefs.ReasonRepost):
-        if feed_view_post_item.reason.by.did == profile_did_of_archived_user: item_type = "repost"
-    elif hasattr(record, 'reply') and record.reply and record.reply.parent:
-        if original_post_author.did == profile_did_of_archived_user: item_type = "reply"
-    author_local_avatar_path = None
-    if original_post_author.avatar: 
-        print(f"    Fetching avatar for post author @{original_post_author.handle}...")
-        author_local_avatar_path = download_image(original_post_author.avatar, assets_dir_full_path)
-    details = {
-        'profile_user_handle': profile_handle_of_archived_user, 'profile_user_did': profile_did_of_archived_user, 'item_type': item_type,
-        'uri': post.uri, 'cid': post.cid, 'author_did': original_post_author.did,
-        'author_handle': original_post_author.handle, 'author_display_name': html.escape(original_post_author.display_name or original_post_author.handle),
-        'author_local_avatar_path': author_local_avatar_path or '',
-        'text': record.text if hasattr(record, 'text') else '',
-        'created_at': record.created_at if hasattr(record, 'created_at') else '',
-        'langs': ','.join(record.langs) if hasattr(record, 'langs') and record.langs else '',
-        'reply_count': post.reply_count if post.reply_count is not None else 0,
-        'repost_count': post.repost_count if post.repost_count is not None else 0,
-        'like_count': post.like_count if post.like_count is not None else 0,
-        'reply_to_post_uri': record.reply.parent.uri if hasattr(record, 'reply') and record.reply and record.reply.parent else '',
-        'reply_root_post_uri': record.reply.root.uri if hasattr(record, 'reply') and record.reply and record.reply.root else '',
-        'embed_type': '', 'embed_local_image_paths': '', 'embed_image_alts': '',
-        'embed_external_url': '', 'embed_external_title': '', 'embed_external_description': '',
-        'embed_quote_post_uri': ''
-    }
-    if isinstance(details['created_at'], datetime): details['created_at'] = details['created_at'].isoformat()
-    elif isinstance(record, dict) and 'createdAt' in record: details['created_at'] = record['createdAt']
-    if post.embed:
-        local_image_paths_list = []
-        image_alts_list = []
-        if isinstance(post.embed, models.AppBskyEmbedImages.View):
-            details['embed_type'] = 'images'
-            for img_view in post.embed.images:
-                local_path = download_image(img_view.fullsize, assets_dir_full_path)
-                if local_path: local_image_paths_list.append(local_path) 
-                image_alts_list.append(img_view.alt or '')
-            details['embed_local_image_paths'] = ','.join(local_image_paths_list)
-            details['embed_image_alts'] = ','.join(image_alts_list)
-        elif isinstance(post.embed, models.AppBskyEmbedExternal.View):
-            details['embed_type'] = 'external'; details['embed_external_url'] = post.embed.external.uri; details['embed_external_title'] = post.embed.external.title; details['embed_external_description'] = post.embed.external.description
-        elif isinstance(post.embed, models.AppBskyEmbedRecord.View): 
-            if isinstance(post.embed.record, models.AppBskyEmbedRecord.ViewRecord) and hasattr(post.embed.record, 'uri') and post.embed.record.uri : 
-                details['embed_type'] = 'quote_post'; details['embed_quote_post_uri'] = post.embed.record.uri
-        elif isinstance(post.embed, models.AppBskyEmbedRecordWithMedia.View): 
-            details['embed_type'] = 'record_with_media'
-            if post.embed.media and isinstance(post.embed.media, models.AppBskyEmbedImages.View):
-                for img_view in post.embed.media.images:
-                    local_path = download_image(img_view.fullsize, assets_dir_full_path)
-                    if local_path: local_image_paths_list.append(local_path)
-                    image_alts_list.append(img_view.alt or '')
-                details['embed_local_image_paths'] = ','.join(local_image_paths_list)
-                details['embed_image_alts'] = ','.join(image_alts_list)
-            if post.embed.record and isinstance(post.embed.record, models.AppBskyEmbedRecord.ViewRecord) and hasattr(post.embed.record, 'uri') and post.embed.record.uri:
-                 details['embed_quote_post_uri'] = post.embed.record.uri
-    return details
-
-def fetch_all_user_posts_sync(sync_client, actor_to_fetch, profile_did_of_archived_user, profile_handle_of_archived_user, assets_dir_full_path):
-    # ... (This function remains the same, it receives and passes assets_dir_full_path) ...
-    all_posts_data = []; cursor = None; total_fetched_count = 0
-    print(f"\nFetching posts for target profile: {profile_handle_of_archived_user} (Actor for API: {actor_to_fetch}, Target DID for context: {profile_did_of_archived_user})...")
-    while True:
-        try:
-            author_feed_params = models.AppBskyFeedGetAuthorFeed.Params(actor=actor_to_fetch, limit=POSTS_PER_REQUEST_LIMIT, cursor=cursor)
-            response_data = sync_client.app.bsky.feed.get_author_feed(params=author_feed_params)
-            feed_items = response_data.feed; current_cursor = response_data.cursor
-            if not feed_items: print("No more posts found or an empty feed segment."); break
-            new_posts_count = 0
-            for item_feed_view_post in feed_items:
-                if item_feed_view_post.post:
-                    print(f"  Processing post: {item_feed_view_post.post.uri}")
-                    post_details = extract_post_details_for_csv(item_feed_view_post, profile_did_of_archived_user, profile_handle_of_archived_user, assets_dir_full_path)
-                    all_posts_data.append(post_details)
-                    new_posts_count += 1
-            total_fetched_count += new_posts_count
-            print(f"Fetched {new_posts_count} posts in this batch. Total so far: {total_fetched_count}")
-            cursor = current_cursor
-            if not cursor: print("Reached the end of the feed (no more cursor)."); break
-            time.sleep(REQUEST_DELAY_SECONDS)
-        except Exception as e:
-            error_message = str(e)
-            print(f"Error fetching posts: {error_message}")
-            if "RateLimitExceeded" in error_message or "ratelimit" in error_message.lower(): print("Rate limit likely exceeded. Waiting for 60 seconds..."); time.sleep(60)
-            elif "HTTPError: 401" in error_message or "AuthenticationRequired" in error_message: print("Authentication error (401/AuthRequired) during fetch. Session might be invalid."); return None
-            elif "rsVySackLock" in error_message: print(f"Lexicon revision mismatch error. Your atproto SDK might be outdated: {error_message}"); return None
-            else: print(f"An unexpected error occurred during fetch ({type(e).__name__}): {error_message}. Stopping fetch."); traceback.print_exc(); return None
-    print(f"Finished fetching. Total items retrieved for {profile_handle_of_archived_user}: {len(all_posts_data)}")
-    return all_posts_data
-
 def save_posts_to_csv(posts_data, csv_full_filepath): # Now takes full path
     if not posts_data: print(f"No posts data to save to CSV."); return
-    # (Fieldnames are the same as the last version)
-    fieldnames = [
-        'profile_user_handle', 'profile_user_did', 'item_type', 'uri', 'cid', 
-        'created_at', 'text', 'langs', 'author_handle', 'author_did', 'author_display_name', 
-        'author_local_avatar_path', 'reply_count', 'repost_count', 'like_count', 
-        'reply_to_post_uri', 'reply_root_post_uri', 'embed_type', 'embed_local_image_paths', 
-        'embed_image_alts', 'embed_external_url', 'embed_external_title', 
-        'embed_external_description', 'embed_quote_post_uri'
-    ]
+    fieldnames = CSV_FIELDNAMES
+    temp_csv_filepath = csv_full_filepath + '.tmp' # Written aside and swapped in, so a failed rewrite never clobbers an existing archive
     try:
-        with open(csv_full_filepath, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore') 
-            writer.writeheader();
-            for post_row in posts_data: writer.writerow(post_row)
+        with open(temp_csv_filepath, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(fieldnames)
+            for post_record in posts_data: writer.writerow(post_record.csv_values(fieldnames))
+        os.replace(temp_csv_filepath, csv_full_filepath)
         print(f"Successfully saved {len(posts_data)} posts to {csv_full_filepath}")
     except IOError as e: print(f"Error saving posts to CSV file {csv_full_filepath}: {e}")
 
-# organize_feed_for_threading (Same as before)
-def organize_feed_for_threading(all_posts_data_list, profile_did_of_archived_user):
-    if not all_posts_data_list: return []
-    posts_by_uri = {post['uri']: post for post in all_posts_data_list}
-    replies_to_parent = {}
-    for post_data in all_posts_data_list:
-        if post_data['author_did'] == profile_did_of_archived_user and post_data.get('reply_to_post_uri'):
-            parent_uri = post_data['reply_to_post_uri']
-            if parent_uri not in replies_to_parent: replies_to_parent[parent_uri] = []
-            replies_to_parent[parent_uri].append(post_data)
-    for parent_uri in replies_to_parent:
-        replies_to_parent[parent_uri].sort(key=lambda p: p['created_at'])
-    display_feed = []; processed_uris = set()
-    def add_threaded_replies_recursive(parent_uri_to_check):
-        if parent_uri_to_check in replies_to_parent:
-            for reply_post in replies_to_parent[parent_uri_to_check]:
-                if reply_post['uri'] not in processed_uris:
-                    display_feed.append(reply_post); processed_uris.add(reply_post['uri'])
-                    add_threaded_replies_recursive(reply_post['uri'])
-    for post_data in all_posts_data_list:
-        if post_data['uri'] not in processed_uris:
-            display_feed.append(post_data); processed_uris.add(post_data['uri'])
-            add_threaded_replies_recursive(post_data['uri'])
-    return display_feed
-
-def generate_html_timeline( # (Same as before, with the footer change)
-    posts_data_list, target_profile_handle, html_full_filepath, # Now takes full path
-    target_avatar_local_path=None, target_banner_local_path=None,
-    followers_count=0, follows_count=0, posts_count=0, profile_description=""
-):
-    # ... (This function remains the same as the last full version with the authenticity footer)
-    if not posts_data_list and not (target_avatar_local_path or target_banner_local_path) and not profile_description:
-        print(f"No posts data or profile media/info to generate HTML for {target_profile_handle}.")
-        return
+def write_rows_to_csv(rows, csv_full_filepath):
+    """Streams rows from any iterable into the CSV (written aside and swapped in); returns the number of rows."""
+    csv_stream = StreamingCsvWriter(csv_full_filepath + '.tmp', CSV_FIELDNAMES)
+    try: csv_stream.write_rows(rows)
+    finally: csv_stream.close()
+    os.replace(csv_stream.csv_full_filepath, csv_full_filepath)
+    print(f"Successfully saved {csv_stream.rows_written} posts to {csv_full_filepath}")
+    return csv_stream.rows_written
 
-    color_page_bg = "#161E27"; color_post_text = "#E5E7EB"; color_display_name = "#FFFFFF"
-    color_handle_time_stats = "#8899A6"; color_link = "#1D9BF0"; color_separator = "#38444D"
-    color_repost_text = "#A0AEC0"
-    font_family = "system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, 'Open Sans', 'Helvetica Neue', sans-serif"
-    archive_generation_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')
+def open_archive_database(archive_folder_path, import_batch_rows=1000):
+    """Opens (or creates) the archive's SQLite database; a new database next to an existing CSV is seeded from it."""
+    db_full_filepath = os.path.join(archive_folder_path, ARCHIVE_DB_FILENAME); is_new_database = not os.path.exists(db_full_filepath)
+    archive_db = ArchiveDatabase(db_full_filepath)
+    if is_new_database:
+        csv_rows = []
+        for csv_row in iter_csv_rows(os.path.join(archive_folder_path, OUTPUT_FILENAME_CSV)):
+            csv_rows.append(csv_row)
+            if len(csv_rows) >= import_batch_rows: archive_db.upsert_rows(csv_rows); csv_rows = []
+        if csv_rows: archive_db.upsert_rows(csv_rows)
+        if archive_db.count(): print(f"Imported {archive_db.count()} rows from the existing CSV into {db_full_filepath}")
+    return archive_db
+
+def merge_new_posts_into_archive(new_posts_data, existing_posts_data):
+    """Puts freshly fetched items ahead of the archived ones; a refetched item replaces its older copy (e.g. updated counts)."""
+    new_item_keys = {archive_item_key(p.item_type, p.uri) for p in new_posts_data}
+    return list(new_posts_data) + [p for p in existing_posts_data if archive_item_key(p.item_type, p.uri) not in new_item_keys]
+
+def organize_feed_for_threading(all_posts_data_list, profile_did_of_archived_user, whole_conversations=False):
+    """The posts in threaded display order (see thread_tree.thread_display_order), each with its thread_depth set."""
+    order, depths = thread_display_order(all_posts_data_list, profile_did_of_archived_user, whole_conversations)
+    return list(apply_thread_depths((all_posts_data_list[index] for index in order), depths))
+
+def organize_rows_file_for_threading(rows_jsonl_filepath, profile_did_of_archived_user, max_rows=None, whole_conversations=False):
+    """Threaded display order for the rows of a JSON-lines file, returned as (byte offsets into it, thread depths).
+
+    Only a small index entry per row is kept in memory; the rows themselves are read back with read_jsonl_rows_at.
+    """
+    row_index = []; row_offset = 0
+    with open(rows_jsonl_filepath, 'rb') as f:
+        for row_number, line in enumerate(f):
+            if max_rows is not None and row_number >= max_rows: break
+            row = json.loads(line)
+            row_index.append(ThreadIndexEntry(
+                row['uri'], row.get('author_did', ''), row.get('item_type', ''), row.get('reply_to_post_uri', ''), row.get('reply_root_post_uri', ''), row.get('created_at', ''), row_offset
+            ))
+            row_offset += len(line)
+    order, depths = thread_display_order(row_index, profile_did_of_archived_user, whole_conversations)
+    return [row_index[index].row_ref for index in order], depths
+
+def finish_streamed_archive(csv_stream, checkpoint, archive_folder_path, profile_did_of_archived_user, merge_existing_csv=False, apply_threading=True, whole_conversations=False):
+    """Completes a --stream run from the rows on disk instead of a list in memory.
+
+    For an update the previous CSV's rows (minus refetched items) are appended behind the new ones. With apply_threading
+    the CSV is rewritten in threaded order. Returns (rows_jsonl_filepath, rows_count, (row offsets, thread depths) in display order or None).
+    """
+    csv_full_filepath = os.path.join(archive_folder_path, OUTPUT_FILENAME_CSV)
+    rows_jsonl_filepath = checkpoint.rows_path; rows_count = checkpoint.state['rows_committed']
+    if merge_existing_csv:
+        new_item_keys = {archive_item_key(row.item_type, row.uri) for row in checkpoint.iter_rows()}
+        rows_jsonl_filepath = os.path.join(archive_folder_path, MERGED_ROWS_FILENAME)
+        with open(rows_jsonl_filepath, 'w', encoding='utf-8') as merged_rows_file:
+            for row in checkpoint.iter_rows(): merged_rows_file.write(json.dumps(row.as_dict(), ensure_ascii=False) + '\n')
+            for row in iter_csv_rows(csv_full_filepath):
+                if archive_item_key(row.item_type, row.uri) in new_item_keys: continue
+                csv_stream.write_rows([row]); merged_rows_file.write(json.dumps(row.as_dict(), ensure_ascii=False) + '\n'); rows_count += 1
+    csv_stream.close()
+    if csv_stream.csv_full_filepath != csv_full_filepath: os.replace(csv_stream.csv_full_filepath, csv_full_filepath)
+    print(f"Streamed {rows_count} rows to {csv_full_filepath}")
+    if not apply_threading: return rows_jsonl_filepath, rows_count, None
+    print("\nOrganizing posts for threaded display from the on-disk rows...")
+    row_offsets, thread_depths = organize_rows_file_for_threading(rows_jsonl_filepath, profile_did_of_archived_user, rows_count, whole_conversations)
+    threaded_csv_stream = StreamingCsvWriter(csv_full_filepath + '.tmp', CSV_FIELDNAMES)
+    threaded_csv_stream.write_rows(read_jsonl_rows_at(rows_jsonl_filepath, row_offsets)); threaded_csv_stream.close()
+    os.replace(threaded_csv_stream.csv_full_filepath, csv_full_filepath)
+    print(f"Organization complete. Total items for display: {len(row_offsets)}")
+    return rows_jsonl_filepath, rows_count, (row_offsets, thread_depths)
 
-    html_content = f"""<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Bluesky Archive: @{html.escape(target_profile_handle)}</title><style>
+def hydrate_context_posts(client, archive_folder_path, rows):
+    """Fetches the reply parents/roots and quoted posts the rows reference but the archive does not hold; returns {uri: context post}."""
+    referenced_uris, archived_uris = collect_referenced_uris(rows)
+    return PostHydrator(client, archive_folder_path, HYDRATION_BATCHES_IN_FLIGHT).hydrate(referenced_uris - archived_uris)
+
+HTML_COLORS = {
+    'page_bg': "#161E27", 'post_text': "#E5E7EB", 'display_name': "#FFFFFF", 'handle_time_stats': "#8899A6",
+    'link': "#1D9BF0", 'separator': "#38444D", 'repost_text': "#A0AEC0"
+}
+HTML_FONT_FAMILY = "system-ui, -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, 'Open Sans', 'Helvetica Neue', sans-serif"
+BSKY_PROFILE_URI_BASE = "https://bsky.app/profile/"
+HTML_THREAD_INDENT_PX = 20 # Per level of a threaded reply (PostRecord.thread_depth)
+HTML_THREAD_MAX_INDENT_DEPTH = 10 # Deeper replies stay at this indentation so long chains remain readable
+
+def html_page_head(page_title):
+    color_page_bg = HTML_COLORS['page_bg']; color_post_text = HTML_COLORS['post_text']; color_display_name = HTML_COLORS['display_name']
+    color_handle_time_stats = HTML_COLORS['handle_time_stats']; color_link = HTML_COLORS['link']; color_separator = HTML_COLORS['separator']
+    color_repost_text = HTML_COLORS['repost_text']; font_family = HTML_FONT_FAMILY
+    return f"""<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{html.escape(page_title)}</title><style>
         body {{ font-family: {font_family}; line-height: 1.5; margin: 0; background-color: {color_page_bg}; color: {color_post_text}; }}
         .profile-header {{ margin-bottom: 0px; position: relative; }}
         .profile-banner {{ width: 100%; background-color: {color_separator}; }}
@@ -261,6 +181,7 @@ def generate_html_timeline( # (Same as before, with the footer change)
         .profile-description {{ font-size: 0.95em; margin-bottom: 10px; white-space: pre-wrap; word-wrap: break-word; }}
         .timeline-container {{ max-width: 600px; margin: auto; }}
         .post-item {{ display: flex; padding: 12px 16px; border-bottom: 1px solid {color_separator}; }} .post-item:last-child {{ border-bottom: none; }}
+        .post-item.thread-reply {{ border-left: 2px solid {color_separator}; }}
         .avatar-column {{ width: 48px; margin-right: 12px; flex-shrink: 0; }}
         .avatar-column img {{ width: 40px; height: 40px; border-radius: 50%; background-color: {color_handle_time_stats}; }}
         .post-content-column {{ flex-grow: 1; min-width: 0; }}
@@ -278,171 +199,612 @@ def generate_html_timeline( # (Same as before, with the footer change)
         .embed-external span {{ font-size: 0.85em; color: {color_handle_time_stats}; display: block; margin-bottom: 3px; }}
         .embed-external small {{ font-size: 0.8em; color: {color_handle_time_stats}; display: block; }}
         .embed-quote {{ border: 1px solid {color_separator}; padding: 10px 12px; margin-top: 10px; border-radius: 8px; }} .embed-quote p {{ margin: 0; font-size: 0.9em; }} .embed-quote a {{ color: {color_link}; text-decoration: none; }} .embed-quote a:hover {{ text-decoration: underline; }}
+        .context-post {{ border-left: 2px solid {color_separator}; padding: 4px 10px; margin: 4px 0 10px 0; font-size: 0.9em; }} .context-post-author {{ color: {color_handle_time_stats}; margin-bottom: 2px; }} .context-post-author strong {{ color: {color_display_name}; }}
+        .context-post-text {{ white-space: pre-wrap; word-wrap: break-word; }} .embed-quote .context-post {{ border-left: none; padding: 6px 0 0 0; margin: 0; }}
+        .archive-search {{ padding: 10px 16px; border-bottom: 1px solid {color_separator}; }} .archive-search input {{ width: 100%; box-sizing: border-box; padding: 8px 12px; border-radius: 18px; border: 1px solid {color_separator}; background: transparent; color: {color_post_text}; font-size: 0.95em; }}
+        .archive-search ol {{ list-style: none; margin: 0; padding: 0; }} .archive-search li {{ padding: 8px 0; border-bottom: 1px solid {color_separator}; font-size: 0.9em; }} .archive-search li a {{ color: {color_link}; text-decoration: none; }} .archive-search li div {{ color: {color_post_text}; }}
         .post-stats {{ font-size: 0.85em; color: {color_handle_time_stats}; margin-top: 10px; }} .post-stats span {{ margin-right: 15px; }}
+        .page-nav {{ display: flex; justify-content: space-between; padding: 12px 16px; border-bottom: 1px solid {color_separator}; font-size: 0.9em; }} .page-nav a {{ color: {color_link}; text-decoration: none; }} .page-nav a:hover {{ text-decoration: underline; }}
+        .page-index {{ list-style: none; margin: 0; padding: 0; }} .page-index li {{ padding: 10px 16px; border-bottom: 1px solid {color_separator}; }} .page-index a {{ color: {color_link}; text-decoration: none; }} .page-index small {{ color: {color_handle_time_stats}; margin-left: 8px; }}
         .archive-footer {{ text-align: center; padding: 20px; margin-top: 30px; border-top: 1px solid {color_separator}; font-size: 0.8em; color: {color_handle_time_stats}; }}
         .archive-footer p {{ margin: 5px 0; }} .archive-footer a {{ color: {color_link}; text-decoration: none; }} .archive-footer a:hover {{ text-decoration: underline; }}
-    </style></head><body><div class="timeline-container"><div class="profile-header">"""
-    html_content += '<div class="profile-banner">'
-    if target_banner_local_path: html_content += f'<img src="{html.escape(target_banner_local_path)}" alt="Profile banner">'
-    else: html_content += f'<div style="width: 100%; aspect-ratio: 3 / 1; background-color: {color_separator};"></div>'
-    html_content += '</div>'
-    html_content += '<div class="profile-avatar-section">'
-    if target_avatar_local_path: html_content += f'<div class="profile-avatar"><img src="{html.escape(target_avatar_local_path)}" alt="Profile avatar"></div>'
-    else: html_content += f'<div class="profile-avatar"><div style="width:80px; height:80px; border-radius:50%; background-color:{color_handle_time_stats};"></div></div>'
-    html_content += '</div></div>' 
-    html_content += f"""<div class="profile-info"><h1>{html.escape(target_profile_handle)}</h1><div class="handle">@{html.escape(target_profile_handle)}</div>
+    </style></head><body><div class="timeline-container">"""
+
+def render_profile_header_html(target_profile_handle, target_avatar_local_path, target_banner_local_path, followers_count, follows_count, posts_count, profile_description):
+    color_separator = HTML_COLORS['separator']; color_handle_time_stats = HTML_COLORS['handle_time_stats']
+    html_parts = ['<div class="profile-header"><div class="profile-banner">']
+    if target_banner_local_path: html_parts.append(f'<img src="{html.escape(target_banner_local_path)}" alt="Profile banner">')
+    else: html_parts.append(f'<div style="width: 100%; aspect-ratio: 3 / 1; background-color: {color_separator};"></div>')
+    html_parts.append('</div><div class="profile-avatar-section">')
+    if target_avatar_local_path: html_parts.append(f'<div class="profile-avatar"><img src="{html.escape(target_avatar_local_path)}" alt="Profile avatar"></div>')
+    else: html_parts.append(f'<div class="profile-avatar"><div style="width:80px; height:80px; border-radius:50%; background-color:{color_handle_time_stats};"></div></div>')
+    html_parts.append('</div></div>')
+    html_parts.append(f"""<div class="profile-info"><h1>{html.escape(target_profile_handle)}</h1><div class="handle">@{html.escape(target_profile_handle)}</div>
             <div class="stats">
                 <span><strong>{followers_count:,}</strong> Followers</span>
                 <span><strong>{follows_count:,}</strong> Following</span>
                 <span><strong>{posts_count:,}</strong> Posts</span>
-            </div>"""
-    if profile_description: html_content += f'<div class="profile-description">{profile_description}</div>'
-    html_content += '</div>'
-    if posts_data_list:
-        for post_data in posts_data_list:
-            author_local_avatar = post_data.get('author_local_avatar_path', '') 
-            avatar_html = f'<div style="width:40px; height:40px; border-radius:50%; background-color:{color_handle_time_stats};"></div>' 
-            if author_local_avatar: avatar_html = f'<img src="{html.escape(author_local_avatar)}" alt="Avatar for {html.escape(post_data.get("author_handle", "")) }">'
-            profile_user_h = html.escape(post_data.get('profile_user_handle', '')); item_type = html.escape(post_data.get('item_type', 'post'))
-            author_display_name = html.escape(post_data.get('author_display_name', 'Unknown Author')); author_handle = html.escape(post_data.get('author_handle', 'unknown.bsky.social'))
-            created_at_raw = post_data.get('created_at', ''); created_at_formatted = html.escape(created_at_raw)
-            try: dt_obj = datetime.fromisoformat(created_at_raw.replace('Z', '+00:00')); created_at_formatted = dt_obj.strftime('%b %d, %Y ⋅ %I:%M %p UTC') 
-            except ValueError: pass
-            post_text_html = html.escape(post_data.get('text', '')).replace('\n', '<br>\n')
-            reply_to_uri = post_data.get('reply_to_post_uri', ''); bsky_profile_uri_base = "https://bsky.app/profile/"
-            post_uri_slug = post_data.get("uri", "").split("/")[-1]; full_post_link_on_bsky = f"{bsky_profile_uri_base}{author_handle}/post/{post_uri_slug}"
-            html_content += f'<div class="post-item item-type-{item_type}"><div class="avatar-column">{avatar_html}</div><div class="post-content-column">'
-            if item_type == 'repost': html_content += f'<div class="repost-info">♻️ <a href="{bsky_profile_uri_base}{profile_user_h}" target="_blank">@{profile_user_h}</a> reposted</div>'
-            html_content += f'<div class="post-author-line"><span class="post-author-name">{author_display_name}</span><span class="post-author-handle"><a href="{bsky_profile_uri_base}{author_handle}" target="_blank">@{author_handle}</a></span><span class="post-timestamp-sep">·</span><span class="post-timestamp"><a href="{full_post_link_on_bsky}" target="_blank">{created_at_formatted}</a></span></div>'
-            if item_type == 'reply' and reply_to_uri:
-                try: reply_uri_parts = AtUri.from_str(reply_to_uri); reply_link = f"{bsky_profile_uri_base}{reply_uri_parts.hostname}/post/{reply_uri_parts.rkey}"; reply_link_text = f"@{reply_uri_parts.hostname}"
-                except ValueError: reply_link = html.escape(reply_to_uri); reply_link_text = "original post"
-                html_content += f'<div class="reply-info">↪️ Replying to <a href="{reply_link}" target="_blank">{html.escape(reply_link_text)}</a></div>'
-            html_content += f'<div class="post-text">{post_text_html}</div><div class="post-embeds">'
-            embed_type = post_data.get('embed_type', ''); local_image_paths_str = post_data.get('embed_local_image_paths', '')
-            if local_image_paths_str and (embed_type == 'images' or embed_type == 'record_with_media'):
-                local_image_paths = local_image_paths_str.split(','); image_alts_str = post_data.get('embed_image_alts', ''); image_alts = image_alts_str.split(',') if image_alts_str else [''] * len(local_image_paths)
-                for i, local_img_path in enumerate(local_image_paths):
-                    if local_img_path: alt_text = html.escape(image_alts[i] if i < len(image_alts) and image_alts[i] else 'Embedded image'); html_content += f'<img src="{html.escape(local_img_path)}" alt="{alt_text}">'
-            if embed_type == 'external':
-                ext_url = post_data.get('embed_external_url', '#'); ext_title = html.escape(post_data.get('embed_external_title', 'External Link')); ext_desc = html.escape(post_data.get('embed_external_description', '')); ext_domain = ''
-                if ext_url != '#':
-                    try: parsed_url = urlparse(ext_url); ext_domain = html.escape(parsed_url.netloc)
-                    except: pass
-                html_content += f'<div class="embed-external"><a href="{html.escape(ext_url)}" target="_blank" rel="noopener noreferrer">{(f"<small>{ext_domain}</small>" if ext_domain else "")}<strong>{ext_title}</strong><span>{ext_desc}</span></a></div>'
-            quote_post_uri = post_data.get('embed_quote_post_uri', '')
-            if quote_post_uri and (embed_type == 'quote_post' or embed_type == 'record_with_media'):
-                try: quote_uri_parts = AtUri.from_str(quote_post_uri); quote_link_on_bsky = f"{bsky_profile_uri_base}{quote_uri_parts.hostname}/post/{quote_uri_parts.rkey}"; quote_author_handle = f"@{quote_uri_parts.hostname}"
-                except ValueError: quote_link_on_bsky = html.escape(quote_post_uri); quote_author_handle = "quoted post"
-                html_content += f'<div class="embed-quote"><p>🔁 Quoting <a href="{quote_link_on_bsky}" target="_blank">{html.escape(quote_author_handle)}</a> (<a href="{quote_link_on_bsky}" target="_blank" style="font-size:0.8em; color:{color_handle_time_stats};">view</a>)</p></div>'
-            html_content += '</div>' 
-            html_content += f'<div class="post-stats"><span>💬 {post_data.get("reply_count", 0)}</span> <span>♻️ {post_data.get("repost_count", 0)}</span> <span>❤️ {post_data.get("like_count", 0)}</span></div></div></div>'
-    else:
-        html_content += "<p style='text-align:center; padding: 20px;'>No posts found in this archive.</p>"
-    html_content += f"""<div class="archive-footer">
+            </div>""")
+    if profile_description: html_parts.append(f'<div class="profile-description">{profile_description}</div>')
+    html_parts.append('</div>')
+    return ''.join(html_parts)
+
+def render_context_post_html(context_post):
+    """Inline copy of a post the archived one replies to or quotes (fetched by the hydration stage)."""
+    author_display_name = html.escape(context_post.get('author_display_name') or ''); author_handle = html.escape(context_post.get('author_handle') or '')
+    context_text_html = html.escape(context_post.get('text') or '').replace('\n', '<br>\n')
+    return f'<div class="context-post"><div class="context-post-author"><strong>{author_display_name}</strong> @{author_handle} · {html.escape((context_post.get("created_at") or "")[:10])}</div><div class="context-post-text">{context_text_html}</div></div>'
+
+def post_anchor_for(post_data):
+    """HTML id of a post on its page, used by the search index to link straight to it."""
+    return f"{'r' if post_data.item_type == 'repost' else 'p'}-{post_data.uri.split('/')[-1]}"
+
+def render_post_html(post_data, context_posts=None):
+    """Returns the HTML fragment for one archived post; hydrated reply parents and quoted posts from context_posts are shown inline,
+    and a threaded reply is indented by its thread_depth."""
+    from atproto import AtUri
+    context_posts = context_posts or {}
+    color_handle_time_stats = HTML_COLORS['handle_time_stats']; bsky_profile_uri_base = BSKY_PROFILE_URI_BASE
+    html_parts = []
+    author_local_avatar = post_data.author_local_avatar_path
+    avatar_html = f'<div style="width:40px; height:40px; border-radius:50%; background-color:{color_handle_time_stats};"></div>' 
+    if author_local_avatar: avatar_html = f'<img src="{html.escape(author_local_avatar)}" alt="Avatar for {html.escape(post_data.author_handle) }" loading="lazy" decoding="async">'
+    profile_user_h = html.escape(post_data.profile_user_handle); item_type = html.escape(post_data.item_type or 'post')
+    author_display_name = html.escape(post_data.author_display_name); author_handle = html.escape(post_data.author_handle)
+    created_at_raw = post_data.created_at; created_at_formatted = html.escape(created_at_raw)
+    try: dt_obj = datetime.fromisoformat(created_at_raw.replace('Z', '+00:00')); created_at_formatted = dt_obj.strftime('%b %d, %Y ⋅ %I:%M %p UTC') 
+    except ValueError: pass
+    post_text_html = html.escape(post_data.text).replace('\n', '<br>\n')
+    reply_to_uri = post_data.reply_to_post_uri
+    post_uri_slug = post_data.uri.split("/")[-1]; full_post_link_on_bsky = f"{bsky_profile_uri_base}{author_handle}/post/{post_uri_slug}"
+    thread_depth = min(post_data.thread_depth, HTML_THREAD_MAX_INDENT_DEPTH)
+    thread_attributes = f' thread-reply" style="margin-left:{thread_depth * HTML_THREAD_INDENT_PX}px' if thread_depth else ''
+    html_parts.append(f'<div class="post-item item-type-{item_type}{thread_attributes}" id="{html.escape(post_anchor_for(post_data))}"><div class="avatar-column">{avatar_html}</div><div class="post-content-column">')
+    if item_type == 'repost': html_parts.append(f'<div class="repost-info">♻️ <a href="{bsky_profile_uri_base}{profile_user_h}" target="_blank">@{profile_user_h}</a> reposted</div>')
+    html_parts.append(f'<div class="post-author-line"><span class="post-author-name">{author_display_name}</span><span class="post-author-handle"><a href="{bsky_profile_uri_base}{author_handle}" target="_blank">@{author_handle}</a></span><span class="post-timestamp-sep">·</span><span class="post-timestamp"><a href="{full_post_link_on_bsky}" target="_blank">{created_at_formatted}</a></span></div>')
+    if item_type == 'reply' and reply_to_uri:
+        try: reply_uri_parts = AtUri.from_str(reply_to_uri); reply_link = f"{bsky_profile_uri_base}{reply_uri_parts.hostname}/post/{reply_uri_parts.rkey}"; reply_link_text = f"@{reply_uri_parts.hostname}"
+        except ValueError: reply_link = html.escape(reply_to_uri); reply_link_text = "original post"
+        html_parts.append(f'<div class="reply-info">↪️ Replying to <a href="{reply_link}" target="_blank">{html.escape(reply_link_text)}</a></div>')
+        if context_posts.get(reply_to_uri): html_parts.append(render_context_post_html(context_posts[reply_to_uri]))
+    html_parts.append(f'<div class="post-text">{post_text_html}</div><div class="post-embeds">')
+    embed_type = post_data.embed_type; local_image_paths = post_data.embed_local_image_paths
+    if local_image_paths and (embed_type == 'images' or embed_type == 'record_with_media'):
+        image_alts = post_data.embed_image_alts
+        for i, local_img_path in enumerate(local_image_paths):
+            if local_img_path: alt_text = html.escape(image_alts[i] if i < len(image_alts) and image_alts[i] else 'Embedded image'); html_parts.append(f'<img src="{html.escape(local_img_path)}" alt="{alt_text}" loading="lazy" decoding="async">')
+    if embed_type == 'external':
+        ext_url = post_data.embed_external_url; ext_title = html.escape(post_data.embed_external_title); ext_desc = html.escape(post_data.embed_external_description); ext_domain = ''
+        if ext_url != '#':
+            try: parsed_url = urlparse(ext_url); ext_domain = html.escape(parsed_url.netloc)
+            except: pass
+        html_parts.append(f'<div class="embed-external"><a href="{html.escape(ext_url)}" target="_blank" rel="noopener noreferrer">{(f"<small>{ext_domain}</small>" if ext_domain else "")}<strong>{ext_title}</strong><span>{ext_desc}</span></a></div>')
+    quote_post_uri = post_data.embed_quote_post_uri
+    if quote_post_uri and (embed_type == 'quote_post' or embed_type == 'record_with_media'):
+        try: quote_uri_parts = AtUri.from_str(quote_post_uri); quote_link_on_bsky = f"{bsky_profile_uri_base}{quote_uri_parts.hostname}/post/{quote_uri_parts.rkey}"; quote_author_handle = f"@{quote_uri_parts.hostname}"
+        except ValueError: quote_link_on_bsky = html.escape(quote_post_uri); quote_author_handle = "quoted post"
+        html_parts.append(f'<div class="embed-quote"><p>🔁 Quoting <a href="{quote_link_on_bsky}" target="_blank">{html.escape(quote_author_handle)}</a> (<a href="{quote_link_on_bsky}" target="_blank" style="font-size:0.8em; color:{color_handle_time_stats};">view</a>)</p>{render_context_post_html(context_posts[quote_post_uri]) if context_posts.get(quote_post_uri) else ""}</div>')
+    html_parts.append('</div>') 
+    html_parts.append(f'<div class="post-stats"><span>💬 {post_data.reply_count}</span> <span>♻️ {post_data.repost_count}</span> <span>❤️ {post_data.like_count}</span></div></div></div>')
+    return ''.join(html_parts)
+
+def render_footer_html(target_profile_handle, archive_generation_date):
+    return f"""<div class="archive-footer">
             <p>Bluesky Archive v1.0</p><p>Generated on: {archive_generation_date}</p>
             <p>Original profile: <a href="https://bsky.app/profile/{html.escape(target_profile_handle)}" target="_blank">@{html.escape(target_profile_handle)}</a></p>
             <p>Archive generated using the Bluesky API (AT Protocol)</p>
         </div></div></body></html>"""
+
+def render_page_nav_html(index_filename, previous_page_filename=None, next_page_filename=None):
+    previous_link = f'<a href="{html.escape(previous_page_filename)}">← Newer</a>' if previous_page_filename else '<span></span>'
+    next_link = f'<a href="{html.escape(next_page_filename)}">Older →</a>' if next_page_filename else '<span></span>'
+    return f'<div class="page-nav">{previous_link}<a href="{html.escape(index_filename)}">Index</a>{next_link}</div>'
+
+def html_page_key_for(post_data, split_by_month):
+    if not split_by_month: return None
+    return post_data.created_at[:7] or 'undated'
+
+def generate_html_timeline(
+    posts_data_list, target_profile_handle, html_full_filepath, # Now takes full path
+    target_avatar_local_path=None, target_banner_local_path=None,
+    followers_count=0, follows_count=0, posts_count=0, profile_description="",
+    posts_per_page=None, split_by_month=False, context_posts=None, search_index=None
+):
+    """Writes the timeline straight to disk, one post fragment at a time, from any iterable of posts.
+
+    With posts_per_page and/or split_by_month the timeline is split into pages next to html_full_filepath
+    (e.g. profile_archive_page_0001.html or profile_archive_2024-05.html) with Newer/Older links, and
+    html_full_filepath becomes an index page listing them. A timeline that fits on one page is written as before.
+    context_posts ({uri: context post}, see post_hydration) adds reply parents and quoted posts inline. With a
+    search_index (search_index.SearchIndexWriter) every post is indexed as it is written and a search box is added.
+    """
+    archive_generation_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')
+    page_title = f"Bluesky Archive: @{target_profile_handle}"
+    profile_header_html = render_profile_header_html(target_profile_handle, target_avatar_local_path, target_banner_local_path, followers_count, follows_count, posts_count, profile_description)
+    if search_index: profile_header_html += SEARCH_BOX_HTML
+    archive_folder_path = os.path.dirname(html_full_filepath); html_base_name = os.path.splitext(os.path.basename(html_full_filepath))[0]
+    index_filename = os.path.basename(html_full_filepath)
+    if isinstance(posts_data_list, list) and not posts_data_list and not (target_avatar_local_path or target_banner_local_path) and not profile_description:
+        print(f"No posts data or profile media/info to generate HTML for {target_profile_handle}.")
+        return
+    pages = [] # [filename, label, posts written, earliest created_at, latest created_at]
+    page_file = None; page_key = None
+    def page_filename_for(post_data):
+        if split_by_month: page_filename = f"{html_base_name}_{html_page_key_for(post_data, True)}.html"
+        else: page_filename = f"{html_base_name}_page_{len(pages) + 1:04d}.html"
+        if any(page[0] == page_filename for page in pages): page_filename = page_filename.replace('.html', f"_{len(pages) + 1}.html") # Month revisited out of order
+        return page_filename
+    def open_page(first_post_data, page_filename):
+        nonlocal page_file, page_key
+        page_key = html_page_key_for(first_post_data, split_by_month)
+        pages.append([page_filename, page_key if split_by_month else f"Page {len(pages) + 1}", 0, '', ''])
+        page_file = open(os.path.join(archive_folder_path, page_filename), 'w', encoding='utf-8')
+        page_file.write(html_page_head(f"{page_title} ({pages[-1][1]})"))
+        if len(pages) == 1: page_file.write(profile_header_html)
+        else: page_file.write(render_page_nav_html(index_filename, pages[-2][0]))
+    def close_page(next_page_filename):
+        previous_page_filename = pages[-2][0] if len(pages) > 1 else None
+        if previous_page_filename or next_page_filename: page_file.write(render_page_nav_html(index_filename, previous_page_filename, next_page_filename))
+        page_file.write(render_footer_html(target_profile_handle, archive_generation_date)); page_file.close()
     try:
-        with open(html_full_filepath, 'w', encoding='utf-8') as f: f.write(html_content)
-        print(f"Successfully generated HTML timeline to {html_full_filepath}")
+        if not (posts_per_page or split_by_month):
+            with open(html_full_filepath + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(html_page_head(page_title)); f.write(profile_header_html)
+                posts_written = 0
+                for post_data in posts_data_list:
+                    f.write(render_post_html(post_data, context_posts)); posts_written += 1
+                    if search_index: search_index.add(post_data, index_filename, post_anchor_for(post_data))
+                if not posts_written: f.write("<p style='text-align:center; padding: 20px;'>No posts found in this archive.</p>")
+                f.write(render_footer_html(target_profile_handle, archive_generation_date))
+            os.replace(html_full_filepath + '.tmp', html_full_filepath)
+            print(f"Successfully generated HTML timeline to {html_full_filepath}")
+            return
+        for post_data in posts_data_list:
+            if not page_file: open_page(post_data, page_filename_for(post_data))
+            elif (posts_per_page and pages[-1][2] >= posts_per_page) or html_page_key_for(post_data, split_by_month) != page_key:
+                next_page_filename = page_filename_for(post_data)
+                close_page(next_page_filename); open_page(post_data, next_page_filename)
+            page_file.write(render_post_html(post_data, context_posts)); pages[-1][2] += 1
+            if search_index: search_index.add(post_data, pages[-1][0], post_anchor_for(post_data))
+            created_at = post_data.created_at
+            if created_at:
+                if not pages[-1][3] or created_at < pages[-1][3]: pages[-1][3] = created_at
+                if created_at > pages[-1][4]: pages[-1][4] = created_at
+        if not page_file:
+            open_page(PostRecord(), page_filename_for(PostRecord())); page_file.write("<p style='text-align:center; padding: 20px;'>No posts found in this archive.</p>")
+        close_page(None)
+        if len(pages) == 1:
+            os.replace(os.path.join(archive_folder_path, pages[0][0]), html_full_filepath)
+            if search_index: search_index.rename_page(pages[0][0], index_filename)
+            print(f"Successfully generated HTML timeline to {html_full_filepath}")
+            return
+        with open(html_full_filepath + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(html_page_head(page_title)); f.write(profile_header_html); f.write('<ul class="page-index">')
+            for page_filename, label, page_post_count, earliest_created_at, latest_created_at in pages:
+                date_range = f"{earliest_created_at[:10]} – {latest_created_at[:10]}" if earliest_created_at else ''
+                f.write(f'<li><a href="{html.escape(page_filename)}">{html.escape(label)}</a><small>{page_post_count:,} posts {html.escape(date_range)}</small></li>')
+            f.write('</ul>'); f.write(render_footer_html(target_profile_handle, archive_generation_date))
+        os.replace(html_full_filepath + '.tmp', html_full_filepath)
+        print(f"Successfully generated HTML timeline to {html_full_filepath} (index of {len(pages)} pages)")
     except IOError as e: print(f"Error writing HTML file {html_full_filepath}: {e}")
 
 
+def render_archive_from_database(client, archive_db, archive_folder_path, target_profile, target_avatar_local_path, target_banner_local_path, cli_args, search_index=None):
+    """Writes the CSV and HTML of an archive kept in an ArchiveDatabase (threaded unless --no-threading); returns the item count."""
+    archived_items_count = archive_db.count()
+    print(f"Archive database {archive_db.db_full_filepath} holds {archived_items_count} items.")
+    def archive_db_display_rows(): return archive_db.iter_rows() if cli_args.no_threading else archive_db.iter_threaded_rows(target_profile.did, cli_args.thread_conversations)
+    with metrics.stage('csv'): write_rows_to_csv(archive_db_display_rows(), os.path.join(archive_folder_path, OUTPUT_FILENAME_CSV))
+    with metrics.stage('hydrate'): context_posts = hydrate_context_posts(client, archive_folder_path, archive_db.iter_rows()) if cli_args.hydrate_context else None
+    with metrics.stage('html'):
+        generate_html_timeline(
+            archive_db_display_rows(), target_profile.handle, os.path.join(archive_folder_path, OUTPUT_FILENAME_HTML),
+            target_avatar_local_path, target_banner_local_path,
+            target_profile.followers_count or 0, target_profile.follows_count or 0, target_profile.posts_count or 0,
+            html.escape(target_profile.description or "").replace('\n', '<br>\n'),
+            cli_args.html_page_size, cli_args.html_by_month, context_posts, search_index
+        )
+    return archived_items_count
+
+def archive_target_profile(client, target_profile, cli_args, xrpc_rate_limiter, cdn_rate_limiter, output_dir, archive_folder_path=None, resume_checkpoint=None,
+                           known_item_keys=None, existing_posts_data=None, archive_db=None, asset_download_pool=None, media_cache=None):
+    """Archives one resolved account (a ProfileViewDetailed) into archive_folder_path, or a new timestamped folder in output_dir.
+
+    known_item_keys/existing_posts_data/archive_db carry the state of an archive being updated, resume_checkpoint that of
+    an interrupted run. A batch run passes the AssetDownloadPool its accounts share, --media-cache the MediaCache. Returns the account's status dict;
+    with --package its 'package' is still open for finish_archive_package.
+    """
+    resolved_target_did = target_profile.did; resolved_target_handle_for_filenames = target_profile.handle
+    # Create the main archive folder for this user and timestamp (or reuse the one being updated/resumed)
+    if archive_folder_path:
+        main_archive_folder_path = os.path.abspath(archive_folder_path)
+    else:
+        archive_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        safe_profile_handle = resolved_target_handle_for_filenames.replace('.', '_').replace('@', '')
+        main_archive_folder_name = f"{safe_profile_handle}_archive_{archive_timestamp}"
+        main_archive_folder_path = os.path.join(output_dir, main_archive_folder_name)
+
+    if not os.path.exists(main_archive_folder_path):
+        os.makedirs(main_archive_folder_path, exist_ok=True)
+        print(f"Created main archive directory: {main_archive_folder_path}")
+
+    assets_full_path = os.path.join(main_archive_folder_path, ASSETS_FOLDER_NAME)
+    archive_package = None
+    if cli_args.package: # Media goes straight into the package; the folder only holds the text outputs until they are moved in
+        archive_package = open_archive_package(package_filepath_for(main_archive_folder_path, cli_args.package), os.path.basename(main_archive_folder_path), cli_args.package)
+        print(f"Archive will be packaged into: {archive_package.package_filepath}")
+    elif not os.path.exists(assets_full_path):
+        try: os.makedirs(assets_full_path); print(f"Created assets sub-directory: {assets_full_path}")
+        except OSError as e: print(f"Error creating assets sub-directory {assets_full_path}: {e}. Media might not be saved.")
+
+    if not archive_package:
+        print(f"Archive will be saved in: {main_archive_folder_path}")
+        print(f"Media assets will be saved to: {assets_full_path}")
+    asset_store = AssetStore(assets_full_path, cdn_rate_limiter, MEDIA_DOWNLOAD_WORKERS, MEDIA_MAX_CONCURRENT_PER_HOST, download_pool=asset_download_pool, package=archive_package, media_cache=media_cache)
+    fetch_checkpoint = resume_checkpoint
+    if not fetch_checkpoint:
+        fetch_checkpoint = FetchCheckpoint(main_archive_folder_path)
+        fetch_checkpoint.start(
+            target_did=resolved_target_did, target_handle=resolved_target_handle_for_filenames, update=bool(cli_args.update), stream=cli_args.stream, engine=cli_args.engine, db=cli_args.db,
+            filter=cli_args.filter, since=cli_args.since, until=cli_args.until
+        )
+    if cli_args.db and not archive_db: archive_db = open_archive_database(main_archive_folder_path)
+    if archive_db: archive_db.begin_run()
+
+    target_followers_count = target_profile.followers_count or 0
+    target_follows_count = target_profile.follows_count or 0
+    target_posts_count = target_profile.posts_count or 0
+    raw_description = target_profile.description or ""
+    target_description = html.escape(raw_description).replace('\n', '<br>\n')
+    target_avatar_local_path = None; target_banner_local_path = None
+    if target_profile.avatar:
+        print(f"  Target avatar URL: {target_profile.avatar}")
+        target_avatar_local_path = asset_store.submit(target_profile.avatar)
+    if target_profile.banner:
+        print(f"  Target banner URL: {target_profile.banner}")
+        target_banner_local_path = asset_store.submit(target_profile.banner)
+
+    csv_full_filepath = os.path.join(main_archive_folder_path, OUTPUT_FILENAME_CSV)
+    html_full_filepath = os.path.join(main_archive_folder_path, OUTPUT_FILENAME_HTML)
+    csv_stream = None
+    if cli_args.stream and not archive_db: # An update still has to read the old CSV at the end, so its stream goes to a side file
+        csv_stream = StreamingCsvWriter(csv_full_filepath + ('.tmp' if cli_args.update else ''), CSV_FIELDNAMES)
+    page_sink = archive_db.upsert_rows if archive_db else (csv_stream.write_rows if csv_stream else None)
+    with metrics.stage('fetch'):
+        if cli_args.engine == 'repo':
+            raw_posts_data = fetch_all_user_posts_from_repo(
+                resolved_target_did, resolved_target_handle_for_filenames,
+                asset_store, known_item_keys, fetch_checkpoint, page_sink, xrpc_rate_limiter,
+                cli_args.filter, FeedWindow(cli_args.since, cli_args.until)
+            )
+        else:
+            raw_posts_data = fetch_all_user_posts_sync(
+                client, resolved_target_did, 
+                resolved_target_did, resolved_target_handle_for_filenames,
+                asset_store, known_item_keys, fetch_checkpoint, page_sink,
+                cli_args.filter, FeedWindow(cli_args.since, cli_args.until)
+            )
+    print("\nWaiting for queued media downloads to finish...")
+    with metrics.stage('media_wait'): # Downloads still queued when the fetch finished
+        target_avatar_local_path = resolve_asset_placeholder(target_avatar_local_path)
+        target_banner_local_path = resolve_asset_placeholder(target_banner_local_path)
+        for post_details in raw_posts_data or []: resolve_post_asset_paths(post_details)
+        asset_store.close(); asset_store.save_manifest()
+    metrics.end_progress()
+    print(f"Media assets: {asset_store.downloads_count} downloaded, {asset_store.cached_count} from the media cache, {asset_store.reused_count} references reused.")
+    archived_items_count = 0
+    search_index = SearchIndexWriter(main_archive_folder_path) if raw_posts_data is not None and not cli_args.no_search_index else None
+    if raw_posts_data is not None and archive_db:
+        archived_items_count = render_archive_from_database(client, archive_db, main_archive_folder_path, target_profile, target_avatar_local_path, target_banner_local_path, cli_args, search_index)
+        fetch_checkpoint.remove()
+    elif raw_posts_data is not None and csv_stream:
+        with metrics.stage('threading'): # CSV finalization plus the threading post-pass over the on-disk rows
+            rows_jsonl_filepath, rows_count, threaded_rows = finish_streamed_archive(
+                csv_stream, fetch_checkpoint, main_archive_folder_path, resolved_target_did,
+                merge_existing_csv=bool(cli_args.update), apply_threading=not cli_args.no_threading, whole_conversations=cli_args.thread_conversations
+            )
+        with metrics.stage('hydrate'): context_posts = hydrate_context_posts(client, main_archive_folder_path, iter_jsonl_rows(rows_jsonl_filepath, rows_count)) if cli_args.hydrate_context else None
+        archived_items_count = rows_count
+        display_rows = apply_thread_depths(read_jsonl_rows_at(rows_jsonl_filepath, threaded_rows[0]), threaded_rows[1]) if threaded_rows else iter_jsonl_rows(rows_jsonl_filepath, rows_count)
+        with metrics.stage('html'):
+            generate_html_timeline(
+                display_rows, resolved_target_handle_for_filenames, html_full_filepath,
+                target_avatar_local_path, target_banner_local_path,
+                target_followers_count, target_follows_count, target_posts_count, target_description,
+                cli_args.html_page_size, cli_args.html_by_month, context_posts, search_index
+            )
+        if rows_jsonl_filepath != fetch_checkpoint.rows_path: os.remove(rows_jsonl_filepath)
+        fetch_checkpoint.remove()
+    elif raw_posts_data is not None:
+        if existing_posts_data is not None:
+            print(f"Merging {len(raw_posts_data)} new items into the {len(existing_posts_data)} already archived.")
+            raw_posts_data = merge_new_posts_into_archive(raw_posts_data, existing_posts_data)
+        organized_display_feed = raw_posts_data
+        if not cli_args.no_threading:
+            print("\nOrganizing posts for threaded display...")
+            with metrics.stage('threading'): organized_display_feed = organize_feed_for_threading(raw_posts_data, resolved_target_did, cli_args.thread_conversations)
+            print(f"Organization complete. Total items for display: {len(organized_display_feed)}")
+        archived_items_count = len(organized_display_feed)
+
+        with metrics.stage('csv'): save_posts_to_csv(organized_display_feed, csv_full_filepath)
+        with metrics.stage('hydrate'): context_posts = hydrate_context_posts(client, main_archive_folder_path, organized_display_feed) if cli_args.hydrate_context else None
+        with metrics.stage('html'):
+            generate_html_timeline(
+                organized_display_feed, resolved_target_handle_for_filenames, html_full_filepath,
+                target_avatar_local_path, target_banner_local_path,
+                target_followers_count, target_follows_count, target_posts_count, target_description,
+                cli_args.html_page_size, cli_args.html_by_month, context_posts, search_index
+            )
+        fetch_checkpoint.remove() # Everything it held is now in the CSV/HTML
+    elif archive_package:
+        if csv_stream: csv_stream.close()
+        print(f"The fetch stopped early; {archive_package.package_filepath} will only hold the media downloaded so far (--package runs cannot be resumed).")
+    else:
+        if csv_stream: csv_stream.close()
+        print(f"Progress so far is checkpointed. Run again with --resume \"{main_archive_folder_path}\" to continue where it stopped.")
+    if search_index:
+        with metrics.stage('search_index'): search_index.close()
+    if archive_db: archive_db.close()
+    return {
+        'did': resolved_target_did, 'handle': resolved_target_handle_for_filenames, 'archive_folder': main_archive_folder_path,
+        'status': 'completed' if raw_posts_data is not None else 'interrupted', 'archived_items': archived_items_count,
+        'media_downloaded': asset_store.downloads_count, 'media_from_cache': asset_store.cached_count, 'media_references_reused': asset_store.reused_count,
+        'package': archive_package
+    }
+
+
+def finish_archive_package(account_status):
+    """Moves what an --package run left in its archive folder (CSV, HTML, indexes, run report) into the package,
+    closes it and removes the folder; account_status['archive_folder'] then names the package file."""
+    archive_package = account_status.pop('package', None)
+    if not archive_package: return account_status
+    move_folder_into_package(archive_package, account_status['archive_folder'], skip_names=(CHECKPOINT_FILENAME, CHECKPOINT_ROWS_FILENAME))
+    archive_package.close()
+    account_status['archive_folder'] = archive_package.package_filepath
+    print(f"Archive packaged into {archive_package.package_filepath} ({os.path.getsize(archive_package.package_filepath)} bytes).")
+    return account_status
+
+
+def follow_archives(client, archive_folder_paths, cli_args, cdn_rate_limiter, jetstream_url=JETSTREAM_URL, media_cache=None):
+    """Keeps existing archives current from the Jetstream event stream until interrupted (Ctrl-C).
+
+    New posts, replies and reposts of each archive's account are decoded from their records as with --engine repo and
+    their media is queued on the archive's AssetStore; deleted posts and reposts are removed. Changes are buffered and
+    written to the archive database in one transaction per archive every FOLLOW_FLUSH_SECONDS (or FOLLOW_FLUSH_EVENTS
+    events), together with the stream cursor, so a restart replays only what was not yet written. The CSV/HTML are
+    re-rendered from the database at most every FOLLOW_RENDER_INTERVAL_SECONDS, and once more on exit.
+    """
+    asset_download_pool = AssetDownloadPool(cdn_rate_limiter, MEDIA_DOWNLOAD_WORKERS, MEDIA_MAX_CONCURRENT_PER_HOST)
+    followed = {} # did -> state of that account's archive
+    for archive_folder_path in archive_folder_paths:
+        if not os.path.isdir(archive_folder_path): print(f"Archive folder '{archive_folder_path}' not found. Skipping it."); continue
+        archive_db = open_archive_database(archive_folder_path); archived_did = archive_db.profile_user_did()
+        if not archived_did or archived_did in followed:
+            print(f"'{archive_folder_path}' is empty or its account is already followed. Skipping it."); archive_db.close(); continue
+        followed[archived_did] = {'archive_folder_path': os.path.abspath(archive_folder_path), 'archive_db': archive_db, 'follow_state': FollowState(archive_folder_path), 'pending_changes': {}}
+    profiles_by_did = resolve_targets(client, list(followed)) if followed else {}
+    for archived_did in list(followed):
+        followed_archive = followed[archived_did]; target_profile = profiles_by_did.get(archived_did)
+        try: pds_endpoint = resolve_pds_endpoint(archived_did) if target_profile else None
+        except Exception as e: print(f"    Error resolving the PDS of {archived_did}: {e}"); pds_endpoint = None
+        if not pds_endpoint:
+            print(f"Cannot follow {archived_did} ({followed_archive['archive_folder_path']}). Skipping it."); followed.pop(archived_did)['archive_db'].close(); continue
+        assets_full_path = os.path.join(followed_archive['archive_folder_path'], ASSETS_FOLDER_NAME); os.makedirs(assets_full_path, exist_ok=True)
+        asset_store = AssetStore(assets_full_path, cdn_rate_limiter, MEDIA_DOWNLOAD_WORKERS, MEDIA_MAX_CONCURRENT_PER_HOST, download_pool=asset_download_pool, media_cache=media_cache)
+        followed_archive.update({
+            'target_profile': target_profile, 'pds_endpoint': pds_endpoint, 'asset_store': asset_store,
+            'author_profile': {'displayName': target_profile.display_name, 'avatar_url': target_profile.avatar or ''},
+            'avatar_local_path': resolve_asset_placeholder(asset_store.submit(target_profile.avatar)) if target_profile.avatar else None,
+            'banner_local_path': resolve_asset_placeholder(asset_store.submit(target_profile.banner)) if target_profile.banner else None
+        })
+    if not followed: print("Nothing to follow."); asset_download_pool.close(); return
+    saved_cursors = [followed_archive['follow_state'].cursor for followed_archive in followed.values() if followed_archive['follow_state'].cursor]
+    follower = JetstreamFollower(list(followed), min(saved_cursors) if saved_cursors else None, jetstream_url)
+    render_due = set(); last_render_at = time.monotonic(); pending_since = None; pending_count = 0
+
+    def flush_pending_changes():
+        for followed_archive in followed.values():
+            pending_changes = followed_archive['pending_changes']; followed_archive['pending_changes'] = {}
+            if pending_changes:
+                archive_db = followed_archive['archive_db']
+                upserted_rows = [resolve_post_asset_paths(row) for change_kind, row in pending_changes.values() if change_kind == 'upsert']
+                deleted_item_keys = [item_key for item_key, (change_kind, _) in pending_changes.items() if change_kind == 'delete']
+                if upserted_rows: archive_db.begin_run(); archive_db.upsert_rows(upserted_rows[::-1], keep_archived_counts=True) # Newest first, ahead of earlier batches; edited items keep their counts and place
+                deleted_count = archive_db.delete_items(deleted_item_keys) if deleted_item_keys else 0
+                followed_archive['asset_store'].save_manifest(); render_due.add(followed_archive['archive_folder_path'])
+                metrics.count('follow_items_upserted', len(upserted_rows)); metrics.count('follow_items_deleted', deleted_count)
+                print(f"  @{followed_archive['target_profile'].handle}: {len(upserted_rows)} new or updated, {deleted_count} deleted ({archive_db.count()} items archived)")
+            followed_archive['follow_state'].cursor = follower.cursor or followed_archive['follow_state'].cursor; followed_archive['follow_state'].save()
+
+    def render_due_archives():
+        for followed_archive in followed.values():
+            if followed_archive['archive_folder_path'] not in render_due: continue
+            search_index = SearchIndexWriter(followed_archive['archive_folder_path']) if not cli_args.no_search_index else None
+            render_archive_from_database(
+                client, followed_archive['archive_db'], followed_archive['archive_folder_path'], followed_archive['target_profile'],
+                followed_archive['avatar_local_path'], followed_archive['banner_local_path'], cli_args, search_index
+            )
+            if search_index:
+                with metrics.stage('search_index'): search_index.close()
+        render_due.clear()
+
+    print(f"\nFollowing {len(followed)} account(s) on {jetstream_url}. Press Ctrl-C to stop.")
+    try:
+        for event in follower.events():
+            if event:
+                followed_archive = followed[event['did']]
+                change = event_to_change(event, followed_archive['target_profile'].handle, followed_archive['author_profile'], followed_archive['pds_endpoint'], followed_archive['follow_state'])
+                if change:
+                    change_kind, change_subject = change
+                    if change_kind == 'upsert': change_subject = submit_record_row_assets(change_subject, followed_archive['asset_store']) # Media starts downloading right away
+                    item_key = change_subject if change_kind == 'delete' else archive_item_key(change_subject.item_type, change_subject.uri)
+                    followed_archive['pending_changes'].pop(item_key, None); followed_archive['pending_changes'][item_key] = (change_kind, change_subject) # Last change to an item wins
+                    pending_count += 1; pending_since = pending_since or time.monotonic()
+            if pending_since and (pending_count >= FOLLOW_FLUSH_EVENTS or time.monotonic() - pending_since >= FOLLOW_FLUSH_SECONDS):
+                flush_pending_changes(); pending_since = None; pending_count = 0
+            if render_due and time.monotonic() - last_render_at >= FOLLOW_RENDER_INTERVAL_SECONDS:
+                render_due_archives(); last_render_at = time.monotonic()
+    except KeyboardInterrupt: print("\nStopping follow mode...")
+    finally:
+        follower.close()
+        flush_pending_changes(); render_due_archives()
+        for followed_archive in followed.values(): followed_archive['asset_store'].close(); followed_archive['archive_db'].close()
+        asset_download_pool.close()
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(description="Archive a Bluesky profile's posts, replies, reposts and media to CSV and HTML.")
+    arg_parser.add_argument('--target', help="Handle or DID to archive. Prompted for when omitted (or taken from the archive with --update).")
+    arg_parser.add_argument('--update', metavar='ARCHIVE_DIR', help="Refresh an existing archive folder incrementally: only items newer than those it holds are fetched, then merged in.")
+    arg_parser.add_argument('--stream', action='store_true', help="Bounded-memory mode: CSV rows are appended as each page is committed and nothing is held in memory; threading runs as a post-pass over the on-disk rows.")
+    arg_parser.add_argument('--html-page-size', type=int, default=HTML_POSTS_PER_PAGE, metavar='N', help=f"Posts per HTML page before the timeline is split into pages with an index (default {HTML_POSTS_PER_PAGE}, 0 for one page).")
+    arg_parser.add_argument('--html-by-month', action='store_true', help="Split the HTML timeline into one page per month, with an index page.")
+    arg_parser.add_argument('--no-threading', action='store_true', help="Keep the feed order in the CSV/HTML instead of grouping the user's replies under their parents.")
+    arg_parser.add_argument('--thread-conversations', action='store_true', help="Thread whole conversations: every archived reply is grouped under its parent or, failing that, its conversation root (reply_root_post_uri), not just the user's own replies.")
+    arg_parser.add_argument('--engine', choices=['feed', 'repo'], default='feed', help="'feed' pages getAuthorFeed 100 items at a time; 'repo' downloads the whole repository as one CAR file with com.atproto.sync.getRepo and decodes it locally (no engagement counts, reposts without the reposted post's content).")
+    arg_parser.add_argument('--hydrate-context', action='store_true', help="Fetch the posts the archive replies to or quotes (getPosts, 25 per call, several calls in flight) and show them inline in the HTML. Cached in context_posts.json.")
+    arg_parser.add_argument('--db', action='store_true', help=f"Keep the archive in an SQLite database ({ARCHIVE_DB_FILENAME}) that pages are upserted into as they arrive; the CSV and HTML are rendered from it. An --update of an archive that has one uses it automatically.")
+    arg_parser.add_argument('--no-search-index', action='store_true', help="Skip building the full-text search index (search_index.sqlite3, and search_index.js with search_index_shards/ for the HTML search box).")
+    arg_parser.add_argument('--filter', choices=AUTHOR_FEED_FILTERS, help="Only fetch this kind of item, using getAuthorFeed's filter (e.g. posts_no_replies, posts_with_media). Applied locally with --engine repo.")
+    arg_parser.add_argument('--since', metavar='DATE', help="Only archive items from this date or ISO 8601 time on; paging stops at the first older item.")
+    arg_parser.add_argument('--until', metavar='DATE', help="Only archive items up to this date (the whole day) or ISO 8601 time; newer items are skipped without downloading their media.")
+    arg_parser.add_argument('--package', choices=PACKAGE_FORMATS, help="Write the archive into one file, <folder>.zip or <folder>.tar.zst, instead of a folder: media is added as it downloads, the CSV/HTML/indexes once they are written. Images are stored without recompression; the package unpacks into the usual archive folder.")
+    arg_parser.add_argument('--media-cache', metavar='CACHE_DIR', help="Keep downloaded media in this folder across runs and archives: images already there are hard-linked (or reflinked, or copied) into the archive instead of downloaded, and ones without a blob CID are revalidated with ETag/If-Modified-Since. Least recently used files are evicted beyond --media-cache-size.")
+    arg_parser.add_argument('--media-cache-size', type=float, default=MEDIA_CACHE_MAX_GB, metavar='GB', help=f"Size limit of the --media-cache folder in GB (default {MEDIA_CACHE_MAX_GB}).")
+    arg_parser.add_argument('--resume', metavar='ARCHIVE_DIR', help="Continue an interrupted run from the checkpoint in its archive folder, without refetching committed pages or media.")
+    arg_parser.add_argument('--batch', metavar='TARGETS_FILE', help="Archive every handle/DID listed in this file (one per line, '#' comments) without prompting: they are resolved in bulk and archived in parallel over one login, rate-limit budget and media download pool.")
+    arg_parser.add_argument('--batch-workers', type=int, default=BATCH_ACCOUNT_WORKERS, metavar='N', help=f"Accounts archived at once in --batch mode (default {BATCH_ACCOUNT_WORKERS}).")
+    arg_parser.add_argument('--follow', nargs='+', metavar='ARCHIVE_DIR', help=f"Keep these archives current: subscribe to the Jetstream event stream for their accounts and add new posts/reposts and remove deleted ones within seconds, until Ctrl-C. Uses the archive database ({ARCHIVE_DB_FILENAME}), created from the CSV if needed.")
+    arg_parser.add_argument('--jetstream-url', default=JETSTREAM_URL, metavar='URL', help=f"Jetstream subscribe endpoint for --follow (default {JETSTREAM_URL}).")
+    arg_parser.add_argument('--session-file', metavar='FILE', help="Where the login session is saved between runs (default ~/.config/bluearch/bluesky_session.json, or under $XDG_CONFIG_HOME); owner-only, keep it out of checkouts.")
+    return arg_parser
+
+
+def check_cli_args(arg_parser, cli_args):
+    """Rejects option combinations that cannot work together (arg_parser.error exits with status 2)."""
+    if cli_args.batch and (cli_args.target or cli_args.update or cli_args.resume): arg_parser.error("--batch cannot be combined with --target, --update or --resume")
+    if cli_args.follow and (cli_args.batch or cli_args.target or cli_args.update or cli_args.resume): arg_parser.error("--follow cannot be combined with --batch, --target, --update or --resume")
+    if cli_args.follow and (cli_args.filter or cli_args.since or cli_args.until): arg_parser.error("--follow cannot be combined with --filter, --since or --until")
+    if cli_args.package and (cli_args.update or cli_args.resume or cli_args.follow): arg_parser.error("--package cannot be combined with --update, --resume or --follow")
+    if cli_args.package and package_format_error(cli_args.package): arg_parser.error(package_format_error(cli_args.package))
+    try: FeedWindow(cli_args.since, cli_args.until)
+    except ValueError as e: arg_parser.error(str(e))
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
+    arg_parser = build_arg_parser()
+    cli_args = arg_parser.parse_args()
+    check_cli_args(arg_parser, cli_args)
+
+    resume_checkpoint = None
+    if cli_args.resume:
+        resume_checkpoint = FetchCheckpoint(cli_args.resume)
+        if not resume_checkpoint.exists(): print(f"No fetch checkpoint found in '{cli_args.resume}'. Nothing to resume. Exiting."); exit(1)
+        resume_checkpoint.load()
+        if resume_checkpoint.state.get('update'): cli_args.update = cli_args.resume # The interrupted run was an incremental update
+        cli_args.stream = cli_args.stream or resume_checkpoint.state.get('stream', False)
+        cli_args.engine = resume_checkpoint.state.get('engine', 'feed')
+        cli_args.db = cli_args.db or resume_checkpoint.state.get('db', False)
+        cli_args.target = cli_args.target or resume_checkpoint.state.get('target_did')
+        for scope_option in ('filter', 'since', 'until'): setattr(cli_args, scope_option, resume_checkpoint.state.get(scope_option)) # Same scope as the interrupted run
+    archive_folder_to_reuse = cli_args.resume or cli_args.update
+
+    existing_posts_data = None; known_item_keys = None; archived_target_did = None; archive_db = None
+    if cli_args.update:
+        if not os.path.isdir(cli_args.update): print(f"Archive folder '{cli_args.update}' not found. Exiting."); exit(1)
+        if cli_args.db or ArchiveDatabase.exists_in(cli_args.update): # The database already holds everything the update needs
+            cli_args.db = True; archive_db = open_archive_database(cli_args.update)
+            known_item_keys = archive_db.item_keys(); newest_archived_at = archive_db.newest_created_at(); archived_target_did = archive_db.profile_user_did()
+        else:
+            if not cli_args.stream: existing_posts_data = [] # In --stream mode the old rows are re-read from disk at the end instead
+            known_item_keys = set(); newest_archived_at = ''
+            for archived_row in iter_csv_rows(os.path.join(cli_args.update, OUTPUT_FILENAME_CSV)):
+                known_item_keys.add(archive_item_key(archived_row.item_type, archived_row.uri))
+                if archived_row.item_type != 'repost': newest_archived_at = max(newest_archived_at, archived_row.created_at)
+                archived_target_did = archived_target_did or archived_row.profile_user_did
+                if existing_posts_data is not None: existing_posts_data.append(archived_row)
+        print(f"Incremental update of {cli_args.update}: {len(known_item_keys)} items already archived (newest post: {newest_archived_at or 'n/a'}).")
+
     logged_in_bluesky_handle, logged_in_app_password = load_credentials()
     if not logged_in_bluesky_handle or not logged_in_app_password: exit(1)
         
-    client, runner_did, runner_handle = login_to_bluesky(logged_in_bluesky_handle, logged_in_app_password)
+    xrpc_rate_limiter = RateLimiter('XRPC', XRPC_REQUESTS_PER_SECOND); cdn_rate_limiter = RateLimiter('CDN', CDN_REQUESTS_PER_SECOND)
+    with metrics.stage('login'): client, runner_did, runner_handle = login_to_bluesky(logged_in_bluesky_handle, logged_in_app_password, xrpc_rate_limiter, cli_args.session_file)
     if not client: print("Could not log in as script runner. Exiting."); exit(1)
-        
-    target_user_input = input("Enter the Bluesky handle OR DID of the user you want to archive (e.g., username.bsky.social or did:plc:xxxx): ").strip()
+    script_dir = os.path.dirname(os.path.abspath(__file__)) # Get directory where script is run
+    media_cache = MediaCache(cli_args.media_cache, int(cli_args.media_cache_size * 1e9)) if cli_args.media_cache else None
+
+    if cli_args.follow:
+        follow_archives(client, cli_args.follow, cli_args, cdn_rate_limiter, cli_args.jetstream_url, media_cache)
+        print(xrpc_rate_limiter.summary()); print(cdn_rate_limiter.summary())
+        if media_cache: print(media_cache.summary()); media_cache.close()
+        exit(0)
+
+    if cli_args.batch:
+        batch_targets = read_target_list(cli_args.batch)
+        print(f"\nBatch archiving {len(batch_targets)} accounts from {cli_args.batch}, {cli_args.batch_workers} at a time...")
+        with metrics.stage('resolve_target'): profiles_by_target = resolve_targets(client, batch_targets)
+        asset_download_pool = AssetDownloadPool(cdn_rate_limiter, MEDIA_DOWNLOAD_WORKERS, MEDIA_MAX_CONCURRENT_PER_HOST)
+        batch_statuses = run_batch(
+            profiles_by_target,
+            lambda target_profile: finish_archive_package(archive_target_profile(client, target_profile, cli_args, xrpc_rate_limiter, cdn_rate_limiter, script_dir, asset_download_pool=asset_download_pool, media_cache=media_cache)),
+            cli_args.batch_workers
+        )
+        asset_download_pool.close()
+        print(xrpc_rate_limiter.summary()); print(cdn_rate_limiter.summary())
+        if media_cache: print(media_cache.summary()); media_cache.close()
+        metrics.write_report(
+            os.path.join(script_dir, BATCH_STATUS_FILENAME_TEMPLATE.format(timestamp=datetime.now().strftime('%Y%m%d_%H%M%S'))), status=summarize_batch(batch_statuses),
+            targets_file=os.path.abspath(cli_args.batch), options=vars(cli_args), media_download_workers=MEDIA_DOWNLOAD_WORKERS,
+            rate_limiters={'xrpc': xrpc_rate_limiter.stats(), 'cdn': cdn_rate_limiter.stats()}, accounts=batch_statuses
+        )
+        print(f"\nBatch archiving finished: {summarize_batch(batch_statuses)}.")
+        exit(0 if all(account_status['status'] == 'completed' for account_status in batch_statuses) else 1)
+
+    target_user_input = cli_args.target or archived_target_did
+    if not target_user_input: target_user_input = input("Enter the Bluesky handle OR DID of the user you want to archive (e.g., username.bsky.social or did:plc:xxxx): ")
+    target_user_input = target_user_input.strip()
     if not target_user_input: print("No target user handle or DID provided. Exiting."); exit(1)
     
-    archive_target_actor_for_api = target_user_input 
     resolved_target_did = None; resolved_target_handle_for_filenames = None 
-    target_avatar_local_path = None; target_banner_local_path = None
-    target_followers_count = 0; target_follows_count = 0; target_posts_count = 0; target_description = ""
-
-    script_dir = os.path.dirname(os.path.abspath(__file__)) # Get directory where script is run
 
     print(f"\nAttempting to archive 'EVERYTHING' for target user: {target_user_input}")
-    
+    from atproto import models # Only once there is a target, so --help and the prompts do not wait for the SDK to load
     try:
         target_profile_details_obj = None 
-        if target_user_input.startswith("did:"):
-            resolved_target_did = target_user_input
-            print(f"Input is a DID: {resolved_target_did}. Fetching profile...")
-            target_profile_params = models.AppBskyActorGetProfile.Params(actor=resolved_target_did)
-            target_profile_details_obj = client.app.bsky.actor.get_profile(params=target_profile_params)
-            resolved_target_handle_for_filenames = target_profile_details_obj.handle
-            print(f"Resolved handle for DID {resolved_target_did}: {resolved_target_handle_for_filenames}")
-        else:
-            resolved_target_handle_for_filenames = target_user_input.lower() # Normalize handle to lowercase
-            print(f"Input is a handle: {resolved_target_handle_for_filenames}. Resolving to DID and fetching profile...")
-            identity_params = models.ComAtprotoIdentityResolveHandle.Params(handle=resolved_target_handle_for_filenames)
-            identity_response = client.com.atproto.identity.resolve_handle(params=identity_params)
-            resolved_target_did = identity_response.did
-            print(f"Resolved DID for {resolved_target_handle_for_filenames}: {resolved_target_did}")
-            target_profile_params = models.AppBskyActorGetProfile.Params(actor=resolved_target_did)
-            target_profile_details_obj = client.app.bsky.actor.get_profile(params=target_profile_params)
+        with metrics.stage('resolve_target'):
+            if target_user_input.startswith("did:"):
+                resolved_target_did = target_user_input
+                print(f"Input is a DID: {resolved_target_did}. Fetching profile...")
+                target_profile_params = models.AppBskyActorGetProfile.Params(actor=resolved_target_did)
+                target_profile_details_obj = client.app.bsky.actor.get_profile(params=target_profile_params)
+                resolved_target_handle_for_filenames = target_profile_details_obj.handle
+                print(f"Resolved handle for DID {resolved_target_did}: {resolved_target_handle_for_filenames}")
+            else:
+                resolved_target_handle_for_filenames = target_user_input.lower() # Normalize handle to lowercase
+                print(f"Input is a handle: {resolved_target_handle_for_filenames}. Resolving to DID and fetching profile...")
+                identity_params = models.ComAtprotoIdentityResolveHandle.Params(handle=resolved_target_handle_for_filenames)
+                identity_response = client.com.atproto.identity.resolve_handle(params=identity_params)
+                resolved_target_did = identity_response.did
+                print(f"Resolved DID for {resolved_target_handle_for_filenames}: {resolved_target_did}")
+                target_profile_params = models.AppBskyActorGetProfile.Params(actor=resolved_target_did)
+                target_profile_details_obj = client.app.bsky.actor.get_profile(params=target_profile_params)
         
-        # Create the main archive folder for this user and timestamp
-        archive_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        safe_profile_handle = resolved_target_handle_for_filenames.replace('.', '_').replace('@', '')
-        main_archive_folder_name = f"{safe_profile_handle}_archive_{archive_timestamp}"
-        main_archive_folder_path = os.path.join(script_dir, main_archive_folder_name)
-
-        if not os.path.exists(main_archive_folder_path):
-            os.makedirs(main_archive_folder_path)
-            print(f"Created main archive directory: {main_archive_folder_path}")
-
-        assets_full_path = os.path.join(main_archive_folder_path, ASSETS_FOLDER_NAME)
-        if not os.path.exists(assets_full_path):
-            try: os.makedirs(assets_full_path); print(f"Created assets sub-directory: {assets_full_path}")
-            except OSError as e: print(f"Error creating assets sub-directory {assets_full_path}: {e}. Media might not be saved.")
-        
-        print(f"Archive will be saved in: {main_archive_folder_path}")
-        print(f"Media assets will be saved to: {assets_full_path}")
-
-
-        if target_profile_details_obj:
-            target_followers_count = target_profile_details_obj.followers_count or 0
-            target_follows_count = target_profile_details_obj.follows_count or 0
-            target_posts_count = target_profile_details_obj.posts_count or 0
-            raw_description = target_profile_details_obj.description or ""
-            target_description = html.escape(raw_description).replace('\n', '<br>\n')
-            if target_profile_details_obj.avatar:
-                print(f"  Target avatar URL: {target_profile_details_obj.avatar}")
-                local_path = download_image(target_profile_details_obj.avatar, assets_full_path)
-                if local_path: target_avatar_local_path = local_path
-            if target_profile_details_obj.banner:
-                print(f"  Target banner URL: {target_profile_details_obj.banner}")
-                local_path = download_image(target_profile_details_obj.banner, assets_full_path)
-                if local_path: target_banner_local_path = local_path
-        
-        if resolved_target_did and resolved_target_handle_for_filenames:
-            raw_posts_data = fetch_all_user_posts_sync(
-                client, archive_target_actor_for_api, 
-                resolved_target_did, resolved_target_handle_for_filenames,
-                assets_full_path
+        if resolved_target_did and resolved_target_handle_for_filenames and target_profile_details_obj:
+            account_status = archive_target_profile(
+                client, target_profile_details_obj, cli_args, xrpc_rate_limiter, cdn_rate_limiter, script_dir,
+                archive_folder_to_reuse, resume_checkpoint, known_item_keys, existing_posts_data, archive_db, media_cache=media_cache
+            )
+            print(xrpc_rate_limiter.summary()); print(cdn_rate_limiter.summary())
+            if media_cache: print(media_cache.summary())
+            metrics.write_report(
+                os.path.join(account_status['archive_folder'], RUN_REPORT_FILENAME), status=account_status['status'],
+                target_did=resolved_target_did, target_handle=resolved_target_handle_for_filenames, options=vars(cli_args),
+                media_download_workers=MEDIA_DOWNLOAD_WORKERS, media_files={'downloaded': account_status['media_downloaded'], 'from_media_cache': account_status['media_from_cache'], 'references_reused': account_status['media_references_reused']},
+                rate_limiters={'xrpc': xrpc_rate_limiter.stats(), 'cdn': cdn_rate_limiter.stats()}
             )
-            if raw_posts_data is not None: 
-                print("\nOrganizing posts for threaded display...")
-                organized_display_feed = organize_feed_for_threading(raw_posts_data, resolved_target_did)
-                print(f"Organization complete. Total items for display: {len(organized_display_feed)}")
-
-                csv_full_filepath = os.path.join(main_archive_folder_path, OUTPUT_FILENAME_CSV)
-                html_full_filepath = os.path.join(main_archive_folder_path, OUTPUT_FILENAME_HTML)
-
-                save_posts_to_csv(organized_display_feed, csv_full_filepath)
-                generate_html_timeline(
-                    organized_display_feed, resolved_target_handle_for_filenames, html_full_filepath,
-                    target_avatar_local_path, target_banner_local_path,
-                    target_followers_count, target_follows_count, target_posts_count, target_description
-                )
+            finish_archive_package(account_status) # After the run report, so that goes into the package too
         else:
             print(f"Could not fully resolve target information for {target_user_input}. Cannot archive.")
     except models.ComAtprotoIdentityResolveHandle.XRPCError as e: 
@@ -452,4 +814,5 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"An unexpected error occurred while processing target {target_user_input}: {e}")
         traceback.print_exc() 
+    if media_cache: media_cache.close()
     print("\nArchiving process finished.")
\ No newline at end of file
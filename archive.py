@@ -0,0 +1,462 @@
+import argparse
+import configparser
+import os
+import sys
+import time
+import traceback
+from datetime import datetime
+
+from archive_db import archive_item_key
+from csv_sink import StreamingCsvWriter
+from feed_prefetch import FeedPagePrefetcher
+from feed_window import AUTHOR_FEED_FILTERS, FeedWindow, feed_item_sort_time, record_matches_feed_filter
+from post_record import PostRecord
+from run_metrics import metrics
+# The atproto SDK and the modules built on it (rate_limiter, session_store, asset_store, repo_export, batch_archive, app)
+# take over a second to import, so they are imported inside the functions that need them: importing this module,
+# --help and option errors stay fast, and a CSV-only run never loads the media/HTML stack.
+
+# --- Configuration ---
+CONFIG_FILE = 'config.ini'
+POSTS_PER_REQUEST_LIMIT = 100
+REQUEST_DELAY_SECONDS = 1 # Fixed pause between feed pages, only used when the client has no rate limiter attached
+XRPC_REQUESTS_PER_SECOND = 10 # Local pacing for API calls; the server's ratelimit-* headers take over when its budget runs low
+ARCHIVE_WORKERS = 1 # Accounts archived at once by archive_targets (they share the login and rate-limit budget)
+# CSV-only output (app-csv.py, --sink csv): one file per account, image columns keep their CDN/getBlob URLs
+CSV_ONLY_FILENAME_TEMPLATE = "bluesky_archive_{user_identifier}.csv"
+CSV_ONLY_FIELDNAMES = [
+    'profile_user_handle', 'profile_user_did', 'item_type', 'uri', 'cid',
+    'created_at', 'text', 'langs', 'author_handle', 'author_did', 'author_display_name',
+    'reply_count', 'repost_count', 'like_count', 'reply_to_post_uri', 'reply_root_post_uri',
+    'embed_type', 'embed_image_urls', 'embed_image_alts', 'embed_external_url',
+    'embed_external_title', 'embed_external_description', 'embed_quote_post_uri'
+]
+
+# --- Helper Functions ---
+
+def load_credentials(config_file=CONFIG_FILE):
+    """Loads the runner's Bluesky handle and app password from config_file; (None, None) after printing why it could not."""
+    config = configparser.ConfigParser()
+    if not os.path.exists(config_file):
+        print(f"Error: Credentials file '{config_file}' not found.")
+        print(f"Please create '{config_file}' with your Bluesky handle and App Password:")
+        print("""
+[BlueskyCredentials]
+handle = your_login_handle.bsky.social
+app_password = xxxx-xxxx-xxxx-xxxx
+        """)
+        return None, None
+    try:
+        config.read(config_file)
+        handle = config.get('BlueskyCredentials', 'handle')
+        app_password = config.get('BlueskyCredentials', 'app_password')
+        if not handle or not app_password or handle == "your_login_handle.bsky.social" or app_password == "xxxx-xxxx-xxxx-xxxx":
+            print(f"Error: Please update your actual credentials in '{config_file}'."); return None, None
+        return handle, app_password
+    except (configparser.NoSectionError, configparser.NoOptionError) as e:
+        print(f"Error reading credentials from '{config_file}': {e}")
+        print("Please ensure the file has the [BlueskyCredentials] section with 'handle' and 'app_password' keys."); return None, None
+    except Exception as e:
+        print(f"Error reading credentials from '{config_file}': {e}"); return None, None
+
+def login_to_bluesky(user_login_handle, app_password, xrpc_rate_limiter=None, session_cache_file=None):
+    """Logs in as the script runner, reusing the session saved in session_cache_file (session_store.SESSION_CACHE_FILENAME
+    by default) while it is valid; returns (client, did, handle), or Nones."""
+    from atproto import Client
+    from rate_limiter import rate_limited_request
+    from session_store import SESSION_CACHE_FILENAME, PersistedSession
+    client = Client(request=rate_limited_request(xrpc_rate_limiter)) if xrpc_rate_limiter else Client()
+    try:
+        runner_profile = PersistedSession(client, user_login_handle, app_password, session_cache_file or SESSION_CACHE_FILENAME).login() # The runner's did/handle, without a getProfile call when the saved session is reused
+        runner_did = runner_profile.did; runner_handle = runner_profile.handle
+        display_name = runner_profile.display_name
+        if not display_name: display_name = runner_handle
+        print(f"Successfully logged in as script runner: {display_name} (@{runner_handle})")
+        print(f"Script runner DID: {runner_did}")
+        return client, runner_did, runner_handle
+    except Exception as e:
+        print(f"Login failed for script runner ({user_login_handle}): {e}"); return None, None, None
+
+def extract_post_details_for_csv(feed_view_post_item, profile_did_of_archived_user, profile_handle_of_archived_user, asset_store=None):
+    """A PostRecord for one author-feed item. With an asset_store the avatar and images are queued on it and the record
+    holds download placeholders (see resolve_post_asset_paths); without one it keeps their CDN URLs."""
+    from atproto import models
+    post = feed_view_post_item.post
+    record = post.record
+    original_post_author = post.author
+    item_type = "post"
+    if isinstance(feed_view_post_item.reason, models.AppBskyFeedDefs.ReasonRepost):
+        if feed_view_post_item.reason.by.did == profile_did_of_archived_user: item_type = "repost"
+    elif hasattr(record, 'reply') and record.reply and record.reply.parent:
+        if original_post_author.did == profile_did_of_archived_user: item_type = "reply"
+    details = PostRecord(
+        profile_user_handle=profile_handle_of_archived_user, profile_user_did=profile_did_of_archived_user, item_type=item_type,
+        uri=post.uri, cid=post.cid, author_did=original_post_author.did,
+        author_handle=original_post_author.handle, author_display_name=original_post_author.display_name or original_post_author.handle,
+        text=record.text if hasattr(record, 'text') else '',
+        created_at=record.created_at if hasattr(record, 'created_at') else '',
+        langs=record.langs if hasattr(record, 'langs') else None,
+        reply_count=post.reply_count, repost_count=post.repost_count, like_count=post.like_count,
+        reply_to_post_uri=record.reply.parent.uri if hasattr(record, 'reply') and record.reply and record.reply.parent else '',
+        reply_root_post_uri=record.reply.root.uri if hasattr(record, 'reply') and record.reply and record.reply.root else ''
+    )
+    if original_post_author.avatar: # A download placeholder until resolve_post_asset_paths runs
+        if asset_store: details.author_local_avatar_path = asset_store.submit(original_post_author.avatar)
+        else: details.author_avatar_url = original_post_author.avatar
+    if isinstance(details.created_at, datetime): details.created_at = details.created_at.isoformat()
+    elif isinstance(record, dict) and 'createdAt' in record: details.created_at = record['createdAt']
+    if post.embed:
+        image_views = None
+        if isinstance(post.embed, models.AppBskyEmbedImages.View):
+            details.embed_type = 'images'; image_views = post.embed.images
+        elif isinstance(post.embed, models.AppBskyEmbedExternal.View):
+            details.embed_type = 'external'; details.embed_external_url = post.embed.external.uri; details.embed_external_title = post.embed.external.title; details.embed_external_description = post.embed.external.description
+        elif isinstance(post.embed, models.AppBskyEmbedRecord.View):
+            if isinstance(post.embed.record, models.AppBskyEmbedRecord.ViewRecord) and hasattr(post.embed.record, 'uri') and post.embed.record.uri:
+                details.embed_type = 'quote_post'; details.embed_quote_post_uri = post.embed.record.uri
+        elif isinstance(post.embed, models.AppBskyEmbedRecordWithMedia.View):
+            details.embed_type = 'record_with_media'
+            if post.embed.media and isinstance(post.embed.media, models.AppBskyEmbedImages.View): image_views = post.embed.media.images
+            if post.embed.record and isinstance(post.embed.record, models.AppBskyEmbedRecord.ViewRecord) and hasattr(post.embed.record, 'uri') and post.embed.record.uri:
+                details.embed_quote_post_uri = post.embed.record.uri
+        if image_views is not None:
+            if asset_store: details.embed_local_image_paths = tuple(asset_store.submit(img_view.fullsize) for img_view in image_views)
+            else: details.embed_image_urls = tuple(img_view.fullsize for img_view in image_views)
+            details.embed_image_alts = tuple(img_view.alt or '' for img_view in image_views)
+    return details
+
+def resolve_post_asset_paths(post_details):
+    """Waits for the post's queued media downloads and swaps the placeholders for their relative paths."""
+    from asset_store import resolve_asset_placeholder
+    post_details.author_local_avatar_path = resolve_asset_placeholder(post_details.author_local_avatar_path) or ''
+    post_details.embed_local_image_paths = tuple(resolve_asset_placeholder(post_details.embed_local_image_paths))
+    return post_details
+
+def post_asset_paths_ready(post_details):
+    from asset_store import asset_placeholder_ready
+    return asset_placeholder_ready(post_details.author_local_avatar_path) and asset_placeholder_ready(post_details.embed_local_image_paths)
+
+def commit_rows_with_assets(page_rows, asset_store, page_sink=None):
+    """Final step for a page of rows: media placeholders become paths, the asset manifest is saved and the rows go to the sink."""
+    if asset_store:
+        for post_details in page_rows: resolve_post_asset_paths(post_details)
+        asset_store.save_manifest()
+    if page_sink: page_sink(page_rows)
+
+def feed_item_key(feed_view_post_item, profile_did_of_archived_user):
+    from atproto import models
+    reason = feed_view_post_item.reason
+    is_repost = isinstance(reason, models.AppBskyFeedDefs.ReasonRepost) and reason.by.did == profile_did_of_archived_user
+    return archive_item_key('repost' if is_repost else 'post', feed_view_post_item.post.uri)
+
+def page_may_end_paging(feed_items, profile_did_of_archived_user, known_item_keys=None, feed_window=None):
+    """True when processing this page can stop pagination (an already archived item, or the start of the time window),
+    so the next page is not requested ahead. The feed is newest-first, so only the last item can be past the window."""
+    if feed_window and feed_window.position(feed_item_sort_time(feed_items[-1])) == 'older': return True
+    return known_item_keys is not None and any(feed_item_key(item, profile_did_of_archived_user) in known_item_keys for item in feed_items if item.post)
+
+def fetch_all_user_posts_sync(sync_client, actor_to_fetch, profile_did_of_archived_user, profile_handle_of_archived_user, asset_store=None, known_item_keys=None, checkpoint=None, page_sink=None, feed_filter=None, feed_window=None):
+    """Pages the author feed newest-first. When known_item_keys is given (incremental mode), paging stops at the first item the archive already has.
+
+    With an asset_store the media of every item is queued on it as the item is extracted (without one the rows keep
+    their media URLs). feed_filter is passed to getAuthorFeed as its filter (see feed_window.AUTHOR_FEED_FILTERS). With
+    a feed_window, items newer than it are skipped without extracting them (so their media is never queued) and paging
+    stops at the first item older than it.
+
+    With a checkpoint, each page is committed to disk (rows, cursor, asset manifest) once its media has landed, and a
+    checkpoint left by an interrupted run is continued from its last committed page instead of starting over.
+    With a page_sink, finished rows are handed to it page by page and not kept in memory (the returned list stays empty).
+    With a rate-limited client the next page is requested (FeedPagePrefetcher) while the current one is extracted.
+    """
+    from atproto import models
+    from rate_limiter import is_rate_limit_error
+    from session_store import is_auth_error
+    all_posts_data = []; cursor = None; total_fetched_count = 0; stop_paging = False; reauthenticated = False; skipped_count = 0
+    rate_limiter = getattr(getattr(sync_client, 'request', None), 'rate_limiter', None) # Set when the client was built with rate_limited_request
+    persisted_session = getattr(sync_client, 'persisted_session', None) # Set by login_to_bluesky
+    def commit_page_rows(page_rows): commit_rows_with_assets(page_rows, asset_store, page_sink)
+    feed_pages = FeedPagePrefetcher(lambda page_cursor: sync_client.app.bsky.feed.get_author_feed(
+        params=models.AppBskyFeedGetAuthorFeed.Params(actor=actor_to_fetch, limit=POSTS_PER_REQUEST_LIMIT, cursor=page_cursor, filter=feed_filter)
+    ))
+    if checkpoint:
+        cursor = checkpoint.state['cursor']; total_fetched_count = checkpoint.state['rows_committed']
+        if page_sink:
+            for committed_row in checkpoint.iter_rows(): page_sink([committed_row]) # Re-emit what earlier attempts committed
+        else: all_posts_data = checkpoint.load_rows()
+        if checkpoint.state['finished'] or (total_fetched_count and not cursor):
+            print(f"Checkpoint already holds the complete feed ({total_fetched_count} items)."); return all_posts_data
+        if total_fetched_count: print(f"Resuming from checkpoint: {total_fetched_count} items in {checkpoint.state['pages_committed']} pages already committed.")
+    print(f"\nFetching posts for target profile: {profile_handle_of_archived_user} (Actor for API: {actor_to_fetch}, Target DID for context: {profile_did_of_archived_user})...")
+    if feed_filter or feed_window: print(f"  Limited to {', '.join(part for part in (f'filter {feed_filter}' if feed_filter else '', feed_window.describe() if feed_window else '') if part)}.")
+    while not stop_paging:
+        try:
+            response_data = feed_pages.get(cursor)
+            feed_items = response_data.feed; current_cursor = response_data.cursor
+            if not feed_items: metrics.end_progress(); print("No more posts found or an empty feed segment."); break
+            # Without a rate limiter pages stay REQUEST_DELAY_SECONDS apart, so there is nothing to request ahead
+            if current_cursor and rate_limiter and not page_may_end_paging(feed_items, profile_did_of_archived_user, known_item_keys, feed_window): feed_pages.prefetch(current_cursor)
+            new_posts_count = 0; page_rows = []; extraction_started = time.perf_counter()
+            for item_feed_view_post in feed_items:
+                if item_feed_view_post.post:
+                    is_pinned = not (item_feed_view_post.reason is None or isinstance(item_feed_view_post.reason, models.AppBskyFeedDefs.ReasonRepost))
+                    window_position = feed_window.position(feed_item_sort_time(item_feed_view_post)) if feed_window else 'inside'
+                    if window_position == 'older' and not is_pinned: # Pinned posts sit at the top of the feed out of order
+                        metrics.end_progress(); print(f"  Reached items older than the time window ({item_feed_view_post.post.uri}). Stopping pagination."); stop_paging = True; break
+                    if window_position != 'inside': skipped_count += 1; continue
+                    if known_item_keys is not None and feed_item_key(item_feed_view_post, profile_did_of_archived_user) in known_item_keys:
+                        # Pinned posts sit at the top of the feed out of order, so only a plain item or a repost ends the scan
+                        if not is_pinned:
+                            metrics.end_progress(); print(f"  Reached an already archived item ({item_feed_view_post.post.uri}). Stopping pagination."); stop_paging = True; break
+                        continue
+                    post_details = extract_post_details_for_csv(item_feed_view_post, profile_did_of_archived_user, profile_handle_of_archived_user, asset_store)
+                    page_rows.append(post_details)
+                    new_posts_count += 1
+            if not page_sink: all_posts_data.extend(page_rows) # Only whole pages, so a retried page is never counted twice
+            total_fetched_count += new_posts_count
+            metrics.add_stage_time('extract', time.perf_counter() - extraction_started); metrics.count('feed_pages'); metrics.count('feed_items', new_posts_count); metrics.progress()
+            if checkpoint:
+                checkpoint.add_page(page_rows, None if stop_paging else current_cursor)
+                checkpoint.commit_ready_pages(post_asset_paths_ready, on_commit=commit_page_rows)
+            elif page_sink: commit_page_rows(page_rows)
+            if stop_paging: break
+            cursor = current_cursor
+            if not cursor: metrics.end_progress(); print("Reached the end of the feed (no more cursor)."); break
+            reauthenticated = False
+            if not rate_limiter: time.sleep(REQUEST_DELAY_SECONDS)
+        except Exception as e:
+            error_message = str(e); feed_pages.discard() # The failed page is requested again, not the one after it
+            metrics.end_progress(); print(f"Error fetching posts: {error_message}")
+            if checkpoint: checkpoint.commit_ready_pages(post_asset_paths_ready, wait=True, on_commit=commit_page_rows)
+            if is_auth_error(e) and persisted_session and not reauthenticated:
+                print("Session expired during fetch. Refreshing it and retrying the page..."); reauthenticated = True
+                if not persisted_session.reauthenticate(): return None
+            elif is_auth_error(e): print("Authentication error (401/AuthRequired) during fetch. Session might be invalid."); return None
+            elif is_rate_limit_error(e) and rate_limiter: print(f"Rate limited by the server. Next request waits {rate_limiter.seconds_until_allowed():.0f}s for the rate-limit reset...")
+            elif "RateLimitExceeded" in error_message or "ratelimit" in error_message.lower(): print("Rate limit likely exceeded. Waiting for 60 seconds..."); time.sleep(60)
+            elif "rsVySackLock" in error_message: print(f"Lexicon revision mismatch error. Your atproto SDK might be outdated: {error_message}"); return None
+            else: print(f"An unexpected error occurred during fetch ({type(e).__name__}): {error_message}. Stopping fetch."); traceback.print_exc(); return None
+    feed_pages.close()
+    if checkpoint:
+        checkpoint.commit_ready_pages(post_asset_paths_ready, wait=True, on_commit=commit_page_rows); checkpoint.mark_finished()
+    if skipped_count: metrics.count('feed_items_out_of_scope', skipped_count)
+    print(f"Finished fetching. Total items retrieved for {profile_handle_of_archived_user}: {total_fetched_count}" + (f" ({skipped_count} outside the time window skipped)" if skipped_count else ""))
+    return all_posts_data
+
+def submit_record_row_assets(post_details, asset_store):
+    """Finishes a record decoded from a raw record (repo_export.repo_record_to_row): its avatar and image URLs are queued on asset_store."""
+    post_details.author_local_avatar_path = asset_store.submit(post_details.author_avatar_url) if post_details.author_avatar_url else ''
+    post_details.embed_local_image_paths = tuple(asset_store.submit(image_url) for image_url in post_details.embed_image_urls)
+    post_details.author_avatar_url = ''; post_details.embed_image_urls = ()
+    return post_details
+
+def fetch_all_user_posts_from_repo(profile_did_of_archived_user, profile_handle_of_archived_user, asset_store=None, known_item_keys=None, checkpoint=None, page_sink=None, xrpc_rate_limiter=None, feed_filter=None, feed_window=None):
+    """Alternative to fetch_all_user_posts_sync: the whole repository is downloaded as one CAR file and its post/repost
+    records are decoded locally (see repo_export). With an asset_store images are queued on it by blob CID through
+    getBlob; without one the rows keep the getBlob URLs. Counts are 0 because a repository holds no engagement.
+
+    Same contract as fetch_all_user_posts_sync: known_item_keys skips items the archive has, the rows are committed to the
+    checkpoint as a single page, page_sink receives them instead of the returned list, and None means the fetch failed.
+    The whole repository is downloaded either way, but feed_filter and feed_window are applied before any media is queued.
+    """
+    from rate_limiter import rate_limited_request
+    from repo_export import download_repo_car, extract_repo_rows, resolve_pds_endpoint
+    if checkpoint and checkpoint.state['finished']:
+        print(f"Checkpoint already holds the complete repository export ({checkpoint.state['rows_committed']} items).")
+        if not page_sink: return checkpoint.load_rows()
+        for committed_row in checkpoint.iter_rows(): page_sink([committed_row])
+        return []
+    print(f"\nExporting the repository of target profile: {profile_handle_of_archived_user} ({profile_did_of_archived_user})...")
+    try:
+        pds_endpoint = resolve_pds_endpoint(profile_did_of_archived_user)
+        print(f"  Downloading repository CAR from {pds_endpoint} ...")
+        car_bytes = download_repo_car(profile_did_of_archived_user, pds_endpoint, rate_limited_request(xrpc_rate_limiter) if xrpc_rate_limiter else None)
+        print(f"  Downloaded {len(car_bytes) / 1e6:.1f} MB. Decoding records locally...")
+        metrics.count('repo_car_bytes', len(car_bytes))
+        with metrics.stage('extract'): repo_rows = extract_repo_rows(car_bytes, profile_did_of_archived_user, profile_handle_of_archived_user, pds_endpoint)
+    except Exception as e:
+        print(f"Error exporting repository ({type(e).__name__}): {e}"); traceback.print_exc(); return None
+    new_rows = []; skipped_count = 0
+    for post_details in repo_rows:
+        if not record_matches_feed_filter(post_details, feed_filter) or (feed_window and feed_window.position(post_details.created_at) != 'inside'): skipped_count += 1; continue
+        if known_item_keys is not None and archive_item_key(post_details.item_type, post_details.uri) in known_item_keys: continue
+        new_rows.append(submit_record_row_assets(post_details, asset_store) if asset_store else post_details)
+    metrics.count('feed_items', len(new_rows))
+    if skipped_count: metrics.count('feed_items_out_of_scope', skipped_count)
+    print(f"Decoded {len(repo_rows)} posts and reposts, {len(new_rows)} of them new to this archive" + (f" ({skipped_count} outside the filter or time window skipped)." if skipped_count else "."))
+    if checkpoint:
+        checkpoint.add_page(new_rows, None)
+        checkpoint.commit_ready_pages(post_asset_paths_ready, wait=True, on_commit=lambda page_rows: commit_rows_with_assets(page_rows, asset_store, page_sink))
+        checkpoint.mark_finished()
+    elif page_sink: commit_rows_with_assets(new_rows, asset_store, page_sink)
+    print(f"Finished exporting. Total items retrieved for {profile_handle_of_archived_user}: {len(new_rows)}")
+    return [] if page_sink else new_rows
+
+def csv_only_filename_for(user_identifier_for_filename):
+    safe_user_id_for_filename = os.path.basename(user_identifier_for_filename).replace('.', '_').replace('@', '').replace(':', '_')
+    return CSV_ONLY_FILENAME_TEMPLATE.format(user_identifier=safe_user_id_for_filename)
+
+# --- Sinks ---
+# A sink turns a resolved account (ProfileViewDetailed) into files: archive(client, target_profile) returns the
+# account's status dict ('did', 'handle', 'status' 'completed' or 'interrupted', 'archived_items', ...) and close()
+# releases what the sink shares between accounts. Any object with those two methods can be passed to archive_targets.
+
+class CsvSink:
+    """CSV only, as app-csv.py writes it: bluesky_archive_<handle>.csv per account in output_dir, no media downloads.
+
+    Rows are streamed to the CSV page by page, so memory stays flat and whatever was fetched before an error is already on disk.
+    """
+
+    def __init__(self, output_dir='.', engine='feed', feed_filter=None, feed_window=None):
+        self.output_dir = output_dir; self.engine = engine; self.feed_filter = feed_filter; self.feed_window = feed_window
+
+    def archive(self, client, target_profile):
+        return self.archive_account(client, target_profile.did, target_profile.handle)
+
+    status_file_key = 'csv_file' # Key of the written file's path in the account's status dict
+
+    def open_writer(self, target_handle):
+        """(filepath, row writer) for one account; the writer takes pages through write_rows() and is closed once fetching ends."""
+        csv_filepath = os.path.join(self.output_dir, csv_only_filename_for(target_handle))
+        return csv_filepath, StreamingCsvWriter(csv_filepath, CSV_ONLY_FIELDNAMES)
+
+    def archive_account(self, client, target_did, target_handle):
+        output_filepath, row_writer = self.open_writer(target_handle)
+        try:
+            if self.engine == 'repo': fetched_rows = fetch_all_user_posts_from_repo(target_did, target_handle, None, page_sink=row_writer.write_rows, feed_filter=self.feed_filter, feed_window=self.feed_window)
+            else: fetched_rows = fetch_all_user_posts_sync(client, target_did, target_did, target_handle, None, page_sink=row_writer.write_rows, feed_filter=self.feed_filter, feed_window=self.feed_window)
+        finally: row_writer.close()
+        if fetched_rows is not None: print(f"Successfully saved {row_writer.rows_written} posts to {output_filepath}")
+        else: print(f"Fetch stopped early; the {row_writer.rows_written} posts fetched before the error are in {output_filepath}")
+        return {'did': target_did, 'handle': target_handle, self.status_file_key: os.path.abspath(output_filepath), 'status': 'completed' if fetched_rows is not None else 'interrupted', 'archived_items': row_writer.rows_written}
+
+    def close(self):
+        pass
+
+
+class ExportSink(CsvSink):
+    """Typed rows for analytics tools, with the CSV sink's columns: bluesky_archive_<handle>.parquet, .ndjson.gz or .ndjson.zst.
+
+    Unlike the CSV, langs/image URLs/alt texts are lists, counts are integers and created_at is a UTC timestamp
+    (see columnar_export). Pages are written in row groups of columnar_export.EXPORT_ROW_GROUP_ROWS as they arrive.
+    Parquet needs pyarrow and ndjson.zst needs zstandard; export_format_error() tells whether they are installed.
+    """
+    status_file_key = 'export_file'
+
+    def __init__(self, output_dir='.', export_format='parquet', engine='feed', feed_filter=None, feed_window=None):
+        from columnar_export import export_format_error
+        format_error = export_format_error(export_format)
+        if format_error: raise RuntimeError(format_error)
+        super().__init__(output_dir, engine, feed_filter, feed_window); self.export_format = export_format
+
+    def open_writer(self, target_handle):
+        from columnar_export import export_filename_for, open_export_writer
+        export_filepath = os.path.join(self.output_dir, export_filename_for(target_handle, self.export_format))
+        return export_filepath, open_export_writer(export_filepath, CSV_ONLY_FIELDNAMES, self.export_format)
+
+
+class HtmlArchiveSink:
+    """CSV + media + HTML, as app.py writes it: a timestamped archive folder (or --package file) per account in output_dir.
+
+    app_args are app.py options (e.g. ['--db', '--html-by-month', '--media-cache', 'cache']); the account-selection ones
+    (--target, --update, --resume, --batch, --follow) do not apply. app.py and its rendering stack are imported here,
+    so only this sink pays for them. Accounts archived through one sink share its media download pool and media cache.
+    """
+
+    def __init__(self, output_dir='.', app_args=()):
+        import app
+        from asset_store import AssetDownloadPool
+        from media_cache import MediaCache
+        from rate_limiter import RateLimiter
+        self.app = app; self.output_dir = output_dir
+        arg_parser = app.build_arg_parser()
+        self.cli_args = arg_parser.parse_args(list(app_args))
+        if self.cli_args.target or self.cli_args.update or self.cli_args.resume or self.cli_args.batch or self.cli_args.follow:
+            arg_parser.error("--target, --update, --resume, --batch and --follow are not sink options")
+        app.check_cli_args(arg_parser, self.cli_args)
+        self.cdn_rate_limiter = RateLimiter('CDN', app.CDN_REQUESTS_PER_SECOND)
+        self.asset_download_pool = AssetDownloadPool(self.cdn_rate_limiter, app.MEDIA_DOWNLOAD_WORKERS, app.MEDIA_MAX_CONCURRENT_PER_HOST)
+        self.media_cache = MediaCache(self.cli_args.media_cache, int(self.cli_args.media_cache_size * 1e9)) if self.cli_args.media_cache else None
+
+    def archive(self, client, target_profile):
+        xrpc_rate_limiter = getattr(getattr(client, 'request', None), 'rate_limiter', None)
+        return self.app.finish_archive_package(self.app.archive_target_profile(
+            client, target_profile, self.cli_args, xrpc_rate_limiter, self.cdn_rate_limiter, self.output_dir,
+            asset_download_pool=self.asset_download_pool, media_cache=self.media_cache
+        ))
+
+    def close(self):
+        self.asset_download_pool.close()
+        print(self.cdn_rate_limiter.summary())
+        if self.media_cache: print(self.media_cache.summary()); self.media_cache.close()
+
+
+ARCHIVE_SINKS = {'csv': CsvSink, 'html': HtmlArchiveSink, 'parquet': ExportSink, 'ndjson.gz': ExportSink, 'ndjson.zst': ExportSink} # Export sinks are named after their format
+
+
+def open_sink(sink_name, output_dir='.', engine='feed', feed_filter=None, feed_window=None, app_args=()):
+    """A sink from ARCHIVE_SINKS by name. engine/feed_filter/feed_window are the CSV and export sinks' scope; the HTML sink takes
+    the same choices (and everything else app.py accepts) as app_args."""
+    if sink_name == 'csv': return CsvSink(output_dir, engine, feed_filter, feed_window)
+    if ARCHIVE_SINKS.get(sink_name) is ExportSink: return ExportSink(output_dir, sink_name, engine, feed_filter, feed_window)
+    if sink_name == 'html':
+        scope_args = ['--engine', engine] + (['--filter', feed_filter] if feed_filter else [])
+        scope_args += (['--since', feed_window.since_text] if feed_window and feed_window.since else []) + (['--until', feed_window.until_text] if feed_window and feed_window.until else [])
+        return HtmlArchiveSink(output_dir, scope_args + list(app_args))
+    raise ValueError(f"Unknown sink {sink_name!r} (choose from {', '.join(ARCHIVE_SINKS)})")
+
+
+def archive_targets(client, targets, sink, max_workers=ARCHIVE_WORKERS):
+    """Archives handles/DIDs into sink (a sink object, e.g. from open_sink) without prompting. Targets are resolved
+    in bulk with getProfiles and archived max_workers at a time over the one client; returns a status dict per
+    target in input order (see batch_archive.run_batch). The sink is left open."""
+    from batch_archive import resolve_targets, run_batch
+    targets = [target.strip().lstrip('@') for target in targets]
+    targets = [target if target.startswith('did:') else target.lower() for target in targets if target]
+    return run_batch(resolve_targets(client, list(dict.fromkeys(targets))), lambda target_profile: sink.archive(client, target_profile), max_workers)
+
+
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(
+        description="Archive Bluesky accounts without prompting (for cron and job schedulers). Options after the ones below are passed to the html sink as app.py options.",
+        epilog="Exit status: 0 when every account completed, 1 when login failed or any account was interrupted, failed or unresolved, 2 for bad options or a missing/incomplete credentials file."
+    )
+    arg_parser.add_argument('--target', nargs='+', required=True, metavar='HANDLE_OR_DID', help="Handle(s) or DID(s) to archive.")
+    arg_parser.add_argument('--sink', choices=list(ARCHIVE_SINKS), default='csv', help="'csv': one CSV per account with media URLs (app-csv.py's output); 'html': archive folders with CSV, downloaded media and HTML (app.py's output); 'parquet', 'ndjson.gz', 'ndjson.zst': the CSV's columns with typed values (lists, integers, UTC timestamps) for analytics. Default csv.")
+    arg_parser.add_argument('--output-dir', default='.', metavar='DIR', help="Where CSV/export files or archive folders are written (default: current directory).")
+    arg_parser.add_argument('--config', default=CONFIG_FILE, metavar='FILE', help=f"Credentials file (default {CONFIG_FILE}).")
+    arg_parser.add_argument('--session-file', metavar='FILE', help="Where the login session is saved between runs (default ~/.config/bluearch/bluesky_session.json, or under $XDG_CONFIG_HOME); owner-only, keep it out of checkouts.")
+    arg_parser.add_argument('--workers', type=int, default=ARCHIVE_WORKERS, metavar='N', help=f"Accounts archived at once (default {ARCHIVE_WORKERS}); they share one login and rate-limit budget.")
+    arg_parser.add_argument('--engine', choices=['feed', 'repo'], default='feed', help="'feed' pages getAuthorFeed; 'repo' downloads the whole repository as one CAR file and decodes it locally.")
+    arg_parser.add_argument('--filter', choices=AUTHOR_FEED_FILTERS, help="Only fetch this kind of item (getAuthorFeed's filter).")
+    arg_parser.add_argument('--since', metavar='DATE', help="Only archive items from this date or ISO 8601 time on.")
+    arg_parser.add_argument('--until', metavar='DATE', help="Only archive items up to this date (the whole day) or ISO 8601 time.")
+    return arg_parser
+
+
+def main(argv=None):
+    """The headless CLI: python archive.py --target HANDLE [HANDLE ...] --sink csv|html|parquet|ndjson.gz|ndjson.zst [app.py options for html]. Returns the exit status."""
+    arg_parser = build_arg_parser()
+    cli_args, app_args = arg_parser.parse_known_args(argv)
+    if app_args and cli_args.sink != 'html': arg_parser.error(f"unrecognized arguments: {' '.join(app_args)}")
+    try: feed_window = FeedWindow(cli_args.since, cli_args.until)
+    except ValueError as e: arg_parser.error(str(e))
+    if ARCHIVE_SINKS[cli_args.sink] is ExportSink:
+        from columnar_export import export_format_error
+        if export_format_error(cli_args.sink): arg_parser.error(export_format_error(cli_args.sink))
+    logged_in_bluesky_handle, logged_in_app_password = load_credentials(cli_args.config)
+    if not logged_in_bluesky_handle or not logged_in_app_password: return 2
+    os.makedirs(cli_args.output_dir, exist_ok=True)
+    sink = open_sink(cli_args.sink, cli_args.output_dir, cli_args.engine, cli_args.filter, feed_window, app_args)
+    from rate_limiter import RateLimiter
+    xrpc_rate_limiter = RateLimiter('XRPC', XRPC_REQUESTS_PER_SECOND)
+    client, runner_did, runner_handle = login_to_bluesky(logged_in_bluesky_handle, logged_in_app_password, xrpc_rate_limiter, cli_args.session_file)
+    if not client: print("Could not log in as script runner. Exiting."); sink.close(); return 1
+    try: statuses = archive_targets(client, cli_args.target, sink, cli_args.workers)
+    finally: sink.close()
+    print(xrpc_rate_limiter.summary())
+    for account_status in statuses: print(f"  {account_status['target']}: {account_status['status']}" + (f", {account_status['archived_items']} items" if 'archived_items' in account_status else ''))
+    return 0 if statuses and all(account_status['status'] == 'completed' for account_status in statuses) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
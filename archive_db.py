@@ -0,0 +1,164 @@
+import os
+import sqlite3
+
+from post_record import PostRecord
+from thread_tree import ThreadIndexEntry, apply_thread_depths, thread_display_order
+
+ARCHIVE_DB_FILENAME = 'archive.sqlite3'
+ROWID_FETCH_BATCH = 500 # Rows read back per query when rendering in an order computed outside SQLite
+ARCHIVE_DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, started_at TEXT DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS authors (did TEXT PRIMARY KEY, handle TEXT, display_name TEXT, local_avatar_path TEXT);
+CREATE TABLE IF NOT EXISTS posts (
+    item_key TEXT PRIMARY KEY, item_type TEXT, uri TEXT, cid TEXT, created_at TEXT, text TEXT, langs TEXT, author_did TEXT,
+    profile_user_did TEXT, profile_user_handle TEXT, reply_count INTEGER, repost_count INTEGER, like_count INTEGER,
+    reply_to_post_uri TEXT, reply_root_post_uri TEXT, run_id INTEGER, run_position INTEGER
+);
+CREATE TABLE IF NOT EXISTS embeds (
+    item_key TEXT PRIMARY KEY, embed_type TEXT, external_url TEXT, external_title TEXT, external_description TEXT,
+    quote_post_uri TEXT, image_alts TEXT
+);
+CREATE TABLE IF NOT EXISTS assets (item_key TEXT, position INTEGER, local_path TEXT, PRIMARY KEY (item_key, position));
+CREATE INDEX IF NOT EXISTS posts_uri ON posts (uri);
+CREATE INDEX IF NOT EXISTS posts_created_at ON posts (created_at);
+CREATE INDEX IF NOT EXISTS posts_author_did ON posts (author_did);
+CREATE INDEX IF NOT EXISTS posts_reply_to_post_uri ON posts (reply_to_post_uri, author_did, created_at);
+CREATE INDEX IF NOT EXISTS posts_feed_order ON posts (run_id DESC, run_position);
+"""
+# Rebuilds the 24-column archive row; image paths are concatenated in their original order
+ARCHIVE_ROW_SELECT = """
+SELECT p.profile_user_handle, p.profile_user_did, p.item_type, p.uri, p.cid, p.created_at, p.text, p.langs,
+    a.handle AS author_handle, p.author_did, a.display_name AS author_display_name, a.local_avatar_path AS author_local_avatar_path,
+    p.reply_count, p.repost_count, p.like_count, p.reply_to_post_uri, p.reply_root_post_uri,
+    COALESCE(e.embed_type, '') AS embed_type,
+    COALESCE((SELECT group_concat(local_path, ',') FROM (SELECT local_path FROM assets WHERE item_key = p.item_key ORDER BY position)), '') AS embed_local_image_paths,
+    COALESCE(e.image_alts, '') AS embed_image_alts, COALESCE(e.external_url, '') AS embed_external_url,
+    COALESCE(e.external_title, '') AS embed_external_title, COALESCE(e.external_description, '') AS embed_external_description,
+    COALESCE(e.quote_post_uri, '') AS embed_quote_post_uri
+FROM posts p LEFT JOIN authors a ON a.did = p.author_did LEFT JOIN embeds e ON e.item_key = p.item_key
+"""
+
+
+def archive_item_key(item_type, uri):
+    """Identity of an archived feed item: a repost and the original post share a URI, so the kind is part of the key."""
+    return f"{'repost' if item_type == 'repost' else 'post'}:{uri}"
+
+
+class ArchiveDatabase:
+    """SQLite store of one target's archive (posts, authors, embeds, assets), kept next to the CSV/HTML.
+
+    Rows are upserted a page at a time inside one transaction, keyed like archive_item_key, so re-runs and
+    resumed runs simply overwrite what they fetch again. Feed order is kept as (run, position in run):
+    every run's items sort ahead of older runs', as merge_new_posts_into_archive does for the CSV.
+    """
+
+    def __init__(self, db_full_filepath):
+        self.db_full_filepath = db_full_filepath
+        self.connection = sqlite3.connect(db_full_filepath, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL'); self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(ARCHIVE_DB_SCHEMA)
+        self.run_id = None; self.run_position = 0
+
+    @staticmethod
+    def exists_in(archive_folder_path):
+        return os.path.exists(os.path.join(archive_folder_path, ARCHIVE_DB_FILENAME))
+
+    def begin_run(self):
+        with self.connection: self.run_id = self.connection.execute('INSERT INTO runs DEFAULT VALUES').lastrowid
+        self.run_position = 0
+        return self.run_id
+
+    def upsert_rows(self, rows, keep_archived_counts=False):
+        """Writes a page of finished PostRecords (asset placeholders already resolved) in one transaction.
+
+        keep_archived_counts is for rows decoded from bare records (--follow events), which hold no engagement: items
+        already archived keep their stored reply/repost/like counts and feed position instead of getting 0 and moving
+        to the top; only what the record carries is overwritten."""
+        if self.run_id is None: self.begin_run()
+        post_values = []; author_values = []; embed_values = []; asset_values = []; item_keys = []
+        for row in rows:
+            item_key = archive_item_key(row.item_type, row.uri); item_keys.append((item_key,))
+            archived = self.connection.execute(
+                'SELECT reply_count, repost_count, like_count, run_id, run_position FROM posts WHERE item_key = ?', (item_key,)
+            ).fetchone() if keep_archived_counts else None
+            counts_and_position = tuple(archived) if archived else (row.reply_count, row.repost_count, row.like_count, self.run_id, self.run_position)
+            post_values.append((
+                item_key, row.item_type, row.uri, row.cid, row.created_at, row.text, ','.join(row.langs), row.author_did,
+                row.profile_user_did, row.profile_user_handle, *counts_and_position[:3],
+                row.reply_to_post_uri, row.reply_root_post_uri, *counts_and_position[3:]
+            ))
+            self.run_position += 1
+            author_values.append((row.author_did, row.author_handle, row.author_display_name, row.author_local_avatar_path or ''))
+            if row.embed_type:
+                embed_values.append((item_key, row.embed_type, row.embed_external_url, row.embed_external_title, row.embed_external_description, row.embed_quote_post_uri, ','.join(row.embed_image_alts)))
+            for position, local_path in enumerate(path for path in row.embed_local_image_paths if path):
+                asset_values.append((item_key, position, local_path))
+        with self.connection:
+            self.connection.executemany('DELETE FROM embeds WHERE item_key = ?', item_keys)
+            self.connection.executemany('DELETE FROM assets WHERE item_key = ?', item_keys)
+            self.connection.executemany('INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', post_values)
+            self.connection.executemany(
+                'INSERT INTO authors VALUES (?, ?, ?, ?) ON CONFLICT (did) DO UPDATE SET handle = excluded.handle, display_name = excluded.display_name, '
+                "local_avatar_path = CASE WHEN excluded.local_avatar_path != '' THEN excluded.local_avatar_path ELSE authors.local_avatar_path END", author_values
+            )
+            self.connection.executemany('INSERT INTO embeds VALUES (?, ?, ?, ?, ?, ?, ?)', embed_values)
+            self.connection.executemany('INSERT INTO assets VALUES (?, ?, ?)', asset_values)
+
+    def delete_items(self, item_keys):
+        """Removes archived items (with their embeds and assets rows) in one transaction; returns how many existed."""
+        item_keys = [(item_key,) for item_key in item_keys]
+        with self.connection:
+            self.connection.executemany('DELETE FROM embeds WHERE item_key = ?', item_keys)
+            self.connection.executemany('DELETE FROM assets WHERE item_key = ?', item_keys)
+            return self.connection.executemany('DELETE FROM posts WHERE item_key = ?', item_keys).rowcount
+
+    def count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+
+    def item_keys(self):
+        return {item_key for (item_key,) in self.connection.execute('SELECT item_key FROM posts')}
+
+    def newest_created_at(self):
+        return self.connection.execute("SELECT MAX(created_at) FROM posts WHERE item_type != 'repost'").fetchone()[0] or ''
+
+    def profile_user_did(self):
+        found = self.connection.execute('SELECT profile_user_did FROM posts LIMIT 1').fetchone()
+        return found[0] if found else None
+
+    def iter_rows(self):
+        """Yields every archived item as a PostRecord in feed order (newest run first), streamed from the database."""
+        for found in self.connection.execute(ARCHIVE_ROW_SELECT + ' ORDER BY p.run_id DESC, p.run_position'): yield PostRecord.from_stored_row(dict(found))
+
+    def iter_threaded_rows(self, profile_did_of_archived_user, whole_conversations=False):
+        """Same display order as app.organize_feed_for_threading, with thread_depth set on every row.
+
+        The reply graph comes from one query in feed order that loads a small ThreadIndexEntry per row into
+        thread_tree (by default only the archived user's replies keep their parent and createdAt, which is all the
+        default threading looks at); the full rows are then read back by rowid in display order, ROWID_FETCH_BATCH
+        at a time, so no per-post reply queries are run and only one batch of PostRecords is in memory at once.
+        """
+        if whole_conversations:
+            index_query = 'SELECT uri, author_did, item_type, reply_to_post_uri, reply_root_post_uri, created_at, rowid FROM posts ORDER BY run_id DESC, run_position'
+            index_params = ()
+        else:
+            index_query = ("SELECT uri, author_did, item_type, CASE WHEN author_did = ? THEN reply_to_post_uri ELSE '' END, '', "
+                           "CASE WHEN author_did = ? AND reply_to_post_uri != '' THEN created_at ELSE '' END, rowid FROM posts ORDER BY run_id DESC, run_position")
+            index_params = (profile_did_of_archived_user, profile_did_of_archived_user)
+        thread_index = [ThreadIndexEntry(*found) for found in self.connection.execute(index_query, index_params)]
+        order, depths = thread_display_order(thread_index, profile_did_of_archived_user, whole_conversations)
+        yield from apply_thread_depths(self.rows_by_rowid(thread_index[index].row_ref for index in order), depths)
+
+    def rows_by_rowid(self, rowids):
+        """Yields the rows with the given posts rowids as PostRecords, in the order given."""
+        rowids = iter(rowids)
+        while True:
+            batch = [rowid for _, rowid in zip(range(ROWID_FETCH_BATCH), rowids)]
+            if not batch: return
+            found_rows = {found['rowid']: found for found in self.connection.execute(
+                ARCHIVE_ROW_SELECT.replace('SELECT ', 'SELECT p.rowid AS rowid, ', 1) + f" WHERE p.rowid IN ({','.join('?' * len(batch))})", batch
+            )}
+            for rowid in batch: yield PostRecord.from_stored_row(dict(found_rows[rowid]))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,201 @@
+import argparse
+import io
+import json
+import os
+import posixpath
+import shutil
+import struct
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+
+try: import zstandard
+except ImportError: zstandard = None # Only needed for tar.zst packages
+
+PACKAGE_FORMATS = ('zip', 'tar.zst')
+# Already-compressed media, kept as-is instead of being deflated/compressed again
+STORED_EXTENSIONS = frozenset(('.jpg', '.jpeg', '.png', '.gif', '.webp', '.mp4'))
+ZSTD_TEXT_LEVEL = 10
+ZSTD_MEDIA_LEVEL = 1 # zstd has no stored mode; at level 1 incompressible images come out as raw blocks, about as cheap
+COPY_CHUNK_BYTES = 1024 * 1024
+# tar.zst index: a zstd skippable frame holding {member: [frame offset, frame length, size]} as JSON, found through a
+# fixed-size skippable trailer frame at the very end of the file (index frame offset + TAR_ZST_INDEX_TAG)
+TAR_ZST_INDEX_MAGIC = 0x184D2A5B
+TAR_ZST_TRAILER_MAGIC = 0x184D2A5C
+TAR_ZST_INDEX_TAG = b'BAIX'
+TAR_ZST_TRAILER = struct.Struct('<IIQ4s')
+
+
+def package_format_error(package_format):
+    """Why package_format cannot be written with the modules installed here, or None if it can."""
+    if package_format == 'tar.zst' and zstandard is None: return "--package tar.zst needs the zstandard package (pip install zstandard)"
+    return None
+
+
+def package_filepath_for(archive_folder_path, package_format):
+    """The package written for an archive folder: <folder>.zip or <folder>.tar.zst next to where the folder would be."""
+    return f"{os.path.normpath(archive_folder_path)}.{package_format}"
+
+
+def is_stored_member(member_name):
+    return os.path.splitext(member_name)[1].lower() in STORED_EXTENSIONS
+
+
+class ZipArchivePackage:
+    """An archive written straight into one zip file under <root>/, the layout of the archive folder.
+
+    Images are stored, everything else deflated. The zip central directory is the random-access index.
+    Members are added from any thread; a member name is only ever written once.
+    """
+
+    def __init__(self, package_filepath, root_name):
+        self.package_filepath = package_filepath; self.root_name = root_name
+        self.zip_file = zipfile.ZipFile(package_filepath, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.member_names = set()
+        self.lock = threading.Lock()
+
+    def _zip_info(self, member_name, size):
+        zip_info = zipfile.ZipInfo(posixpath.join(self.root_name, member_name), time.localtime()[:6])
+        zip_info.compress_type = zipfile.ZIP_STORED if is_stored_member(member_name) else zipfile.ZIP_DEFLATED
+        zip_info.file_size = size; zip_info.external_attr = 0o644 << 16
+        return zip_info
+
+    def has_member(self, member_name):
+        with self.lock: return member_name in self.member_names
+
+    def add_bytes(self, member_name, data):
+        """Writes data as member_name (relative to the archive root); False if that member is already in the package."""
+        with self.lock:
+            if member_name in self.member_names: return False
+            self.zip_file.writestr(self._zip_info(member_name, len(data)), data)
+            self.member_names.add(member_name); return True
+
+    def add_file(self, member_name, local_filepath):
+        with self.lock:
+            if member_name in self.member_names: return False
+            with open(local_filepath, 'rb') as source, self.zip_file.open(self._zip_info(member_name, os.path.getsize(local_filepath)), 'w') as target:
+                shutil.copyfileobj(source, target, COPY_CHUNK_BYTES)
+            self.member_names.add(member_name); return True
+
+    def close(self):
+        with self.lock: self.zip_file.close()
+
+
+class TarZstArchivePackage:
+    """An archive written straight into one .tar.zst file under <root>/, readable with `zstd -d | tar x` (or tar --zstd).
+
+    Every tar header and every member's data (with its tar padding) is its own zstd frame, so a member can be read by
+    decompressing just its frame. Their offsets go into an index kept in zstd skippable frames at the end, which
+    decompressors ignore. Images use ZSTD_MEDIA_LEVEL, text ZSTD_TEXT_LEVEL.
+    """
+
+    def __init__(self, package_filepath, root_name):
+        if zstandard is None: raise RuntimeError(package_format_error('tar.zst'))
+        self.package_filepath = package_filepath; self.root_name = root_name
+        self.package_file = open(package_filepath, 'wb')
+        self.text_compressor = zstandard.ZstdCompressor(level=ZSTD_TEXT_LEVEL)
+        self.media_compressor = zstandard.ZstdCompressor(level=ZSTD_MEDIA_LEVEL)
+        self.member_index = {}
+        self.lock = threading.Lock()
+
+    def has_member(self, member_name):
+        with self.lock: return member_name in self.member_index
+
+    def _write_frame(self, compressor, source, size):
+        frame_offset = self.package_file.tell()
+        padding = -size % tarfile.BLOCKSIZE
+        with compressor.stream_writer(self.package_file, size=size + padding, closefd=False) as frame_writer:
+            while True:
+                chunk = source.read(COPY_CHUNK_BYTES)
+                if not chunk: break
+                frame_writer.write(chunk)
+            frame_writer.write(b'\0' * padding)
+        return frame_offset, self.package_file.tell() - frame_offset
+
+    def _add_stream(self, member_name, source, size):
+        if member_name in self.member_index: return False
+        tar_info = tarfile.TarInfo(posixpath.join(self.root_name, member_name))
+        tar_info.size = size; tar_info.mtime = int(time.time()); tar_info.mode = 0o644
+        tar_header = tar_info.tobuf(format=tarfile.PAX_FORMAT) # Already a whole number of blocks
+        self._write_frame(self.text_compressor, io.BytesIO(tar_header), len(tar_header))
+        frame_offset, frame_length = self._write_frame(self.media_compressor if is_stored_member(member_name) else self.text_compressor, source, size)
+        self.member_index[member_name] = [frame_offset, frame_length, size]
+        return True
+
+    def add_bytes(self, member_name, data):
+        """Writes data as member_name (relative to the archive root); False if that member is already in the package."""
+        with self.lock: return self._add_stream(member_name, io.BytesIO(data), len(data))
+
+    def add_file(self, member_name, local_filepath):
+        with self.lock, open(local_filepath, 'rb') as source: return self._add_stream(member_name, source, os.path.getsize(local_filepath))
+
+    def close(self):
+        with self.lock:
+            if self.package_file.closed: return
+            self.package_file.write(self.text_compressor.compress(b'\0' * tarfile.BLOCKSIZE * 2)) # tar end-of-archive marker
+            index_offset = self.package_file.tell()
+            index_bytes = json.dumps(self.member_index, ensure_ascii=False).encode('utf-8')
+            self.package_file.write(struct.pack('<II', TAR_ZST_INDEX_MAGIC, len(index_bytes)) + index_bytes)
+            self.package_file.write(TAR_ZST_TRAILER.pack(TAR_ZST_TRAILER_MAGIC, TAR_ZST_TRAILER.size - 8, index_offset, TAR_ZST_INDEX_TAG))
+            self.package_file.close()
+
+
+def open_archive_package(package_filepath, root_name, package_format):
+    return (ZipArchivePackage if package_format == 'zip' else TarZstArchivePackage)(package_filepath, root_name)
+
+
+def move_folder_into_package(package, folder_path, skip_names=()):
+    """Adds every file under folder_path to the package (paths relative to it), then removes the folder."""
+    for dir_path, dir_names, filenames in os.walk(folder_path):
+        dir_names.sort()
+        for filename in sorted(filenames):
+            local_filepath = os.path.join(dir_path, filename)
+            member_name = os.path.relpath(local_filepath, folder_path).replace(os.sep, '/')
+            if member_name not in skip_names: package.add_file(member_name, local_filepath)
+    shutil.rmtree(folder_path)
+
+
+def read_tar_zst_index(package_file):
+    package_file.seek(-TAR_ZST_TRAILER.size, os.SEEK_END)
+    trailer_magic, _, index_offset, index_tag = TAR_ZST_TRAILER.unpack(package_file.read(TAR_ZST_TRAILER.size))
+    if trailer_magic != TAR_ZST_TRAILER_MAGIC or index_tag != TAR_ZST_INDEX_TAG: raise ValueError("no member index at the end of this .tar.zst (not written by --package, or incomplete)")
+    package_file.seek(index_offset)
+    index_magic, index_length = struct.unpack('<II', package_file.read(8))
+    if index_magic != TAR_ZST_INDEX_MAGIC: raise ValueError("corrupt .tar.zst member index")
+    return json.loads(package_file.read(index_length))
+
+
+def list_package_members(package_filepath):
+    """Member names relative to the archive root, with their uncompressed sizes, read from the package's index."""
+    if package_filepath.endswith('.zip'):
+        with zipfile.ZipFile(package_filepath) as zip_file:
+            return [(zip_info.filename.split('/', 1)[1], zip_info.file_size) for zip_info in zip_file.infolist() if '/' in zip_info.filename]
+    with open(package_filepath, 'rb') as package_file: return [(member_name, size) for member_name, (_, _, size) in read_tar_zst_index(package_file).items()]
+
+
+def read_package_member(package_filepath, member_name):
+    """The bytes of one member (e.g. 'archive_data.csv' or 'assets/<file>'), decompressing only that member."""
+    if package_filepath.endswith('.zip'):
+        with zipfile.ZipFile(package_filepath) as zip_file:
+            root_name = zip_file.namelist()[0].split('/', 1)[0]
+            return zip_file.read(posixpath.join(root_name, member_name))
+    if zstandard is None: raise RuntimeError("reading tar.zst packages needs the zstandard package (pip install zstandard)")
+    with open(package_filepath, 'rb') as package_file:
+        frame_offset, frame_length, size = read_tar_zst_index(package_file)[member_name]
+        package_file.seek(frame_offset)
+        return zstandard.ZstdDecompressor().decompressobj().decompress(package_file.read(frame_length))[:size]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="List an archive package written with --package, or extract one member to stdout.")
+    arg_parser.add_argument('package', help="The .zip or .tar.zst package.")
+    arg_parser.add_argument('member', nargs='?', help="Member to write to stdout, relative to the archive root (e.g. archive_data.csv).")
+    cli_args = arg_parser.parse_args()
+    try:
+        if cli_args.member: sys.stdout.buffer.write(read_package_member(cli_args.package, cli_args.member))
+        else:
+            for member_name, size in list_package_members(cli_args.package): print(f"{size:>12}  {member_name}")
+    except KeyError: print(f"No member '{cli_args.member}' in {cli_args.package}."); exit(1)
+    except (OSError, ValueError, RuntimeError, zipfile.BadZipFile) as e: print(f"Could not read {cli_args.package}: {e}"); exit(1)
@@ -0,0 +1,341 @@
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from media_cache import place_file
+from rate_limiter import attach_rate_limiter_to_session
+from requests.adapters import HTTPAdapter
+from run_metrics import metrics
+from urllib3.util.retry import Retry
+
+ASSET_MANIFEST_FILENAME = 'asset_manifest.json'
+VALID_IMAGE_EXTENSIONS = ['.jpeg', '.jpg', '.png', '.gif', '.webp']
+# Leading bytes of each supported format, checked when the response carries no usable Content-Type
+IMAGE_MAGIC_BYTES = [(b'\xff\xd8\xff', '.jpg'), (b'\x89PNG\r\n\x1a\n', '.png'), (b'GIF87a', '.gif'), (b'GIF89a', '.gif')]
+# cdn.bsky.app URLs look like .../img/<preset>/plain/<did>/<blob cid>@jpeg
+BLOB_CID_PATTERN = re.compile(r'/(baf[a-z2-7]{20,})(?:@[a-z]+)?$')
+
+
+def blob_cid_from_url(image_url):
+    """Returns the blob CID carried in a CDN/getBlob URL, or None if it has none."""
+    if not image_url: return None
+    parsed_url = urlparse(image_url)
+    match = BLOB_CID_PATTERN.search(parsed_url.path)
+    if match: return match.group(1)
+    query_match = re.search(r'(?:^|&)cid=(baf[a-z2-7]{20,})', parsed_url.query)
+    return query_match.group(1) if query_match else None
+
+
+def create_http_session(pool_size=8, max_retries=3, backoff_factor=0.5):
+    """Returns a keep-alive requests.Session with a connection pool sized for the download workers and retry/backoff on transient failures."""
+    retry_policy = Retry(
+        total=max_retries, backoff_factor=backoff_factor, status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=['GET', 'HEAD'], respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry_policy)
+    http_session = requests.Session()
+    http_session.mount('https://', adapter); http_session.mount('http://', adapter)
+    return http_session
+
+
+def image_extension_for(content_type, first_bytes, image_url):
+    """Picks a file extension from the response Content-Type, then the file's leading bytes, then the URL."""
+    content_type = (content_type or '').lower()
+    if 'jpeg' in content_type or 'jpg' in content_type: return '.jpg'
+    if 'png' in content_type: return '.png'
+    if 'gif' in content_type: return '.gif'
+    if 'webp' in content_type: return '.webp'
+    for magic, file_ext in IMAGE_MAGIC_BYTES:
+        if first_bytes.startswith(magic): return file_ext
+    if first_bytes[:4] == b'RIFF' and first_bytes[8:12] == b'WEBP': return '.webp'
+    original_filename_part = image_url.split('/')[-1].split('@')[0].split('?')[0]
+    file_ext = os.path.splitext(original_filename_part)[1].lower()
+    return file_ext if file_ext in VALID_IMAGE_EXTENSIONS else '.jpg'
+
+
+def asset_placeholder_ready(value):
+    """True once a placeholder (or every placeholder in a list) has finished downloading."""
+    if isinstance(value, Future): return value.done()
+    if isinstance(value, (list, tuple)): return all(asset_placeholder_ready(v) for v in value)
+    return True
+
+
+def resolve_asset_placeholder(value):
+    """Turns a placeholder handed out by AssetStore.submit (or a list of them) into the final relative path(s)."""
+    if isinstance(value, Future): return value.result() or ''
+    if isinstance(value, (list, tuple)): return [path for path in (resolve_asset_placeholder(v) for v in value) if path]
+    return value
+
+
+class AssetDownloadPool:
+    """Download workers, keep-alive connections, per-host slots and CDN rate limiter behind one or more AssetStores.
+
+    A batch run shares one pool between the archives of all its accounts, so the politeness limits hold for the
+    whole batch. The pool also remembers every file its stores have written or are downloading (by asset key), and an
+    image that one archive already holds is hard-linked (or copied) into the next instead of being downloaded again.
+    """
+
+    def __init__(self, rate_limiter=None, max_workers=8, max_concurrent_per_host=4, http_session=None):
+        self.http_session = http_session or create_http_session(pool_size=max_workers)
+        self.rate_limiter = rate_limiter # Paces CDN requests across all workers (see rate_limiter.RateLimiter)
+        if rate_limiter: attach_rate_limiter_to_session(self.http_session, rate_limiter)
+        self.max_concurrent_per_host = max_concurrent_per_host
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asset-download')
+        self.host_slots = {}
+        self.filepaths_by_key = {}
+        self.pending_by_key = {}
+        self.lock = threading.Lock()
+
+    def host_slot(self, image_url):
+        host = urlparse(image_url).netloc
+        with self.lock:
+            if host not in self.host_slots: self.host_slots[host] = threading.Semaphore(self.max_concurrent_per_host)
+            return self.host_slots[host]
+
+    def add_pending(self, keys, pending):
+        with self.lock:
+            for key in keys:
+                if key: self.pending_by_key.setdefault(key, pending)
+
+    def pending_download(self, keys):
+        with self.lock: return next((self.pending_by_key[key] for key in keys if key in self.pending_by_key), None)
+
+    def record_file(self, keys, local_filepath_full):
+        """Remembers a finished download (local_filepath_full is None when it failed) and drops it from the pending ones."""
+        with self.lock:
+            for key in keys:
+                if not key: continue
+                self.pending_by_key.pop(key, None)
+                if local_filepath_full: self.filepaths_by_key[key] = local_filepath_full
+
+    def known_filepath(self, keys):
+        with self.lock: known_filepaths = [self.filepaths_by_key.get(key) for key in keys if key]
+        return next((filepath for filepath in known_filepaths if filepath and os.path.exists(filepath)), None)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.http_session.close()
+
+
+class AssetStore:
+    """Downloads each distinct image once per archive and hands out the same relative path for every reference.
+
+    Assets are keyed by source URL and, when the URL carries one, by blob CID. Files are named after
+    their CID, or after a SHA-256 of their bytes when no CID is known, so identical images share one file.
+    Downloads run on a bounded worker pool; submit() returns a Future placeholder right away so feed
+    pagination never waits on media, and at most max_concurrent_per_host requests hit any one host.
+    The pool is private unless an AssetDownloadPool shared with other archives is passed in.
+    With an archive package (archive_package.py) images go straight from memory into it as 'assets/<file>'
+    and nothing is written to assets_dir_full_path; files are then not shared with other archives of a batch.
+    With a MediaCache (media_cache.py) a download worker first looks the image up there, and every download is added to it.
+    """
+
+    def __init__(self, assets_dir_full_path, rate_limiter=None, max_workers=8, max_concurrent_per_host=4, http_session=None, download_pool=None, package=None, media_cache=None):
+        self.assets_dir_full_path = assets_dir_full_path
+        self.package = package
+        self.media_cache = media_cache
+        self.owns_download_pool = download_pool is None
+        self.download_pool = download_pool or AssetDownloadPool(rate_limiter, max_workers, max_concurrent_per_host, http_session)
+        self.http_session = self.download_pool.http_session
+        self.rate_limiter = self.download_pool.rate_limiter
+        self.relative_prefix = os.path.basename(os.path.normpath(assets_dir_full_path))
+        self.manifest_path = os.path.join(assets_dir_full_path, ASSET_MANIFEST_FILENAME)
+        self.local_filenames_by_key = {}
+        self.pending_by_key = {}
+        self.lock = threading.Lock()
+        self.downloads_count = 0; self.reused_count = 0; self.cached_count = 0
+        self.closed = False
+        for leftover_filename in os.listdir(assets_dir_full_path) if os.path.isdir(assets_dir_full_path) else []:
+            if leftover_filename.startswith('.partial_'): os.remove(os.path.join(assets_dir_full_path, leftover_filename)) # Interrupted download from an earlier run
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f: self.local_filenames_by_key = json.load(f)
+            except (IOError, ValueError) as e: print(f"    Warning: could not read asset manifest {self.manifest_path}: {e}")
+
+    def _relative_path(self, local_filename_only):
+        return os.path.join(self.relative_prefix, local_filename_only)
+
+    def _package_member(self, local_filename_only):
+        return f"{self.relative_prefix}/{local_filename_only}"
+
+    def _known_filename(self, key):
+        local_filename_only = self.local_filenames_by_key.get(key)
+        if not local_filename_only: return None
+        if self.package: return local_filename_only if self.package.has_member(self._package_member(local_filename_only)) else None
+        if os.path.exists(os.path.join(self.assets_dir_full_path, local_filename_only)): return local_filename_only
+        return None
+
+    def _link_from_download_pool(self, url_key, cid_key):
+        """Copies in a file another archive of the batch already downloaded; returns its filename here, or None."""
+        shared_filepath = None if self.owns_download_pool or self.package else self.download_pool.known_filepath((url_key, cid_key))
+        if not shared_filepath: return None
+        local_filename_only = os.path.basename(shared_filepath)
+        local_filepath_full = os.path.join(self.assets_dir_full_path, local_filename_only)
+        try:
+            if not os.path.exists(local_filepath_full): place_file(shared_filepath, local_filepath_full)
+        except OSError: return None
+        return local_filename_only
+
+    def submit(self, image_url):
+        """Queues image_url for download and returns a Future resolving to 'assets/<file>' (or None on failure)."""
+        if not image_url:
+            done = Future(); done.set_result(None); return done
+        metrics.count('media_requested')
+        url_key = f"url:{image_url}"
+        blob_cid = blob_cid_from_url(image_url)
+        cid_key = f"cid:{blob_cid}" if blob_cid else None
+        with self.lock:
+            local_filename_only = self._known_filename(url_key) or (cid_key and self._known_filename(cid_key))
+            if local_filename_only:
+                self.reused_count += 1; metrics.count('media_cache_hits')
+                self.local_filenames_by_key[url_key] = local_filename_only
+                done = Future(); done.set_result(self._relative_path(local_filename_only)); return done
+            pending = self.pending_by_key.get(url_key) or (cid_key and self.pending_by_key.get(cid_key))
+            if pending:
+                self.reused_count += 1; metrics.count('media_cache_hits')
+                return pending
+            local_filename_only = self._link_from_download_pool(url_key, cid_key)
+            if local_filename_only:
+                self.reused_count += 1; metrics.count('media_cache_hits')
+                self.local_filenames_by_key[url_key] = local_filename_only
+                if cid_key: self.local_filenames_by_key[cid_key] = local_filename_only
+                done = Future(); done.set_result(self._relative_path(local_filename_only)); return done
+            shared_pending = None if self.owns_download_pool or self.package else self.download_pool.pending_download((url_key, cid_key))
+            if shared_pending: # Another archive of the batch is downloading it right now; link its file once it lands
+                self.reused_count += 1; metrics.count('media_cache_hits')
+                pending = Future()
+            else:
+                pending = self.download_pool.executor.submit(self._download_and_record, image_url, blob_cid, url_key, cid_key)
+                if not self.package: self.download_pool.add_pending((url_key, cid_key), pending)
+            self.pending_by_key[url_key] = pending
+            if cid_key: self.pending_by_key[cid_key] = pending
+        # Outside the lock: a download that already finished runs the callback right here, and it takes the lock itself
+        if shared_pending: shared_pending.add_done_callback(lambda _: self._finish_shared_download(pending, image_url, blob_cid, url_key, cid_key))
+        return pending
+
+    def get_local_path(self, image_url):
+        """Returns 'assets/<file>' for image_url, blocking until it is downloaded if this archive does not already have it."""
+        return self.submit(image_url).result()
+
+    def _record_local_file(self, local_filename_only, url_key, cid_key):
+        with self.lock:
+            self.pending_by_key.pop(url_key, None)
+            if cid_key: self.pending_by_key.pop(cid_key, None)
+            if not local_filename_only: return None
+            self.local_filenames_by_key[url_key] = local_filename_only
+            if cid_key: self.local_filenames_by_key[cid_key] = local_filename_only
+        return self._relative_path(local_filename_only)
+
+    def _download_and_record(self, image_url, blob_cid, url_key, cid_key):
+        cached_media = self.media_cache.lookup(url_key, cid_key) if self.media_cache else None
+        local_filename_only = self._place_cached_media(cached_media) if cached_media and not cached_media.needs_revalidation else None
+        if not local_filename_only:
+            with self.download_pool.host_slot(image_url):
+                local_filename_only = self._download(image_url, blob_cid, url_key, cid_key, cached_media)
+        if not self.package: self.download_pool.record_file((url_key, cid_key), local_filename_only and os.path.join(self.assets_dir_full_path, local_filename_only))
+        return self._record_local_file(local_filename_only, url_key, cid_key)
+
+    def _finish_shared_download(self, pending, image_url, blob_cid, url_key, cid_key):
+        local_filename_only = self._link_from_download_pool(url_key, cid_key)
+        if local_filename_only: pending.set_result(self._record_local_file(local_filename_only, url_key, cid_key)); return
+        # The other archive's download failed (or its file is gone): download it for this archive on a pool worker
+        # rather than here, since this callback may be running on the thread that finished the other download
+        with self.lock: self.reused_count -= 1
+        metrics.count('media_cache_hits', -1)
+        fallback = self.download_pool.executor.submit(self._download_and_record, image_url, blob_cid, url_key, cid_key)
+        self.download_pool.add_pending((url_key, cid_key), fallback)
+        fallback.add_done_callback(lambda _: pending.set_exception(fallback.exception()) if fallback.exception() else pending.set_result(fallback.result()))
+
+    def _place_cached_media(self, cached_media):
+        """Puts a file from the media cache into this archive; returns its filename, or None if it could not be placed."""
+        try:
+            if self.package: self.package.add_file(self._package_member(cached_media.filename), cached_media.filepath)
+            else:
+                local_filepath_full = os.path.join(self.assets_dir_full_path, cached_media.filename)
+                if not os.path.exists(local_filepath_full): place_file(cached_media.filepath, local_filepath_full)
+        except FileExistsError: pass # Another worker placed the same file just now
+        except OSError as e: print(f"    Warning: could not use {cached_media.filename} from the media cache: {e}"); return None # Evicted meanwhile, say
+        with self.lock: self.cached_count += 1
+        metrics.count('media_shared_cache_hits'); metrics.progress()
+        return cached_media.filename
+
+    def _download(self, image_url, blob_cid, url_key=None, cid_key=None, cached_media=None):
+        temp_filepath = None if self.package else os.path.join(self.assets_dir_full_path, f".partial_{uuid.uuid4().hex[:8]}")
+        conditional_headers = {}
+        if cached_media: # A cached copy due for revalidation: the image is only sent again if it changed
+            if cached_media.etag: conditional_headers['If-None-Match'] = cached_media.etag
+            if cached_media.last_modified: conditional_headers['If-Modified-Since'] = cached_media.last_modified
+        try:
+            if self.rate_limiter: self.rate_limiter.acquire()
+            download_started = time.perf_counter(); bytes_downloaded = 0
+            with self.http_session.get(image_url, stream=True, timeout=20, headers=conditional_headers or None) as img_response:
+                retries_history = getattr(getattr(img_response.raw, 'retries', None), 'history', ())
+                if retries_history: metrics.count('media_retries', len(retries_history))
+                if img_response.status_code == 304 and cached_media:
+                    self.media_cache.mark_revalidated(url_key); metrics.count('media_revalidated')
+                    return self._place_cached_media(cached_media)
+                img_response.raise_for_status()
+                response_validators = (img_response.headers.get('etag'), img_response.headers.get('last-modified'))
+                content_hash = hashlib.sha256(); first_bytes = b''
+                with open(temp_filepath, 'wb') if temp_filepath else contextlib.nullcontext(io.BytesIO()) as f:
+                    for chunk in img_response.iter_content(chunk_size=8192):
+                        if not first_bytes: first_bytes = chunk[:16]
+                        f.write(chunk); content_hash.update(chunk); bytes_downloaded += len(chunk)
+                    image_bytes = None if temp_filepath else f.getvalue()
+                file_ext = image_extension_for(img_response.headers.get('content-type'), first_bytes, image_url)
+            metrics.observe('media_download_seconds', time.perf_counter() - download_started); metrics.count('media_bytes', bytes_downloaded)
+            local_filename_only = f"{blob_cid}{file_ext}" if blob_cid else f"sha256-{content_hash.hexdigest()[:32]}{file_ext}"
+            if self.package: # Two URLs can turn out to be the same image; the package keeps the first copy
+                added_to_package = self.package.add_bytes(self._package_member(local_filename_only), image_bytes)
+                with self.lock:
+                    if added_to_package: self.downloads_count += 1
+                    else: self.reused_count += 1
+            else:
+                local_filepath_full = os.path.join(self.assets_dir_full_path, local_filename_only)
+                with self.lock:
+                    if os.path.exists(local_filepath_full): os.remove(temp_filepath); self.reused_count += 1
+                    else: os.replace(temp_filepath, local_filepath_full); self.downloads_count += 1
+            if self.media_cache:
+                self.media_cache.store((url_key, cid_key), local_filename_only, None if self.package else local_filepath_full, image_bytes, *response_validators)
+            metrics.count('media_downloads'); metrics.progress()
+            return local_filename_only
+        except requests.exceptions.RequestException as e:
+            print(f"    Error downloading {image_url}: {e}")
+        except IOError as e:
+            print(f"    Error saving image from {image_url}: {e}")
+        except Exception as e:
+            print(f"    Unexpected error downloading/saving {image_url}: {e}")
+        metrics.count('media_errors')
+        if temp_filepath and os.path.exists(temp_filepath): os.remove(temp_filepath)
+        return None
+
+    def save_manifest(self):
+        """Writes the asset manifest. A package member cannot be rewritten, and a package run cannot be resumed, so
+        there the manifest is only written once, by the first save after close()."""
+        if self.package and not self.closed: return
+        with self.lock: manifest_snapshot = dict(self.local_filenames_by_key)
+        if self.package:
+            if not self.package.add_bytes(self._package_member(ASSET_MANIFEST_FILENAME), json.dumps(manifest_snapshot).encode('utf-8')):
+                print(f"Warning: {ASSET_MANIFEST_FILENAME} is already in the package; the asset manifest was not updated.")
+            return
+        try:
+            with open(self.manifest_path, 'w', encoding='utf-8') as f: json.dump(manifest_snapshot, f)
+        except IOError as e: print(f"Error writing asset manifest {self.manifest_path}: {e}")
+
+    def close(self):
+        """Waits for this archive's queued downloads to finish; a private worker pool is stopped as well."""
+        self.closed = True
+        if self.owns_download_pool: self.download_pool.close(); return
+        while True:
+            with self.lock: pending_downloads = set(self.pending_by_key.values())
+            if not pending_downloads: return
+            wait(pending_downloads)
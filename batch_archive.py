@@ -0,0 +1,74 @@
+import json
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+GET_PROFILES_MAX_ACTORS = 25 # app.bsky.actor.getProfiles accepts at most 25 handles/DIDs per call
+BATCH_STATUS_FILENAME_TEMPLATE = 'batch_status_{timestamp}.json'
+
+
+def read_target_list(target_list_filepath):
+    """Handles/DIDs from a text file, one per line; blank lines and '#' comments are skipped, duplicates dropped."""
+    targets = []; seen_targets = set()
+    with open(target_list_filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            target = line.split('#', 1)[0].strip().lstrip('@')
+            if not target: continue
+            if not target.startswith('did:'): target = target.lower()
+            if target not in seen_targets: seen_targets.add(target); targets.append(target)
+    return targets
+
+
+def resolve_targets(client, targets):
+    """Resolves handles/DIDs to full profiles with getProfiles, 25 per call. Returns {target: ProfileViewDetailed or None}."""
+    from atproto import models
+    profiles_by_target = {}
+    for batch_start in range(0, len(targets), GET_PROFILES_MAX_ACTORS):
+        batch_targets = targets[batch_start:batch_start + GET_PROFILES_MAX_ACTORS]
+        try: response_data = client.app.bsky.actor.get_profiles(params=models.AppBskyActorGetProfiles.Params(actors=batch_targets))
+        except Exception as e:
+            print(f"    Error resolving {len(batch_targets)} accounts: {e}")
+            for target in batch_targets: profiles_by_target[target] = None
+            continue
+        profiles_by_key = {}
+        for profile in response_data.profiles: profiles_by_key[profile.did] = profile; profiles_by_key[profile.handle.lower()] = profile
+        for target in batch_targets: profiles_by_target[target] = profiles_by_key.get(target) # Unknown, deleted or suspended accounts are left out by the server
+    print(f"Resolved {sum(1 for profile in profiles_by_target.values() if profile)} of {len(targets)} accounts in {-(-len(targets) // GET_PROFILES_MAX_ACTORS)} getProfiles calls.")
+    return profiles_by_target
+
+
+def run_batch(profiles_by_target, archive_one, max_workers=4):
+    """Runs archive_one(profile) for every resolved account on a pool of max_workers threads.
+
+    archive_one returns a status dict for its account; an exception only fails that account. Returns one status dict
+    per target in input order, each with 'target', 'status' ('completed', 'interrupted', 'failed' or 'unresolved') and 'seconds'.
+    """
+    statuses = {target: {'target': target, 'status': 'unresolved', 'seconds': 0.0} for target, profile in profiles_by_target.items() if not profile}
+    def archive_with_status(target, profile):
+        started_at = time.perf_counter()
+        try: account_status = dict(archive_one(profile) or {}, target=target)
+        except Exception as e:
+            traceback.print_exc(); account_status = {'target': target, 'did': profile.did, 'handle': profile.handle, 'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+        account_status['seconds'] = round(time.perf_counter() - started_at, 3)
+        return account_status
+    resolved_targets = [(target, profile) for target, profile in profiles_by_target.items() if profile]
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='archive-account') as executor:
+        pending_accounts = [executor.submit(archive_with_status, target, profile) for target, profile in resolved_targets]
+        for finished_count, done in enumerate(as_completed(pending_accounts), 1):
+            account_status = done.result(); statuses[account_status['target']] = account_status
+            print(f"[{finished_count}/{len(resolved_targets)}] {account_status['target']}: {account_status['status']} ({account_status['seconds']:.1f}s)"
+                  + (f" - {account_status['error']}" if account_status.get('error') else ''))
+    return [statuses[target] for target in profiles_by_target]
+
+
+def summarize_batch(statuses):
+    counts = {}
+    for account_status in statuses: counts[account_status['status']] = counts.get(account_status['status'], 0) + 1
+    return ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+
+
+def write_batch_status(batch_status_filepath, statuses, **batch_details):
+    try:
+        with open(batch_status_filepath, 'w', encoding='utf-8') as f: json.dump(dict(batch_details, accounts=statuses), f, indent=2, default=str)
+        print(f"Batch status saved to {batch_status_filepath}")
+    except IOError as e: print(f"Error writing batch status {batch_status_filepath}: {e}")
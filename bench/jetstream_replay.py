@@ -0,0 +1,98 @@
+"""Local stand-in for a Jetstream instance, for trying --follow without the network, plus a recorder for real events.
+
+    python bench/jetstream_replay.py record events.jsonl --did did:plc:xxxx --count 50
+    python bench/jetstream_replay.py serve events.jsonl --port 6008
+    python app.py --follow some_archive_folder --jetstream-url ws://127.0.0.1:6008/subscribe
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+from websockets.sync.server import serve
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # The archiver's modules live one level up
+
+from follow_stream import JETSTREAM_URL, jetstream_subscribe_url
+
+
+class JetstreamReplayServer:
+    """Serves recorded Jetstream events (one JSON object per line) to every subscriber, the way Jetstream would.
+
+    The wantedDids / wantedCollections / cursor query parameters are honoured. Events are sent interval_seconds apart;
+    after the last one the connection stays open and idle like a live stream with nothing new, unless close_after_replay.
+    """
+
+    def __init__(self, events, interval_seconds=0.0, close_after_replay=False, host='127.0.0.1', port=0):
+        self.events = sorted(events, key=lambda event: event.get('time_us', 0))
+        self.interval_seconds = interval_seconds; self.close_after_replay = close_after_replay
+        self.connections_count = 0; self.events_sent = 0; self.lock = threading.Lock()
+        self.websocket_server = serve(self._serve_connection, host, port)
+        self.url = f"ws://{host}:{self.websocket_server.socket.getsockname()[1]}/subscribe"
+        self.thread = None
+
+    def _serve_connection(self, connection):
+        query = parse_qs(urlparse(connection.request.path).query)
+        wanted_dids = set(query.get('wantedDids', [])); wanted_collections = set(query.get('wantedCollections', []))
+        cursor = int(query.get('cursor', ['0'])[0])
+        with self.lock: self.connections_count += 1
+        try:
+            for event in self.events:
+                if event.get('time_us', 0) <= cursor: continue
+                if wanted_dids and event.get('did') not in wanted_dids: continue
+                if wanted_collections and event.get('kind') == 'commit' and (event.get('commit') or {}).get('collection') not in wanted_collections: continue
+                connection.send(json.dumps(event))
+                with self.lock: self.events_sent += 1
+                if self.interval_seconds: time.sleep(self.interval_seconds)
+            if not self.close_after_replay:
+                for _ in connection: pass # Idle until the subscriber goes away
+        except ConnectionClosed: pass
+
+    def start(self):
+        self.thread = threading.Thread(target=self.websocket_server.serve_forever, name='jetstream-replay-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.websocket_server.shutdown()
+
+
+def record_events(output_filepath, dids, count, jetstream_url=JETSTREAM_URL):
+    """Appends the next count post/repost events of dids from a real Jetstream instance to output_filepath."""
+    with connect(jetstream_subscribe_url(jetstream_url, dids), max_size=4 * 1024 * 1024) as connection, open(output_filepath, 'a', encoding='utf-8') as f:
+        for recorded_count in range(1, count + 1):
+            f.write(connection.recv().strip() + '\n'); f.flush()
+            print(f"\r{recorded_count}/{count} events recorded", end='', flush=True)
+    print()
+
+
+def read_events(events_filepath):
+    with open(events_filepath, 'r', encoding='utf-8') as f: return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="Replay recorded Jetstream events over a local WebSocket, or record some from a real instance.")
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="Replay an events file to every subscriber.")
+    serve_parser.add_argument('events_file')
+    serve_parser.add_argument('--port', type=int, default=6008)
+    serve_parser.add_argument('--interval-ms', type=float, default=0.0, help="Pause between events (default 0).")
+    record_parser = subparsers.add_parser('record', help="Append live events of some accounts to an events file.")
+    record_parser.add_argument('events_file')
+    record_parser.add_argument('--did', action='append', required=True, help="Account to record (repeatable).")
+    record_parser.add_argument('--count', type=int, default=20)
+    record_parser.add_argument('--jetstream-url', default=JETSTREAM_URL)
+    cli_args = arg_parser.parse_args()
+
+    if cli_args.command == 'record':
+        record_events(cli_args.events_file, cli_args.did, cli_args.count, cli_args.jetstream_url)
+    else:
+        replay_server = JetstreamReplayServer(read_events(cli_args.events_file), cli_args.interval_ms / 1000, port=cli_args.port)
+        print(f"Replaying {len(replay_server.events)} events on {replay_server.url} (Ctrl-C to stop)")
+        try: replay_server.websocket_server.serve_forever()
+        except KeyboardInterrupt: replay_server.stop()
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockServerStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.xrpc_requests = 0; self.cdn_requests = 0; self.rate_limited_responses = 0; self.cdn_bytes_sent = 0
+
+    def as_dict(self):
+        with self.lock:
+            return {'xrpc_requests': self.xrpc_requests, 'cdn_requests': self.cdn_requests, 'rate_limited_responses': self.rate_limited_responses, 'cdn_bytes_sent': self.cdn_bytes_sent}
+
+
+class MockBlueskyServer:
+    """Local stand-in for the XRPC endpoints the archiver calls and for the image CDN, on one port.
+
+    Serves getAuthorFeed pages and getProfile from a SyntheticFeed, and deterministic JPEG-looking bytes of
+    image_bytes for any /img/ path. latency_seconds is added to every response; every rate_limit_every-th XRPC
+    request is answered with a 429 carrying ratelimit-* headers that reset after rate_limit_reset_seconds.
+    """
+
+    def __init__(self, synthetic_feed, latency_seconds=0.0, cdn_latency_seconds=None, rate_limit_every=0, rate_limit_reset_seconds=1.0, image_bytes=50_000, host='127.0.0.1', port=0):
+        self.synthetic_feed = synthetic_feed
+        self.latency_seconds = latency_seconds
+        self.cdn_latency_seconds = latency_seconds if cdn_latency_seconds is None else cdn_latency_seconds
+        self.rate_limit_every = rate_limit_every
+        self.rate_limit_reset_seconds = rate_limit_reset_seconds
+        self.image_bytes = image_bytes
+        self.stats = MockServerStats()
+        mock_server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # Keep-alive, as the real services
+
+            def log_message(self, *args): pass
+
+            def _send(self, status_code, body, content_type, extra_headers=None):
+                self.send_response(status_code)
+                self.send_header('Content-Type', content_type); self.send_header('Content-Length', str(len(body)))
+                for header_name, header_value in (extra_headers or {}).items(): self.send_header(header_name, header_value)
+                self.end_headers(); self.wfile.write(body)
+
+            def do_GET(self):
+                parsed_url = urlparse(self.path)
+                if parsed_url.path.startswith('/img/'): return mock_server._serve_image(self, parsed_url)
+                if parsed_url.path.startswith('/xrpc/'): return mock_server._serve_xrpc(self, parsed_url)
+                self._send(404, b'{}', 'application/json; charset=utf-8')
+
+        self.http_server = ThreadingHTTPServer((host, port), RequestHandler)
+        self.http_server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.http_server.server_address[1]}"
+        self.thread = None
+
+    def _serve_image(self, handler, parsed_url):
+        if self.cdn_latency_seconds: time.sleep(self.cdn_latency_seconds)
+        seed = hashlib.sha256(parsed_url.path.encode()).digest()
+        body = (b'\xff\xd8\xff\xe0' + seed * (self.image_bytes // len(seed) + 1))[:max(self.image_bytes, 4)]
+        with self.stats.lock: self.stats.cdn_requests += 1; self.stats.cdn_bytes_sent += len(body)
+        handler._send(200, body, 'image/jpeg')
+
+    def _serve_xrpc(self, handler, parsed_url):
+        if self.latency_seconds: time.sleep(self.latency_seconds)
+        with self.stats.lock:
+            self.stats.xrpc_requests += 1
+            request_number = self.stats.xrpc_requests
+            rate_limited = self.rate_limit_every and request_number % self.rate_limit_every == 0
+            if rate_limited: self.stats.rate_limited_responses += 1
+        reset_at = str(int(time.time() + self.rate_limit_reset_seconds))
+        if rate_limited:
+            body = json.dumps({'error': 'RateLimitExceeded', 'message': 'Rate Limit Exceeded'}).encode()
+            return handler._send(429, body, 'application/json; charset=utf-8', {'ratelimit-limit': '3000', 'ratelimit-remaining': '0', 'ratelimit-reset': reset_at})
+        query = {name: values[0] for name, values in parse_qs(parsed_url.query).items()}
+        method = parsed_url.path[len('/xrpc/'):]
+        if method == 'app.bsky.feed.getAuthorFeed': response_body = self.synthetic_feed.page(query.get('cursor'), int(query.get('limit', 50)))
+        elif method == 'app.bsky.actor.getProfile': response_body = self.synthetic_feed.profile()
+        else: return handler._send(501, json.dumps({'error': 'MethodNotImplemented', 'message': method}).encode(), 'application/json; charset=utf-8')
+        handler._send(200, json.dumps(response_body).encode(), 'application/json; charset=utf-8', {'ratelimit-limit': '3000', 'ratelimit-remaining': '2999', 'ratelimit-reset': reset_at})
+
+    def start(self):
+        self.thread = threading.Thread(target=self.http_server.serve_forever, name='mock-bluesky-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.http_server.shutdown(); self.http_server.server_close()
@@ -0,0 +1,162 @@
+"""Benchmarks the archiver end to end against a local mock of the XRPC API and image CDN (no credentials needed).
+
+    python bench/run_bench.py --scenario small
+    python bench/run_bench.py --scenario throttled --compare bench/results/throttled_20250101_120000.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR)) # The archiver's modules live one level up
+
+import app
+from asset_store import AssetStore
+from atproto import Client
+from mock_server import MockBlueskyServer
+from rate_limiter import RateLimiter, rate_limited_request
+from run_metrics import metrics, time_breakdown
+from synthetic_feed import TARGET_DID, TARGET_HANDLE, SyntheticFeed, parse_embed_mix
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+SCENARIOS = {
+    'small': {'posts': 500},
+    'large': {'posts': 20000, 'image_kb': 20},
+    'text-only': {'posts': 20000, 'embed_mix': 'images=0,external=0,quote_post=0,record_with_media=0'},
+    'throttled': {'posts': 2000, 'latency_ms': 30, 'rate_limit_every': 5, 'rate_limit_reset': 1.0},
+}
+
+
+def peak_rss_mb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1) # Bytes on macOS, KiB on Linux
+
+
+def git_revision():
+    try: return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): return None
+
+
+def directory_size_bytes(directory_path):
+    return sum(os.path.getsize(os.path.join(directory_path, filename)) for filename in os.listdir(directory_path) if not filename.startswith('.'))
+
+
+class StageTimer:
+    """Times named stages and records the process's peak RSS after each; stage output is silenced unless verbose."""
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started_at = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if self.verbose else io.StringIO()): yield
+        self.stages[name] = {'seconds': round(time.perf_counter() - started_at, 4), 'peak_rss_mb_after': peak_rss_mb()}
+        print(f"  {name:<10} {self.stages[name]['seconds']:9.3f}s   peak RSS {self.stages[name]['peak_rss_mb_after']} MB")
+
+
+def run_benchmark(settings, verbose=False):
+    timer = StageTimer(verbose)
+    work_dir = tempfile.mkdtemp(prefix='bluearch_bench_')
+    assets_dir = os.path.join(work_dir, app.ASSETS_FOLDER_NAME); os.makedirs(assets_dir)
+    print(f"Benchmark '{settings['scenario']}': {settings['posts']} posts, work dir {work_dir}")
+    metrics.reset()
+    try:
+        with timer.stage('generate'):
+            mock_server = MockBlueskyServer(
+                None, settings['latency_ms'] / 1000, rate_limit_every=settings['rate_limit_every'],
+                rate_limit_reset_seconds=settings['rate_limit_reset'], image_bytes=settings['image_kb'] * 1024
+            )
+            mock_server.synthetic_feed = SyntheticFeed(mock_server.base_url, settings['posts'], parse_embed_mix(settings['embed_mix']) if settings['embed_mix'] else None, settings['reply_ratio'], settings['repost_ratio'])
+            mock_server.start()
+        xrpc_rate_limiter = RateLimiter('XRPC', settings['xrpc_rps']); cdn_rate_limiter = RateLimiter('CDN', settings['cdn_rps'])
+        client = Client(base_url=f"{mock_server.base_url}/xrpc", request=rate_limited_request(xrpc_rate_limiter))
+        asset_store = AssetStore(assets_dir, cdn_rate_limiter, app.MEDIA_DOWNLOAD_WORKERS, app.MEDIA_MAX_CONCURRENT_PER_HOST)
+        with timer.stage('fetch'):
+            posts_data = app.fetch_all_user_posts_sync(client, TARGET_DID, TARGET_DID, TARGET_HANDLE, asset_store)
+        if posts_data is None: raise RuntimeError("fetch_all_user_posts_sync failed; rerun with --verbose to see why")
+        with timer.stage('media'): # Downloads still queued when paging finished
+            for post_details in posts_data: app.resolve_post_asset_paths(post_details)
+            asset_store.close()
+        with timer.stage('threading'):
+            display_feed = app.organize_feed_for_threading(posts_data, TARGET_DID)
+        with timer.stage('csv'):
+            app.save_posts_to_csv(display_feed, os.path.join(work_dir, app.OUTPUT_FILENAME_CSV))
+        with timer.stage('html'):
+            app.generate_html_timeline(display_feed, TARGET_HANDLE, os.path.join(work_dir, app.OUTPUT_FILENAME_HTML), posts_per_page=app.HTML_POSTS_PER_PAGE)
+        mock_server.stop()
+        run_metrics = metrics.snapshot(); run_metrics['time_breakdown'] = time_breakdown(dict(run_metrics, media_download_workers=app.MEDIA_DOWNLOAD_WORKERS))
+        media_bytes = directory_size_bytes(assets_dir); media_seconds = timer.stages['fetch']['seconds'] + timer.stages['media']['seconds']
+        total_seconds = sum(stage['seconds'] for name, stage in timer.stages.items() if name != 'generate')
+        return {
+            'scenario': settings['scenario'], 'started_at': settings['started_at'], 'git_revision': git_revision(),
+            'python': platform.python_version(), 'platform': platform.platform(), 'settings': settings,
+            'posts_archived': len(posts_data), 'total_seconds': round(total_seconds, 4),
+            'posts_per_second': round(len(posts_data) / total_seconds, 1) if total_seconds else None,
+            'fetch_posts_per_second': round(len(posts_data) / timer.stages['fetch']['seconds'], 1) if timer.stages['fetch']['seconds'] else None,
+            'media_files': asset_store.downloads_count, 'media_references_reused': asset_store.reused_count, 'media_mb': round(media_bytes / 1e6, 2),
+            'media_mb_per_second': round(media_bytes / 1e6 / media_seconds, 2) if media_seconds else None,
+            'peak_rss_mb': peak_rss_mb(), 'stages': timer.stages, 'server': mock_server.stats.as_dict(),
+            'rate_limiters': {'xrpc': xrpc_rate_limiter.stats(), 'cdn': cdn_rate_limiter.stats()}, 'run_metrics': run_metrics
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_comparison(results, baseline):
+    print(f"\nCompared with {baseline.get('scenario')} @ {baseline.get('git_revision')} ({baseline.get('started_at')}):")
+    for metric_name in ('total_seconds', 'posts_per_second', 'media_mb_per_second', 'peak_rss_mb'):
+        current_value = results.get(metric_name); baseline_value = baseline.get(metric_name)
+        if current_value is None or not baseline_value: continue
+        print(f"  {metric_name:<22} {baseline_value:>10} -> {current_value:>10}  ({(current_value - baseline_value) / baseline_value:+.1%})")
+    for stage_name, stage in results['stages'].items():
+        baseline_stage = baseline.get('stages', {}).get(stage_name)
+        if baseline_stage and baseline_stage['seconds']:
+            print(f"  stage {stage_name:<16} {baseline_stage['seconds']:>9.3f}s -> {stage['seconds']:>9.3f}s  ({(stage['seconds'] - baseline_stage['seconds']) / baseline_stage['seconds']:+.1%})")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark the archiver against a local mock XRPC/CDN server.")
+    arg_parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='small', help="Preset to start from; the options below override it.")
+    arg_parser.add_argument('--posts', type=int, help="Number of feed items to generate.")
+    arg_parser.add_argument('--embed-mix', help="Embed kind weights, e.g. 'images=0.3,external=0.1,quote_post=0.05,record_with_media=0.05'.")
+    arg_parser.add_argument('--reply-ratio', type=float, help="Share of the target's posts that reply to its own earlier posts (default 0.2).")
+    arg_parser.add_argument('--repost-ratio', type=float, help="Share of feed items that are reposts (default 0.1).")
+    arg_parser.add_argument('--image-kb', type=int, help="Size of every served image in KiB (default 50).")
+    arg_parser.add_argument('--latency-ms', type=float, help="Latency added to every mock response (default 0).")
+    arg_parser.add_argument('--rate-limit-every', type=int, help="Answer every Nth XRPC request with a 429 (default 0 = never).")
+    arg_parser.add_argument('--rate-limit-reset', type=float, help="Seconds until an injected 429's rate-limit window resets (default 1).")
+    arg_parser.add_argument('--xrpc-rps', type=float, help=f"XRPC rate limit for the run (default app.XRPC_REQUESTS_PER_SECOND = {app.XRPC_REQUESTS_PER_SECOND}).")
+    arg_parser.add_argument('--cdn-rps', type=float, help=f"CDN rate limit for the run (default app.CDN_REQUESTS_PER_SECOND = {app.CDN_REQUESTS_PER_SECOND}).")
+    arg_parser.add_argument('--output', help="Where to write the JSON results (default bench/results/<scenario>_<timestamp>.json).")
+    arg_parser.add_argument('--compare', metavar='RESULTS_JSON', help="Earlier results to print a comparison against.")
+    arg_parser.add_argument('--verbose', action='store_true', help="Show the archiver's own output.")
+    cli_args = arg_parser.parse_args()
+
+    settings = {
+        'scenario': cli_args.scenario, 'started_at': datetime.now().isoformat(timespec='seconds'), 'posts': 500, 'embed_mix': None,
+        'reply_ratio': 0.2, 'repost_ratio': 0.1, 'image_kb': 50, 'latency_ms': 0.0, 'rate_limit_every': 0, 'rate_limit_reset': 1.0,
+        'xrpc_rps': app.XRPC_REQUESTS_PER_SECOND, 'cdn_rps': app.CDN_REQUESTS_PER_SECOND
+    }
+    settings.update(SCENARIOS[cli_args.scenario])
+    settings.update({setting_name: value for setting_name, value in vars(cli_args).items() if setting_name in settings and value is not None})
+    results = run_benchmark(settings, cli_args.verbose)
+    print(f"\n{results['posts_archived']} posts in {results['total_seconds']}s ({results['posts_per_second']} posts/s, fetch {results['fetch_posts_per_second']} posts/s), "
+          f"{results['media_mb']} MB of media at {results['media_mb_per_second']} MB/s, peak RSS {results['peak_rss_mb']} MB")
+    output_path = cli_args.output or os.path.join(RESULTS_DIR, f"{cli_args.scenario}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f: json.dump(results, f, indent=2)
+    print(f"Results saved to {output_path}")
+    if cli_args.compare:
+        with open(cli_args.compare, 'r', encoding='utf-8') as f: print_comparison(results, json.load(f))
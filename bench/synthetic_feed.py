@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import random
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_EMBED_MIX = {'none': 0.55, 'images': 0.25, 'external': 0.1, 'quote_post': 0.05, 'record_with_media': 0.05}
+TARGET_DID = 'did:plc:benchtarget0000000000000'
+TARGET_HANDLE = 'bench-target.test'
+
+
+def fake_cid(seed_text, codec_prefix='bafkrei'):
+    """Deterministic CID-shaped string, so CDN URLs carry a blob CID the archiver can key its assets on."""
+    digest = hashlib.sha256(str(seed_text).encode()).digest()
+    return codec_prefix + base64.b32encode(digest).decode().lower().rstrip('=')[:52]
+
+
+def parse_embed_mix(embed_mix_text):
+    """'images=0.3,external=0.1' -> weights for the embed kinds (the remainder goes to posts without embeds)."""
+    embed_mix = {kind: 0.0 for kind in DEFAULT_EMBED_MIX}
+    for part in filter(None, (embed_mix_text or '').split(',')):
+        kind, _, weight = part.partition('=')
+        if kind not in embed_mix: raise ValueError(f"Unknown embed kind '{kind}' (expected one of {', '.join(embed_mix)})")
+        embed_mix[kind] = float(weight)
+    embed_mix['none'] = max(0.0, 1.0 - sum(weight for kind, weight in embed_mix.items() if kind != 'none'))
+    return embed_mix
+
+
+class SyntheticFeed:
+    """Generates a deterministic author feed (app.bsky.feed.getAuthorFeed JSON items, newest first).
+
+    The mix of replies to the target's own posts, reposts and embed kinds is configurable, and post authors are
+    drawn from a fixed pool so avatar deduplication behaves like a real timeline.
+    """
+
+    def __init__(self, cdn_base_url, posts_count=1000, embed_mix=None, reply_ratio=0.2, repost_ratio=0.1,
+                 max_images_per_post=4, author_pool_size=50, text_words=30, seed=1):
+        self.cdn_base_url = cdn_base_url.rstrip('/')
+        self.posts_count = posts_count
+        self.embed_mix = embed_mix or DEFAULT_EMBED_MIX
+        self.reply_ratio = reply_ratio; self.repost_ratio = repost_ratio
+        self.max_images_per_post = max_images_per_post
+        self.author_pool_size = author_pool_size
+        self.text_words = text_words
+        self.random = random.Random(seed)
+        self.start_time = datetime(2024, 6, 1, tzinfo=timezone.utc)
+        self.items = self._generate()
+
+    def _author(self, author_number):
+        if author_number == 0: did, handle = TARGET_DID, TARGET_HANDLE
+        else: did, handle = f"did:plc:benchauthor{author_number:015d}", f"author{author_number}.test"
+        return {'did': did, 'handle': handle, 'displayName': f"Bench Author {author_number}", 'avatar': f"{self.cdn_base_url}/img/avatar/plain/{did}/{fake_cid(('avatar', did))}@jpeg"}
+
+    def _image_view(self, did, image_seed):
+        blob_cid = fake_cid(('image', image_seed))
+        return {'thumb': f"{self.cdn_base_url}/img/feed_thumbnail/plain/{did}/{blob_cid}@jpeg", 'fullsize': f"{self.cdn_base_url}/img/feed_fullsize/plain/{did}/{blob_cid}@jpeg", 'alt': f"alt text {image_seed}"}
+
+    def _embed(self, embed_kind, author, item_number):
+        if embed_kind == 'images':
+            return {'$type': 'app.bsky.embed.images#view', 'images': [self._image_view(author['did'], (item_number, k)) for k in range(self.random.randint(1, self.max_images_per_post))]}
+        if embed_kind == 'external':
+            return {'$type': 'app.bsky.embed.external#view', 'external': {'uri': f"https://example.com/article/{item_number}", 'title': f"Article {item_number}", 'description': "A linked article used by the benchmark."}}
+        quoted_author = self._author(self.random.randint(1, self.author_pool_size))
+        quoted_record = {
+            '$type': 'app.bsky.embed.record#viewRecord', 'uri': f"at://{quoted_author['did']}/app.bsky.feed.post/quoted{item_number:08d}", 'cid': fake_cid(('quoted', item_number), 'bafyrei'),
+            'author': quoted_author, 'value': {'$type': 'app.bsky.feed.post', 'text': 'quoted', 'createdAt': self.start_time.isoformat()}, 'indexedAt': self.start_time.isoformat()
+        }
+        if embed_kind == 'quote_post': return {'$type': 'app.bsky.embed.record#view', 'record': quoted_record}
+        return {'$type': 'app.bsky.embed.recordWithMedia#view', 'record': {'record': quoted_record},
+                'media': {'$type': 'app.bsky.embed.images#view', 'images': [self._image_view(author['did'], (item_number, 'media'))]}}
+
+    def _generate(self):
+        items = []; own_post_uris = []
+        embed_kinds = list(self.embed_mix); embed_weights = [self.embed_mix[kind] for kind in embed_kinds]
+        for item_number in range(self.posts_count):
+            created_at = (self.start_time + timedelta(minutes=7 * item_number)).isoformat().replace('+00:00', 'Z') # Generated oldest first
+            is_repost = self.random.random() < self.repost_ratio
+            author = self._author(self.random.randint(1, self.author_pool_size) if is_repost else 0)
+            post_uri = f"at://{author['did']}/app.bsky.feed.post/bench{item_number:08d}"
+            record = {'$type': 'app.bsky.feed.post', 'text': ' '.join(f"word{self.random.randint(0, 5000)}" for _ in range(self.text_words)), 'createdAt': created_at, 'langs': ['en']}
+            if not is_repost and own_post_uris and self.random.random() < self.reply_ratio:
+                parent_uri = self.random.choice(own_post_uris[-20:])
+                record['reply'] = {'parent': {'uri': parent_uri, 'cid': fake_cid(parent_uri, 'bafyrei')}, 'root': {'uri': parent_uri, 'cid': fake_cid(parent_uri, 'bafyrei')}}
+            post_view = {'uri': post_uri, 'cid': fake_cid(post_uri, 'bafyrei'), 'author': author, 'record': record, 'indexedAt': created_at,
+                         'replyCount': self.random.randint(0, 20), 'repostCount': self.random.randint(0, 20), 'likeCount': self.random.randint(0, 200)}
+            embed_kind = self.random.choices(embed_kinds, embed_weights)[0]
+            if embed_kind != 'none': post_view['embed'] = self._embed(embed_kind, author, item_number)
+            item = {'post': post_view}
+            if is_repost: item['reason'] = {'$type': 'app.bsky.feed.defs#reasonRepost', 'by': self._author(0), 'indexedAt': created_at}
+            else: own_post_uris.append(post_uri)
+            items.append(item)
+        items.reverse() # Replies point at older posts of the target; the feed itself is newest first
+        return items
+
+    def page(self, cursor, limit):
+        """One getAuthorFeed response body for the given cursor (an offset into the feed)."""
+        start = int(cursor or 0); end = start + limit
+        page_body = {'feed': self.items[start:end]}
+        if end < len(self.items): page_body['cursor'] = str(end)
+        return page_body
+
+    def profile(self):
+        target = self._author(0)
+        return dict(target, followersCount=1000, followsCount=100, postsCount=self.posts_count, description="Synthetic benchmark profile")
@@ -0,0 +1,93 @@
+import json
+import os
+from collections import deque
+
+from post_record import PostRecord
+
+CHECKPOINT_FILENAME = 'fetch_checkpoint.json'
+CHECKPOINT_ROWS_FILENAME = 'fetch_checkpoint_rows.jsonl'
+
+
+class FetchCheckpoint:
+    """On-disk progress of a feed fetch, kept inside the archive folder so an interrupted run can be resumed.
+
+    Rows are appended to a JSON-lines file one page at a time and the state file (cursor, committed row count)
+    is swapped in afterwards, so a crash between the two only loses the page that was being committed.
+    """
+
+    def __init__(self, archive_folder_path):
+        self.state_path = os.path.join(archive_folder_path, CHECKPOINT_FILENAME)
+        self.rows_path = os.path.join(archive_folder_path, CHECKPOINT_ROWS_FILENAME)
+        self.state = {'cursor': None, 'pages_committed': 0, 'rows_committed': 0, 'finished': False}
+        self.uncommitted_pages = deque()
+        self.rows_file_checked = False
+
+    def exists(self):
+        return os.path.exists(self.state_path)
+
+    def load(self):
+        with open(self.state_path, 'r', encoding='utf-8') as f: self.state.update(json.load(f))
+        return self.state
+
+    def start(self, **run_details):
+        """Begins a fresh checkpoint, recording whatever is needed to resume the run (target, mode...)."""
+        self.state.update(run_details)
+        if os.path.exists(self.rows_path): os.remove(self.rows_path)
+        self._write_state()
+
+    def iter_rows(self):
+        """Yields the rows of every committed page; a partially appended trailing page is ignored."""
+        if not os.path.exists(self.rows_path): return
+        with open(self.rows_path, 'r', encoding='utf-8') as f:
+            for row_number, line in enumerate(f):
+                if row_number >= self.state['rows_committed']: break
+                yield PostRecord.from_dict(json.loads(line))
+
+    def load_rows(self):
+        return list(self.iter_rows())
+
+    def _write_state(self):
+        temp_state_path = self.state_path + '.tmp'
+        with open(temp_state_path, 'w', encoding='utf-8') as f: json.dump(self.state, f); f.flush(); os.fsync(f.fileno())
+        os.replace(temp_state_path, self.state_path)
+
+    def add_page(self, page_rows, next_cursor):
+        """Queues a fetched page; it is committed by commit_ready_pages once its rows are final."""
+        self.uncommitted_pages.append((page_rows, next_cursor))
+
+    def commit_ready_pages(self, is_row_ready, wait=False, on_commit=None):
+        """Commits queued pages in feed order while is_row_ready(row) holds for all their rows (or unconditionally with wait=True)."""
+        committed_count = 0
+        while self.uncommitted_pages:
+            page_rows, next_cursor = self.uncommitted_pages[0]
+            if not wait and not all(is_row_ready(row) for row in page_rows): break
+            if on_commit: on_commit(page_rows)
+            if not self.rows_file_checked: self._drop_uncommitted_rows(); self.rows_file_checked = True
+            with open(self.rows_path, 'a', encoding='utf-8') as f:
+                for row in page_rows: f.write(json.dumps(row.as_dict(), ensure_ascii=False) + '\n')
+                f.flush(); os.fsync(f.fileno())
+            self.state['cursor'] = next_cursor
+            self.state['pages_committed'] += 1
+            self.state['rows_committed'] += len(page_rows)
+            self._write_state()
+            self.uncommitted_pages.popleft(); committed_count += 1
+        return committed_count
+
+    def _drop_uncommitted_rows(self):
+        # After a crash the rows file can hold lines of a page whose commit never completed; cut them off before appending
+        if not os.path.exists(self.rows_path): return
+        committed_bytes = 0
+        with open(self.rows_path, 'rb') as f:
+            for line_number, line in enumerate(f):
+                if line_number >= self.state['rows_committed']: break
+                committed_bytes += len(line)
+        if committed_bytes != os.path.getsize(self.rows_path):
+            with open(self.rows_path, 'r+b') as f: f.truncate(committed_bytes)
+
+    def mark_finished(self):
+        self.state['finished'] = True
+        self._write_state()
+
+    def remove(self):
+        for path in (self.state_path, self.rows_path):
+            if os.path.exists(path): os.remove(path)
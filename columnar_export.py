@@ -0,0 +1,126 @@
+import gzip
+import json
+import os
+
+from feed_window import parse_timestamp
+from post_record import COUNT_FIELDS, SEQUENCE_FIELDS
+
+try: import pyarrow, pyarrow.parquet
+except ImportError: pyarrow = None # Only needed for parquet exports
+try: import zstandard
+except ImportError: zstandard = None # Only needed for ndjson.zst exports
+
+EXPORT_FORMATS = ('parquet', 'ndjson.gz', 'ndjson.zst')
+EXPORT_FILENAME_TEMPLATE = "bluesky_archive_{user_identifier}.{export_format}"
+EXPORT_ROW_GROUP_ROWS = 10000 # Rows buffered (over several feed pages) before they are written as one Parquet row group / compressed NDJSON batch
+PARQUET_COMPRESSION = 'zstd'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+TIMESTAMP_FIELDS = frozenset(('created_at',)) # UTC timestamps in exports; null when the post's createdAt does not parse
+
+
+def export_format_error(export_format):
+    """Why export_format cannot be written with the modules installed here, or None if it can."""
+    if export_format == 'parquet' and pyarrow is None: return "parquet exports need the pyarrow package (pip install pyarrow)"
+    if export_format == 'ndjson.zst' and zstandard is None: return "ndjson.zst exports need the zstandard package (pip install zstandard)"
+    return None
+
+
+def export_filename_for(user_identifier_for_filename, export_format):
+    safe_user_id_for_filename = os.path.basename(user_identifier_for_filename).replace('.', '_').replace('@', '').replace(':', '_')
+    return EXPORT_FILENAME_TEMPLATE.format(user_identifier=safe_user_id_for_filename, export_format=export_format)
+
+
+def export_value(name, value):
+    if name in SEQUENCE_FIELDS: return list(value) # One element per language/image/alt, so commas in alt texts stay unambiguous
+    if name in TIMESTAMP_FIELDS: return parse_timestamp(value) if value else None
+    return value # Counts are ints already (PostRecord), the rest strings
+
+
+def export_values(post_record, fieldnames):
+    """A PostRecord's typed values: lists for langs/images/alts, ints for counts, aware UTC datetimes for timestamps."""
+    return [export_value(name, getattr(post_record, name)) for name in fieldnames]
+
+
+def parquet_schema(fieldnames):
+    """The Parquet schema of an export with these columns (the fields extract_post_details_for_csv fills)."""
+    def field_type(name):
+        if name in SEQUENCE_FIELDS: return pyarrow.list_(pyarrow.string())
+        if name in COUNT_FIELDS: return pyarrow.int64()
+        if name in TIMESTAMP_FIELDS: return pyarrow.timestamp('us', tz='UTC')
+        return pyarrow.string()
+    return pyarrow.schema([pyarrow.field(name, field_type(name), nullable=name in TIMESTAMP_FIELDS) for name in fieldnames])
+
+
+class ParquetRowWriter:
+    """Appends PostRecords to a Parquet file as pages arrive, one row group per row_group_rows rows.
+
+    Values are gathered column by column, so a row group costs one pyarrow table and memory stays bounded by its size.
+    The file is only readable once close() has written its footer.
+    """
+
+    def __init__(self, export_filepath, fieldnames, row_group_rows=EXPORT_ROW_GROUP_ROWS):
+        if pyarrow is None: raise RuntimeError(export_format_error('parquet'))
+        self.fieldnames = fieldnames; self.row_group_rows = row_group_rows
+        self.schema = parquet_schema(fieldnames)
+        self.writer = pyarrow.parquet.ParquetWriter(export_filepath, self.schema, compression=PARQUET_COMPRESSION)
+        self.pending_columns = [[] for _ in fieldnames]; self.pending_rows = 0; self.rows_written = 0
+
+    def write_rows(self, rows):
+        for post_record in rows:
+            for column, value in zip(self.pending_columns, export_values(post_record, self.fieldnames)): column.append(value)
+            self.pending_rows += 1; self.rows_written += 1
+            if self.pending_rows >= self.row_group_rows: self._write_row_group()
+
+    def _write_row_group(self):
+        if not self.pending_rows: return
+        self.writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(column, type=field.type) for column, field in zip(self.pending_columns, self.schema)], schema=self.schema))
+        self.pending_columns = [[] for _ in self.fieldnames]; self.pending_rows = 0
+
+    def close(self):
+        if self.writer:
+            self._write_row_group(); self.writer.close(); self.writer = None
+
+
+class NdjsonRowWriter:
+    """Appends PostRecords to a gzip or zstd compressed JSON-lines file, one object per row with typed values.
+
+    Lines are compressed in batches of row_group_rows rows and each batch is flushed to a block boundary, so a run that
+    stops early still leaves a file that decompresses up to the last batch.
+    """
+
+    def __init__(self, export_filepath, fieldnames, compression, row_group_rows=EXPORT_ROW_GROUP_ROWS):
+        self.fieldnames = fieldnames; self.compression = compression; self.row_group_rows = row_group_rows
+        if compression == 'zstd':
+            if zstandard is None: raise RuntimeError(export_format_error('ndjson.zst'))
+            self.export_file = open(export_filepath, 'wb')
+            self.stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self.export_file)
+        else: self.export_file = None; self.stream = gzip.open(export_filepath, 'wb', compresslevel=GZIP_LEVEL)
+        self.pending_lines = []; self.rows_written = 0
+
+    def write_rows(self, rows):
+        for post_record in rows:
+            row = dict(zip(self.fieldnames, export_values(post_record, self.fieldnames)))
+            for name in TIMESTAMP_FIELDS.intersection(row):
+                if row[name]: row[name] = row[name].isoformat(timespec='microseconds').replace('+00:00', 'Z')
+            self.pending_lines.append(json.dumps(row, ensure_ascii=False))
+            self.rows_written += 1
+            if len(self.pending_lines) >= self.row_group_rows: self._write_batch()
+
+    def _write_batch(self):
+        if not self.pending_lines: return
+        self.stream.write(('\n'.join(self.pending_lines) + '\n').encode('utf-8')); self.pending_lines = []
+        if self.compression == 'zstd': self.stream.flush(zstandard.FLUSH_BLOCK)
+        else: self.stream.flush()
+
+    def close(self):
+        if self.stream:
+            self._write_batch(); self.stream.close(); self.stream = None
+            if self.export_file and not self.export_file.closed: self.export_file.close()
+
+
+def open_export_writer(export_filepath, fieldnames, export_format, row_group_rows=EXPORT_ROW_GROUP_ROWS):
+    """A streaming row writer (write_rows/close/rows_written, like StreamingCsvWriter) for one of EXPORT_FORMATS."""
+    if export_format == 'parquet': return ParquetRowWriter(export_filepath, fieldnames, row_group_rows)
+    if export_format in ('ndjson.gz', 'ndjson.zst'): return NdjsonRowWriter(export_filepath, fieldnames, 'zstd' if export_format == 'ndjson.zst' else 'gzip', row_group_rows)
+    raise ValueError(f"Unknown export format {export_format!r} (choose from {', '.join(EXPORT_FORMATS)})")
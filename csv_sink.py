@@ -0,0 +1,52 @@
+import csv
+import json
+import os
+
+from post_record import PostRecord
+
+
+class StreamingCsvWriter:
+    """Appends PostRecords as CSV rows as pages arrive and flushes every flush_every_rows rows, so nothing is held back until the end of a run."""
+
+    def __init__(self, csv_full_filepath, fieldnames, flush_every_rows=500):
+        self.csv_full_filepath = csv_full_filepath
+        self.fieldnames = fieldnames
+        self.flush_every_rows = flush_every_rows
+        self.rows_written = 0; self.rows_since_flush = 0
+        self.csvfile = open(csv_full_filepath, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.csvfile)
+        self.writer.writerow(fieldnames)
+
+    def write_rows(self, rows):
+        for post_record in rows:
+            self.writer.writerow(post_record.csv_values(self.fieldnames))
+            self.rows_written += 1; self.rows_since_flush += 1
+            if self.rows_since_flush >= self.flush_every_rows:
+                self.csvfile.flush(); self.rows_since_flush = 0
+
+    def close(self):
+        if not self.csvfile.closed: self.csvfile.close()
+
+
+def iter_csv_rows(csv_full_filepath):
+    """Yields the rows of an archive CSV file one at a time, as PostRecords."""
+    if not os.path.exists(csv_full_filepath): return
+    with open(csv_full_filepath, 'r', newline='', encoding='utf-8') as csvfile:
+        for csv_row in csv.DictReader(csvfile): yield PostRecord.from_stored_row(csv_row)
+
+
+def iter_jsonl_rows(jsonl_full_filepath, max_rows=None):
+    """Yields the PostRecords of a JSON-lines file one at a time (at most max_rows of them)."""
+    if not os.path.exists(jsonl_full_filepath): return
+    with open(jsonl_full_filepath, 'r', encoding='utf-8') as f:
+        for row_number, line in enumerate(f):
+            if max_rows is not None and row_number >= max_rows: break
+            yield PostRecord.from_dict(json.loads(line))
+
+
+def read_jsonl_rows_at(jsonl_full_filepath, row_offsets):
+    """Yields PostRecords of a JSON-lines file in the order of the given byte offsets, seeking instead of loading the file."""
+    with open(jsonl_full_filepath, 'rb') as f:
+        for row_offset in row_offsets:
+            f.seek(row_offset)
+            yield PostRecord.from_dict(json.loads(f.readline()))
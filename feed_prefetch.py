@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from run_metrics import metrics
+
+
+class FeedPagePrefetcher:
+    """Requests the next author-feed page on a background thread while the current page is being processed.
+
+    fetch_page(cursor) makes the actual request. As soon as a page's cursor is known the caller hands it to
+    prefetch(), and get(cursor) returns that page once extraction of the current one is done, so request latency
+    overlaps with extraction instead of adding to it. Only one page can be requested ahead (the cursor after it is
+    not known yet), so at most one request is in flight. A failed request raises from get() exactly as the direct
+    call would, and callers keep their retry handling.
+    """
+
+    def __init__(self, fetch_page):
+        self.fetch_page = fetch_page
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed-prefetch')
+        self.pending_cursor = None; self.pending_page = None
+
+    def _timed_fetch(self, cursor):
+        page_requested_at = time.perf_counter()
+        page = self.fetch_page(cursor)
+        metrics.observe('feed_page_seconds', time.perf_counter() - page_requested_at)
+        return page
+
+    def prefetch(self, cursor):
+        """Starts requesting the page at cursor, unless a page is already being requested ahead."""
+        if self.pending_page: return
+        self.pending_cursor = cursor; self.pending_page = self.executor.submit(self._timed_fetch, cursor)
+
+    def get(self, cursor):
+        """The page at cursor: the prefetched one when it was requested ahead, otherwise requested now."""
+        waited_from = time.perf_counter()
+        try:
+            if self.pending_page and self.pending_cursor == cursor:
+                pending_page = self.pending_page; self.pending_page = None
+                return pending_page.result()
+            self.discard()
+            return self._timed_fetch(cursor)
+        finally: metrics.observe('feed_page_wait_seconds', time.perf_counter() - waited_from)
+
+    def discard(self):
+        """Drops a look-ahead whose page will not be used (after an error, say); a request already running is waited
+        for, so two requests never overlap."""
+        if self.pending_page and not self.pending_page.cancel(): self.pending_page.exception()
+        self.pending_page = None
+
+    def close(self):
+        self.discard()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+# Values of getAuthorFeed's filter parameter; 'posts_with_replies' is what the server uses when none is given
+AUTHOR_FEED_FILTERS = ('posts_with_replies', 'posts_no_replies', 'posts_with_media', 'posts_and_author_threads')
+
+
+def parse_timestamp(value):
+    """An ISO 8601 timestamp ('2024-07-01T10:00:00.000Z', '2024-07-01') as an aware UTC datetime; None if unparsable."""
+    if isinstance(value, datetime): parsed = value
+    else:
+        try: parsed = datetime.fromisoformat(str(value).strip())
+        except ValueError: return None
+    return parsed.replace(tzinfo=timezone.utc) if parsed.tzinfo is None else parsed.astimezone(timezone.utc)
+
+
+def feed_item_sort_time(feed_view_post_item):
+    """The time an item is ordered by in the author feed: a repost's repost time, and for a post the earlier of its
+    createdAt and indexedAt (so a post claiming a future createdAt still sorts where it was indexed)."""
+    from atproto import models # Imported here so that the date helpers load without the SDK
+    reason = feed_view_post_item.reason
+    if isinstance(reason, models.AppBskyFeedDefs.ReasonRepost): return parse_timestamp(reason.indexed_at)
+    post = feed_view_post_item.post
+    created_at = parse_timestamp(getattr(post.record, 'created_at', None) or ''); indexed_at = parse_timestamp(post.indexed_at or '')
+    return min(created_at, indexed_at) if created_at and indexed_at else created_at or indexed_at
+
+
+class FeedWindow:
+    """The --since/--until bounds of a targeted pull (either may be open). A date without a time covers that
+    whole day, so --since 2024-07-01 --until 2024-09-30 is the third quarter.
+
+    position() tells where a feed item falls: 'newer' items are skipped while paging on towards the window,
+    'older' ones mean the newest-first feed has passed it, so pagination can stop there.
+    """
+
+    def __init__(self, since=None, until=None):
+        self.since_text = since; self.until_text = until
+        self.since = self._parse_bound(since, '--since') if since else None
+        self.until = self._parse_bound(until, '--until') if until else None
+        if self.until and 'T' not in until: self.until += timedelta(days=1) # Up to the end of that day
+        if self.since and self.until and self.since >= self.until: raise ValueError(f"--since {since} is not before --until {until}")
+
+    @staticmethod
+    def _parse_bound(value, option_name):
+        parsed = parse_timestamp(value)
+        if not parsed: raise ValueError(f"{option_name} expects a date or ISO 8601 timestamp (e.g. 2024-07-01 or 2024-07-01T12:00:00Z), got {value!r}")
+        return parsed
+
+    def __bool__(self):
+        return bool(self.since or self.until)
+
+    def position(self, timestamp):
+        """'newer', 'inside' or 'older' for a datetime or ISO string; items without a usable timestamp count as inside."""
+        timestamp = parse_timestamp(timestamp) if timestamp else None
+        if not timestamp: return 'inside'
+        if self.until and timestamp >= self.until: return 'newer'
+        if self.since and timestamp < self.since: return 'older'
+        return 'inside'
+
+    def describe(self):
+        return ' and '.join(part for part in (f"since {self.since_text}" if self.since else '', f"until {self.until_text}" if self.until else '') if part)
+
+
+def record_matches_feed_filter(record, feed_filter):
+    """The getAuthorFeed filter applied locally, for PostRecords decoded from a repository (--engine repo)."""
+    if feed_filter == 'posts_no_replies': return record.item_type != 'reply'
+    if feed_filter == 'posts_with_media': return record.item_type != 'repost' and bool(record.embed_image_urls or record.embed_local_image_paths)
+    if feed_filter == 'posts_and_author_threads': return record.item_type != 'reply' or record.reply_root_post_uri.startswith(f"at://{record.profile_user_did}/")
+    return True
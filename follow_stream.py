@@ -0,0 +1,110 @@
+import json
+import os
+import time
+from urllib.parse import urlencode
+
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from websockets.sync.client import connect
+
+from archive_db import archive_item_key
+from repo_export import POST_COLLECTION, REPOST_COLLECTION, repo_record_to_row
+from run_metrics import metrics
+
+JETSTREAM_URL = 'wss://jetstream2.us-east.bsky.network/subscribe'
+FOLLOW_COLLECTIONS = (POST_COLLECTION, REPOST_COLLECTION)
+FOLLOW_STATE_FILENAME = 'follow_state.json'
+CURSOR_REWIND_MICROSECONDS = 5_000_000 # Replayed on reconnect so nothing in flight is lost; upserts and deletes are idempotent
+RECONNECT_DELAYS_SECONDS = (1, 2, 5, 10, 30) # Backoff between reconnect attempts (the last one repeats)
+RECEIVE_TIMEOUT_SECONDS = 1.0 # How often events() yields None while the stream is quiet, so callers can flush
+MAX_EVENT_BYTES = 4 * 1024 * 1024
+
+
+def jetstream_subscribe_url(jetstream_url, dids, cursor=None):
+    """Subscription URL filtered server-side to the post/repost collections of dids, starting after cursor (time_us)."""
+    query = [('wantedCollections', collection) for collection in FOLLOW_COLLECTIONS] + [('wantedDids', did) for did in dids]
+    if cursor: query.append(('cursor', str(cursor)))
+    return f"{jetstream_url}?{urlencode(query)}"
+
+
+class FollowState:
+    """Where the follow of one archive stopped (Jetstream cursor, in microseconds) plus the subject of every repost it
+    saw created: a delete event only names the repost record, while the archive keys reposts by the reposted post."""
+
+    def __init__(self, archive_folder_path):
+        self.state_filepath = os.path.join(archive_folder_path, FOLLOW_STATE_FILENAME)
+        self.cursor = None; self.repost_subjects = {}
+        if os.path.exists(self.state_filepath):
+            try:
+                with open(self.state_filepath, 'r', encoding='utf-8') as f: saved_state = json.load(f)
+                self.cursor = saved_state.get('cursor'); self.repost_subjects = saved_state.get('repost_subjects', {})
+            except (IOError, ValueError) as e: print(f"    Warning: could not read follow state {self.state_filepath}: {e}")
+
+    def save(self):
+        try:
+            with open(self.state_filepath + '.tmp', 'w', encoding='utf-8') as f: json.dump({'cursor': self.cursor, 'repost_subjects': self.repost_subjects}, f)
+            os.replace(self.state_filepath + '.tmp', self.state_filepath)
+        except IOError as e: print(f"    Warning: could not save follow state {self.state_filepath}: {e}")
+
+
+def event_to_change(event, handle, author_profile, pds_endpoint, follow_state):
+    """Turns a Jetstream commit event into ('upsert', PostRecord) or ('delete', item key); None for anything else.
+
+    Records come from repo_export.repo_record_to_row, so they carry the same values (image getBlob URLs in
+    embed_image_urls, the avatar in author_avatar_url) and the same repost limitations as the repo engine.
+    """
+    commit = event.get('commit') or {}
+    if event.get('kind') != 'commit' or commit.get('collection') not in FOLLOW_COLLECTIONS: return None
+    did = event['did']; record_uri = f"at://{did}/{commit['collection']}/{commit.get('rkey', '')}"
+    if commit.get('operation') == 'delete':
+        if commit['collection'] == POST_COLLECTION: return ('delete', archive_item_key('post', record_uri))
+        subject_uri = follow_state.repost_subjects.pop(record_uri, None)
+        if not subject_uri: metrics.count('follow_unmatched_repost_deletes'); return None # Reposted before the follow started
+        return ('delete', archive_item_key('repost', subject_uri))
+    if commit.get('operation') not in ('create', 'update') or not isinstance(commit.get('record'), dict): return None
+    row = repo_record_to_row(commit['collection'], commit['rkey'], commit.get('cid', ''), commit['record'], did, handle, author_profile, pds_endpoint)
+    if row and row.item_type == 'repost': follow_state.repost_subjects[record_uri] = row.uri
+    return ('upsert', row) if row else None
+
+
+class JetstreamFollower:
+    """Subscribes to a Jetstream instance for the given DIDs and yields their decoded events, reconnecting as needed.
+
+    Each reconnect resumes CURSOR_REWIND_MICROSECONDS before the last event seen. events() also yields None after
+    RECEIVE_TIMEOUT_SECONDS without traffic, so the caller can flush batched writes while the stream is idle.
+    """
+
+    def __init__(self, dids, cursor=None, jetstream_url=JETSTREAM_URL):
+        self.dids = list(dids); self.cursor = cursor; self.jetstream_url = jetstream_url
+        self.connection = None
+
+    def _connect(self):
+        resume_cursor = self.cursor - CURSOR_REWIND_MICROSECONDS if self.cursor else None
+        subscribe_url = jetstream_subscribe_url(self.jetstream_url, self.dids, resume_cursor)
+        self.connection = connect(subscribe_url, max_size=MAX_EVENT_BYTES, open_timeout=15)
+        metrics.count('follow_connections')
+        print(f"Connected to {self.jetstream_url} for {len(self.dids)} account(s)" + (f", replaying from cursor {resume_cursor}." if resume_cursor else "."))
+
+    def events(self):
+        reconnect_attempt = 0
+        while True:
+            try:
+                if not self.connection: self._connect()
+                try: message = self.connection.recv(timeout=RECEIVE_TIMEOUT_SECONDS)
+                except TimeoutError: yield None; continue
+                reconnect_attempt = 0
+                try: event = json.loads(message)
+                except ValueError: metrics.count('follow_bad_events'); continue
+                if event.get('did') not in self.dids: continue
+                self.cursor = max(self.cursor or 0, event.get('time_us') or 0)
+                metrics.count('follow_events'); yield event
+            except (ConnectionClosed, InvalidHandshake, OSError) as e:
+                self.close()
+                reconnect_delay = RECONNECT_DELAYS_SECONDS[min(reconnect_attempt, len(RECONNECT_DELAYS_SECONDS) - 1)]; reconnect_attempt += 1
+                print(f"Event stream disconnected ({type(e).__name__}: {e}). Reconnecting in {reconnect_delay}s...")
+                time.sleep(reconnect_delay); yield None
+
+    def close(self):
+        if self.connection:
+            try: self.connection.close()
+            except Exception: pass
+            self.connection = None
@@ -0,0 +1,134 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+try: import fcntl
+except ImportError: fcntl = None # No reflinks outside Linux/Unix; placement falls back to copying
+
+MEDIA_CACHE_DB_FILENAME = 'media_cache.sqlite3'
+MEDIA_CACHE_FILES_FOLDER = 'files'
+MEDIA_CACHE_REVALIDATE_SECONDS = 7 * 24 * 3600 # URL-only entries older than this are revalidated (blob CIDs never change)
+MEDIA_CACHE_EVICTION_BATCH = 200
+FICLONE = 0x40049409 # Linux ioctl sharing a file's extents with another (btrfs, XFS with reflink, ...)
+MEDIA_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, size INTEGER, last_used REAL);
+CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, filename TEXT, etag TEXT, last_modified TEXT, checked_at REAL);
+CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used);
+CREATE INDEX IF NOT EXISTS keys_filename ON keys (filename);
+"""
+
+# A cache hit: the cached file and the validators to revalidate it with when needs_revalidation is set
+CachedMedia = namedtuple('CachedMedia', ['filename', 'filepath', 'etag', 'last_modified', 'needs_revalidation'])
+
+
+def place_file(source_filepath, target_filepath):
+    """Puts source_filepath at target_filepath without copying its data where the filesystem allows it: a hard link,
+    else a reflink clone, else a plain copy. Returns 'link', 'reflink' or 'copy'."""
+    try: os.link(source_filepath, target_filepath); return 'link'
+    except FileExistsError: raise # Never write through an existing file: it may itself be a link to the source
+    except OSError: pass # Other filesystem, or no hard links there
+    if fcntl:
+        try:
+            with open(source_filepath, 'rb') as source, open(target_filepath, 'wb') as target: fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return 'reflink'
+        except OSError: pass
+    shutil.copy2(source_filepath, target_filepath)
+    return 'copy'
+
+
+class MediaCache:
+    """Downloaded media kept across runs and archives in one folder, keyed like AssetStore (source URL and blob CID).
+
+    Files sit in files/ under the name AssetStore gives them and are placed into archives by place_file; an index
+    (media_cache.sqlite3) maps keys to files with the ETag/Last-Modified they came with. Blob CIDs name immutable
+    content, so a CID hit is used as-is; a URL-only hit older than revalidate_seconds is flagged for a conditional
+    request. Once the files add up to more than max_bytes the least recently used ones are evicted; archives that
+    hold hard links to them keep their copy. Safe to share between download threads.
+    """
+
+    def __init__(self, cache_dir, max_bytes, revalidate_seconds=MEDIA_CACHE_REVALIDATE_SECONDS):
+        self.cache_dir = os.path.abspath(cache_dir); self.max_bytes = max_bytes; self.revalidate_seconds = revalidate_seconds
+        self.files_dir = os.path.join(self.cache_dir, MEDIA_CACHE_FILES_FOLDER)
+        os.makedirs(self.files_dir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.cache_dir, MEDIA_CACHE_DB_FILENAME), timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL'); self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(MEDIA_CACHE_SCHEMA)
+        self.lock = threading.Lock()
+        self.total_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+        self.hits_count = 0; self.stored_count = 0; self.evicted_count = 0
+
+    def _filepath(self, filename):
+        return os.path.join(self.files_dir, filename)
+
+    def lookup(self, url_key, cid_key=None):
+        """The CachedMedia for a URL/CID key pair, or None. Entries whose file has gone missing are dropped."""
+        now = time.time()
+        with self.lock:
+            for key in (cid_key, url_key):
+                if not key: continue
+                found = self.connection.execute('SELECT filename, etag, last_modified, checked_at FROM keys WHERE key = ?', (key,)).fetchone()
+                if not found: continue
+                filename, etag, last_modified, checked_at = found
+                if not os.path.exists(self._filepath(filename)): self._forget(filename); continue
+                with self.connection: self.connection.execute('UPDATE files SET last_used = ? WHERE filename = ?', (now, filename))
+                needs_revalidation = not cid_key and now - (checked_at or 0) > self.revalidate_seconds
+                if not needs_revalidation: self.hits_count += 1
+                return CachedMedia(filename, self._filepath(filename), etag or '', last_modified or '', needs_revalidation)
+        return None
+
+    def mark_revalidated(self, key):
+        """Records a 304 Not Modified answer for key: the cached file is current again."""
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE keys SET checked_at = ? WHERE key = ?', (time.time(), key))
+            self.hits_count += 1
+
+    def store(self, keys, filename, source_filepath=None, data=None, etag=None, last_modified=None):
+        """Adds a downloaded file under keys, from source_filepath (linked in when possible) or from data."""
+        cached_filepath = self._filepath(filename); now = time.time()
+        try:
+            if not os.path.exists(cached_filepath):
+                if source_filepath: place_file(source_filepath, cached_filepath)
+                else:
+                    temp_filepath = os.path.join(self.files_dir, f".partial_{uuid.uuid4().hex[:8]}")
+                    with open(temp_filepath, 'wb') as f: f.write(data)
+                    os.replace(temp_filepath, cached_filepath)
+        except OSError as e: print(f"    Warning: could not add {filename} to the media cache: {e}"); return
+        with self.lock:
+            with self.connection:
+                known_size = self.connection.execute('SELECT size FROM files WHERE filename = ?', (filename,)).fetchone()
+                if not known_size:
+                    file_size = os.path.getsize(cached_filepath)
+                    self.connection.execute('INSERT INTO files VALUES (?, ?, ?)', (filename, file_size, now))
+                    self.total_bytes += file_size; self.stored_count += 1
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO keys VALUES (?, ?, ?, ?, ?)', [(key, filename, etag or '', last_modified or '', now) for key in keys if key]
+                )
+            if self.total_bytes > self.max_bytes: self._evict()
+
+    def _forget(self, filename):
+        with self.connection:
+            found = self.connection.execute('SELECT size FROM files WHERE filename = ?', (filename,)).fetchone()
+            self.connection.execute('DELETE FROM keys WHERE filename = ?', (filename,))
+            self.connection.execute('DELETE FROM files WHERE filename = ?', (filename,))
+        if found: self.total_bytes -= found[0]
+        if os.path.exists(self._filepath(filename)): os.remove(self._filepath(filename))
+
+    def _evict(self):
+        # Least recently used files first, until the cache is back under its size limit
+        while self.total_bytes > self.max_bytes:
+            oldest = self.connection.execute('SELECT filename FROM files ORDER BY last_used LIMIT ?', (MEDIA_CACHE_EVICTION_BATCH,)).fetchall()
+            if not oldest: self.total_bytes = 0; return
+            for (filename,) in oldest:
+                if self.total_bytes <= self.max_bytes: return
+                self._forget(filename); self.evicted_count += 1
+
+    def summary(self):
+        return (f"Media cache {self.cache_dir}: {self.hits_count} hits, {self.stored_count} files added, {self.evicted_count} evicted; "
+                f"{self.total_bytes / 1e6:.1f} of {self.max_bytes / 1e6:.0f} MB used")
+
+    def close(self):
+        with self.lock: self.connection.close()
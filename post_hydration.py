@@ -0,0 +1,91 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from rate_limiter import is_rate_limit_error
+
+CONTEXT_POSTS_FILENAME = 'context_posts.json'
+GET_POSTS_MAX_URIS = 25 # app.bsky.feed.getPosts accepts at most 25 URIs per call
+REFERENCE_FIELDS = ('reply_to_post_uri', 'reply_root_post_uri', 'embed_quote_post_uri')
+
+
+def collect_referenced_uris(rows, referenced_uris=None, archived_uris=None):
+    """Adds the parent/root/quoted URIs of rows to referenced_uris and their own URIs to archived_uris; returns both sets."""
+    referenced_uris = set() if referenced_uris is None else referenced_uris
+    archived_uris = set() if archived_uris is None else archived_uris
+    for row in rows:
+        archived_uris.add(row.uri)
+        for field in REFERENCE_FIELDS:
+            referenced_uri = getattr(row, field)
+            if referenced_uri: referenced_uris.add(referenced_uri)
+    return referenced_uris, archived_uris
+
+
+def context_post_from_view(post_view):
+    """The few fields of a hydrated PostView that are shown inline next to the posts referencing it."""
+    record = post_view.record
+    created_at = getattr(record, 'created_at', '') or ''
+    if isinstance(created_at, datetime): created_at = created_at.isoformat()
+    return {
+        'uri': post_view.uri, 'author_did': post_view.author.did, 'author_handle': post_view.author.handle,
+        'author_display_name': post_view.author.display_name or post_view.author.handle,
+        'text': getattr(record, 'text', '') or '', 'created_at': created_at
+    }
+
+
+class PostHydrator:
+    """Fetches posts referenced by the archive (reply parents/roots, quoted posts) with app.bsky.feed.getPosts.
+
+    URIs are deduped and sent in batches of 25 with up to max_batches_in_flight calls running at once (each still
+    paced by the client's rate limiter). Results are cached by URI in context_posts.json inside the archive folder,
+    so every post is fetched once across runs; posts that no longer exist are cached as None.
+    """
+
+    def __init__(self, client, archive_folder_path, max_batches_in_flight=4, max_attempts=3):
+        self.client = client
+        self.cache_path = os.path.join(archive_folder_path, CONTEXT_POSTS_FILENAME)
+        self.max_batches_in_flight = max_batches_in_flight
+        self.max_attempts = max_attempts
+        self.context_posts = {}
+        self.fetched_count = 0; self.failed_batches_count = 0
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as f: self.context_posts = json.load(f)
+            except (IOError, ValueError) as e: print(f"    Warning: could not read context post cache {self.cache_path}: {e}")
+
+    def _fetch_batch(self, batch_uris):
+        from atproto import models
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response_data = self.client.app.bsky.feed.get_posts(params=models.AppBskyFeedGetPosts.Params(uris=batch_uris))
+                return {post_view.uri: context_post_from_view(post_view) for post_view in response_data.posts}
+            except Exception as e:
+                if attempt < self.max_attempts and is_rate_limit_error(e): continue # The client's rate limiter holds the retry until the reset
+                raise
+
+    def hydrate(self, uris):
+        """Fetches every URI not cached yet and returns the whole cache ({uri: context post or None})."""
+        missing_uris = sorted(uri for uri in set(uris) if uri and uri not in self.context_posts)
+        if not missing_uris: return self.context_posts
+        batches = [missing_uris[i:i + GET_POSTS_MAX_URIS] for i in range(0, len(missing_uris), GET_POSTS_MAX_URIS)]
+        print(f"Hydrating {len(missing_uris)} referenced posts in {len(batches)} getPosts batches ({self.max_batches_in_flight} in flight)...")
+        with ThreadPoolExecutor(max_workers=self.max_batches_in_flight, thread_name_prefix='post-hydration') as executor:
+            pending_batches = {executor.submit(self._fetch_batch, batch_uris): batch_uris for batch_uris in batches}
+            for done in as_completed(pending_batches):
+                batch_uris = pending_batches[done]
+                try: fetched_posts = done.result()
+                except Exception as e:
+                    self.failed_batches_count += 1; print(f"    Error hydrating {len(batch_uris)} posts: {e}"); continue
+                for uri in batch_uris: self.context_posts[uri] = fetched_posts.get(uri) # None: deleted or not visible
+                self.fetched_count += len(fetched_posts)
+        self.save()
+        print(f"Hydrated {self.fetched_count} posts ({self.failed_batches_count} failed batches).")
+        return self.context_posts
+
+    def save(self):
+        temp_cache_path = self.cache_path + '.tmp'
+        try:
+            with open(temp_cache_path, 'w', encoding='utf-8') as f: json.dump(self.context_posts, f, ensure_ascii=False)
+            os.replace(temp_cache_path, self.cache_path)
+        except IOError as e: print(f"Error writing context post cache {self.cache_path}: {e}")
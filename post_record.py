@@ -0,0 +1,65 @@
+import html
+import sys
+
+# Every column either script writes, plus the source URLs a row carries until its media is queued
+RECORD_FIELDS = (
+    'profile_user_handle', 'profile_user_did', 'item_type', 'uri', 'cid', 'created_at', 'text', 'langs',
+    'author_handle', 'author_did', 'author_display_name', 'author_local_avatar_path', 'author_avatar_url',
+    'reply_count', 'repost_count', 'like_count', 'reply_to_post_uri', 'reply_root_post_uri',
+    'embed_type', 'embed_local_image_paths', 'embed_image_urls', 'embed_image_alts',
+    'embed_external_url', 'embed_external_title', 'embed_external_description', 'embed_quote_post_uri'
+)
+SEQUENCE_FIELDS = frozenset(('langs', 'embed_local_image_paths', 'embed_image_urls', 'embed_image_alts')) # Tuples in memory, comma-joined in CSV/SQLite
+COUNT_FIELDS = frozenset(('reply_count', 'repost_count', 'like_count'))
+# Values repeated across many posts (the archived account, authors, kinds) share one string object
+INTERNED_FIELDS = frozenset(('profile_user_handle', 'profile_user_did', 'item_type', 'author_handle', 'author_did', 'author_display_name', 'embed_type'))
+
+
+def split_sequence(value):
+    """A sequence field from a comma-joined CSV/SQLite column (or an already split list) as a tuple."""
+    if isinstance(value, (list, tuple)): return tuple(value)
+    return tuple(value.split(',')) if value else ()
+
+
+class PostRecord:
+    """One archived feed item (post, reply or repost), with a slot per field instead of a 24-key dict.
+
+    Values are raw: display names and texts are escaped only when rendered, and langs, image paths, image URLs and
+    alt texts are tuples (one alt per image, so alts containing commas survive in memory). While media is still
+    downloading, author_local_avatar_path / embed_local_image_paths hold AssetStore placeholders. thread_depth is
+    display-only (set by threading for the HTML indentation) and is never written out.
+    """
+    __slots__ = RECORD_FIELDS + ('thread_depth',)
+
+    def __init__(self, **fields):
+        for name in RECORD_FIELDS:
+            value = fields.get(name)
+            if name in SEQUENCE_FIELDS: value = split_sequence(value)
+            elif name in COUNT_FIELDS: value = int(value or 0)
+            elif value is None: value = ''
+            elif name in INTERNED_FIELDS and isinstance(value, str): value = sys.intern(value)
+            setattr(self, name, value)
+        self.thread_depth = 0
+
+    def __repr__(self):
+        return f"PostRecord({self.item_type} {self.uri})"
+
+    @classmethod
+    def from_dict(cls, row):
+        """Record from a JSON-lines checkpoint row (lists) or any dict of field values."""
+        return cls(**{name: value for name, value in row.items() if name in RECORD_FIELDS})
+
+    @classmethod
+    def from_stored_row(cls, row):
+        """Record from a CSV or archive database row. Archives written before display names were stored raw hold them
+        HTML-escaped, so they are unescaped here (a no-op for raw names) and escaped once again when rendered."""
+        record = cls.from_dict(row)
+        record.author_display_name = sys.intern(html.unescape(record.author_display_name))
+        return record
+
+    def as_dict(self):
+        """Non-empty fields only (JSON-lines checkpoints and scratch files); from_dict restores the rest."""
+        return {name: list(value) if name in SEQUENCE_FIELDS else value for name in RECORD_FIELDS for value in (getattr(self, name),) if value}
+
+    def csv_values(self, fieldnames):
+        return [','.join(getattr(self, name)) if name in SEQUENCE_FIELDS else getattr(self, name) for name in fieldnames]
@@ -0,0 +1,148 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from run_metrics import metrics
+
+
+class RateLimiter:
+    """Thread-safe token bucket that also follows the server's own rate-limit budget.
+
+    Locally it allows requests_per_second with bursts of up to burst requests. Each response's
+    ratelimit-remaining/ratelimit-reset headers (and Retry-After) are fed back through observe_response:
+    while the server reports budget left no extra waiting happens, when it is spent (or a 429 arrives)
+    every caller waits exactly until the reset time. Time spent waiting is counted for reporting.
+    """
+
+    def __init__(self, name, requests_per_second, burst=None, reserve_requests=1):
+        self.name = name
+        self.requests_per_second = requests_per_second
+        self.burst = burst or max(1, int(requests_per_second))
+        self.reserve_requests = reserve_requests # Budget left untouched so other clients of the same account are not starved
+        self.tokens = float(self.burst); self.last_refill = time.monotonic()
+        self.server_remaining = None; self.server_reset_at = None; self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.requests_count = 0; self.throttle_waits_count = 0; self.throttled_seconds = 0.0; self.rate_limited_responses_count = 0
+
+    def _seconds_to_wait(self, now):
+        if now < self.blocked_until: return self.blocked_until - now
+        if self.server_remaining is not None and self.server_reset_at is not None and self.server_remaining <= self.reserve_requests:
+            reset_in = self.server_reset_at - time.time()
+            if reset_in > 0: return reset_in
+            self.server_remaining = None # The window has rolled over
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.requests_per_second); self.last_refill = now
+        if self.tokens >= 1: return 0.0
+        return (1 - self.tokens) / self.requests_per_second
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self.lock:
+                wait_seconds = self._seconds_to_wait(time.monotonic())
+                if wait_seconds <= 0:
+                    self.tokens -= 1; self.requests_count += 1
+                    if self.server_remaining is not None: self.server_remaining -= 1
+                    return
+                self.throttle_waits_count += 1; self.throttled_seconds += wait_seconds
+            metrics.count(f"throttled_seconds.{self.name}", wait_seconds)
+            time.sleep(wait_seconds)
+
+    def seconds_until_allowed(self):
+        with self.lock: return max(0.0, self.blocked_until - time.monotonic())
+
+    def observe_response(self, status_code, headers):
+        """Updates the budget from a response's rate-limit headers; a 429 blocks everyone until the reset time."""
+        headers = {str(k).lower(): v for k, v in (headers or {}).items()}
+        with self.lock:
+            remaining = _header_number(headers.get('ratelimit-remaining'))
+            reset_at = _header_number(headers.get('ratelimit-reset'))
+            if remaining is not None: self.server_remaining = remaining
+            if reset_at is not None: self.server_reset_at = reset_at
+            if status_code == 429:
+                self.rate_limited_responses_count += 1
+                wait_seconds = _retry_after_seconds(headers.get('retry-after'))
+                if wait_seconds is None and reset_at is not None: wait_seconds = reset_at - time.time()
+                if wait_seconds is None: wait_seconds = 60 # No hint from the server at all
+                self.blocked_until = max(self.blocked_until, time.monotonic() + max(0.0, wait_seconds))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests_count, 'throttle_waits': self.throttle_waits_count,
+                'throttled_seconds': round(self.throttled_seconds, 3), 'rate_limited_responses': self.rate_limited_responses_count
+            }
+
+    def summary(self):
+        limiter_stats = self.stats()
+        return (f"{self.name} rate limiter: {limiter_stats['requests']} requests, throttled {limiter_stats['throttled_seconds']:.1f}s "
+                f"over {limiter_stats['throttle_waits']} waits, {limiter_stats['rate_limited_responses']} rate-limited (429) responses")
+
+
+def _header_number(value):
+    try: return float(value) if value is not None else None
+    except (TypeError, ValueError): return None
+
+
+def _retry_after_seconds(value):
+    if value is None: return None
+    seconds = _header_number(value)
+    if seconds is not None: return seconds
+    try: return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError): return None
+
+
+def is_rate_limit_error(exception):
+    response = getattr(exception, 'response', None)
+    if response is not None and getattr(response, 'status_code', None): # str() of an XRPC error also lists the ratelimit-* headers of any response
+        return response.status_code == 429 or getattr(getattr(response, 'content', None), 'error', None) == 'RateLimitExceeded'
+    return "ratelimit" in str(exception).lower()
+
+
+_rate_limited_request_class = None
+
+
+def rate_limited_request(rate_limiter):
+    """An atproto Request that paces every XRPC call through rate_limiter (pass it as Client(request=...)).
+
+    The class subclasses the SDK's Request, so it is only built on first use: importing this module loads no atproto.
+    """
+    global _rate_limited_request_class
+    if _rate_limited_request_class is None: _rate_limited_request_class = _build_rate_limited_request_class()
+    return _rate_limited_request_class(rate_limiter)
+
+
+def _build_rate_limited_request_class():
+    from atproto_client.exceptions import RequestErrorBase
+    from atproto_client.request import Request
+
+    class RateLimitedRequest(Request):
+        """atproto Request that paces every XRPC call through a RateLimiter and reports responses back to it."""
+
+        def __init__(self, rate_limiter):
+            super().__init__()
+            self.rate_limiter = rate_limiter
+
+        def _send_request(self, method, url, **kwargs):
+            self.rate_limiter.acquire()
+            request_started = time.perf_counter()
+            try:
+                response = super()._send_request(method, url, **kwargs)
+            except RequestErrorBase as e:
+                metrics.observe('xrpc_request_seconds', time.perf_counter() - request_started); metrics.count('xrpc_requests'); metrics.count('xrpc_errors')
+                if e.response is not None:
+                    if e.response.status_code == 429: metrics.count('xrpc_rate_limited')
+                    self.rate_limiter.observe_response(e.response.status_code, e.response.headers)
+                raise
+            metrics.observe('xrpc_request_seconds', time.perf_counter() - request_started); metrics.count('xrpc_requests')
+            response_length = next((_header_number(value) for name, value in (response.headers or {}).items() if str(name).lower() == 'content-length'), None)
+            metrics.count('xrpc_bytes', int(response_length or (len(response.content) if isinstance(response.content, bytes) else 0)))
+            self.rate_limiter.observe_response(response.status_code, response.headers)
+            return response
+
+    return RateLimitedRequest
+
+
+def attach_rate_limiter_to_session(http_session, rate_limiter):
+    """Feeds every response of a requests.Session back into rate_limiter (callers still acquire() before sending)."""
+    http_session.hooks['response'].append(lambda response, *args, **kwargs: rate_limiter.observe_response(response.status_code, response.headers))
+    return http_session
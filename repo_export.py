@@ -0,0 +1,137 @@
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import libipld
+
+from feed_window import parse_timestamp
+from post_record import PostRecord
+
+POST_COLLECTION = 'app.bsky.feed.post'
+REPOST_COLLECTION = 'app.bsky.feed.repost'
+PROFILE_RECORD_KEY = 'app.bsky.actor.profile/self'
+
+
+def resolve_pds_endpoint(did):
+    """Looks up the PDS hosting did from its DID document (e.g. 'https://morel.us-east.host.bsky.network')."""
+    from atproto import IdResolver
+    atproto_data = IdResolver().did.resolve_atproto_data(did)
+    if not atproto_data or not atproto_data.pds: raise ValueError(f"No PDS endpoint found in the DID document of {did}")
+    return atproto_data.pds.rstrip('/')
+
+
+def download_repo_car(did, pds_endpoint, request=None):
+    """Downloads the whole repository of did as one CAR file (com.atproto.sync.getRepo needs no login).
+
+    A separate client is used on purpose: the logged-in client's session headers must not be sent to a third-party PDS.
+    """
+    from atproto import Client, models
+    repo_client = Client(base_url=f"{pds_endpoint}/xrpc", request=request)
+    return repo_client.com.atproto.sync.get_repo(params=models.ComAtprotoSyncGetRepo.Params(did=did))
+
+
+def blob_url(pds_endpoint, did, blob_cid):
+    return f"{pds_endpoint}/xrpc/com.atproto.sync.getBlob?{urlencode({'did': did, 'cid': blob_cid})}"
+
+
+def blob_ref_cid(blob):
+    """CID of a blob reference, in either the current ({'ref': <link>}) or the legacy ({'cid': ...}) shape."""
+    if not isinstance(blob, dict): return None
+    blob_ref = blob.get('ref', blob.get('cid'))
+    if isinstance(blob_ref, dict): blob_ref = blob_ref.get('$link')
+    return blob_ref if isinstance(blob_ref, str) else None
+
+
+def iter_repo_records(car_bytes):
+    """Yields (collection, rkey, record cid, record) for every record of a repository CAR file.
+
+    The Merkle Search Tree under the commit is walked with an explicit stack; a key is stored as the number of
+    leading bytes it shares with the previous entry of its node ('p') plus the rest of it ('k').
+    """
+    car_header, blocks = libipld.decode_car(car_bytes)
+    commit = blocks[car_header['roots'][0]]
+    pending_node_cids = [commit['data']]
+    while pending_node_cids:
+        node = blocks.get(pending_node_cids.pop())
+        if node is None: continue # Not included in this CAR (partial export)
+        if node.get('l'): pending_node_cids.append(node['l'])
+        previous_key = b''
+        for entry in node.get('e') or []:
+            record_key = previous_key[:entry['p']] + entry['k']; previous_key = record_key
+            if entry.get('t'): pending_node_cids.append(entry['t'])
+            record = blocks.get(entry['v'])
+            if record is None: continue
+            collection, _, rkey = record_key.decode('utf-8').partition('/')
+            yield collection, rkey, entry['v'], record
+
+
+def image_embed_urls_and_alts(images_embed, pds_endpoint, did):
+    image_urls = []; image_alts = []
+    for image in images_embed.get('images') or []:
+        blob_cid = blob_ref_cid(image.get('image'))
+        if not blob_cid: continue
+        image_urls.append(blob_url(pds_endpoint, did, blob_cid)); image_alts.append(image.get('alt') or '')
+    return image_urls, image_alts
+
+
+def repo_record_to_row(collection, rkey, record_cid, record, did, handle, author_profile, pds_endpoint):
+    """Maps a post or repost record onto a PostRecord like app.extract_post_details_for_csv's (None for other collections).
+
+    Image references become getBlob URLs in embed_image_urls and the author's avatar a getBlob URL in
+    author_avatar_url; counts are 0 since a repository holds no engagement.
+    A repository only has the reposted post's URI, so a repost row carries its author DID in place of handle/name.
+    """
+    row = {
+        'profile_user_handle': handle, 'profile_user_did': did, 'item_type': 'post', 'uri': '', 'cid': '',
+        'author_did': did, 'author_handle': handle, 'author_display_name': author_profile.get('displayName') or handle,
+        'author_avatar_url': author_profile.get('avatar_url', ''), 'text': '', 'created_at': record.get('createdAt', ''), 'langs': '',
+        'reply_count': 0, 'repost_count': 0, 'like_count': 0, 'reply_to_post_uri': '', 'reply_root_post_uri': '',
+        'embed_type': '', 'embed_image_urls': (), 'embed_image_alts': (),
+        'embed_external_url': '', 'embed_external_title': '', 'embed_external_description': '', 'embed_quote_post_uri': ''
+    }
+    if collection == REPOST_COLLECTION:
+        subject = record.get('subject') or {}
+        if not subject.get('uri'): return None
+        from atproto import AtUri
+        try: subject_author_did = AtUri.from_str(subject['uri']).hostname
+        except ValueError: subject_author_did = ''
+        row.update({'item_type': 'repost', 'uri': subject['uri'], 'cid': subject.get('cid', ''), 'author_did': subject_author_did,
+                    'author_handle': subject_author_did, 'author_display_name': subject_author_did, 'author_avatar_url': ''})
+        return PostRecord(**row)
+    if collection != POST_COLLECTION: return None
+    row['uri'] = f"at://{did}/{collection}/{rkey}"; row['cid'] = record_cid
+    row['text'] = record.get('text', ''); row['langs'] = record.get('langs') or ()
+    reply = record.get('reply')
+    if reply and reply.get('parent'):
+        row['item_type'] = 'reply'; row['reply_to_post_uri'] = reply['parent'].get('uri', ''); row['reply_root_post_uri'] = (reply.get('root') or {}).get('uri', '')
+    embed = record.get('embed') or {}; embed_type = embed.get('$type', '')
+    if embed_type == 'app.bsky.embed.images':
+        row['embed_type'] = 'images'
+        row['embed_image_urls'], row['embed_image_alts'] = image_embed_urls_and_alts(embed, pds_endpoint, did)
+    elif embed_type == 'app.bsky.embed.external':
+        external = embed.get('external') or {}
+        row['embed_type'] = 'external'; row['embed_external_url'] = external.get('uri', ''); row['embed_external_title'] = external.get('title', ''); row['embed_external_description'] = external.get('description', '')
+    elif embed_type == 'app.bsky.embed.record':
+        quoted_uri = (embed.get('record') or {}).get('uri')
+        if quoted_uri: row['embed_type'] = 'quote_post'; row['embed_quote_post_uri'] = quoted_uri
+    elif embed_type == 'app.bsky.embed.recordWithMedia':
+        row['embed_type'] = 'record_with_media'
+        media = embed.get('media') or {}
+        if media.get('$type') == 'app.bsky.embed.images':
+            row['embed_image_urls'], row['embed_image_alts'] = image_embed_urls_and_alts(media, pds_endpoint, did)
+        row['embed_quote_post_uri'] = ((embed.get('record') or {}).get('record') or {}).get('uri', '')
+    return PostRecord(**row)
+
+
+def extract_repo_rows(car_bytes, did, handle, pds_endpoint):
+    """Decodes a repository CAR file into PostRecords, newest first like the author feed."""
+    records = []; author_profile = {}
+    for collection, rkey, record_cid, record in iter_repo_records(car_bytes):
+        if f"{collection}/{rkey}" == PROFILE_RECORD_KEY:
+            author_profile = dict(record)
+            avatar_cid = blob_ref_cid(record.get('avatar'))
+            if avatar_cid: author_profile['avatar_url'] = blob_url(pds_endpoint, did, avatar_cid)
+        elif collection in (POST_COLLECTION, REPOST_COLLECTION): records.append((collection, rkey, record_cid, record))
+    rows = [row for row in (repo_record_to_row(*record_details, did, handle, author_profile, pds_endpoint) for record_details in records) if row]
+    undated = datetime.min.replace(tzinfo=timezone.utc) # Records without a parsable createdAt go last
+    rows.sort(key=lambda row: parse_timestamp(row.created_at) or undated, reverse=True) # Parsed: raw strings mis-sort mixed offsets and precisions
+    return rows
@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+RUN_REPORT_FILENAME = 'run_report.json'
+HISTOGRAM_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROGRESS_INTERVAL_SECONDS = 0.5 # Redraw rate of the progress line on a terminal
+PROGRESS_LOG_INTERVAL_SECONDS = 15 # When output is redirected, a plain progress line this often instead
+RENDER_STAGES = ('threading', 'csv', 'hydrate', 'html', 'search_index')
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (count, sum, min/max and approximate percentiles)."""
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(HISTOGRAM_BUCKETS_SECONDS) + 1)
+        self.count = 0; self.total_seconds = 0.0; self.min_seconds = None; self.max_seconds = 0.0
+
+    def observe(self, seconds):
+        bucket_index = next((i for i, upper_bound in enumerate(HISTOGRAM_BUCKETS_SECONDS) if seconds <= upper_bound), len(HISTOGRAM_BUCKETS_SECONDS))
+        self.bucket_counts[bucket_index] += 1
+        self.count += 1; self.total_seconds += seconds
+        self.min_seconds = seconds if self.min_seconds is None else min(self.min_seconds, seconds); self.max_seconds = max(self.max_seconds, seconds)
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of observations (the max for the overflow bucket)."""
+        if not self.count: return None
+        needed = fraction * self.count; seen = 0
+        for bucket_index, bucket_count in enumerate(self.bucket_counts):
+            seen += bucket_count
+            if seen >= needed: return HISTOGRAM_BUCKETS_SECONDS[bucket_index] if bucket_index < len(HISTOGRAM_BUCKETS_SECONDS) else round(self.max_seconds, 4)
+        return round(self.max_seconds, 4)
+
+    def as_dict(self):
+        bucket_labels = [f"<={upper_bound}s" for upper_bound in HISTOGRAM_BUCKETS_SECONDS] + [f">{HISTOGRAM_BUCKETS_SECONDS[-1]}s"]
+        return {
+            'count': self.count, 'total_seconds': round(self.total_seconds, 4), 'mean_seconds': round(self.total_seconds / self.count, 4) if self.count else None,
+            'min_seconds': round(self.min_seconds, 4) if self.min_seconds is not None else None, 'max_seconds': round(self.max_seconds, 4),
+            'p50_seconds': self.percentile(0.5), 'p95_seconds': self.percentile(0.95), 'p99_seconds': self.percentile(0.99),
+            'buckets': {label: bucket_count for label, bucket_count in zip(bucket_labels, self.bucket_counts) if bucket_count}
+        }
+
+
+class RunMetrics:
+    """Counters, latency histograms and stage timings for one archiving run, safe to update from worker threads.
+
+    Every module records into the shared `metrics` instance below. progress() redraws a single status line (at most
+    every PROGRESS_INTERVAL_SECONDS) in place of per-item prints, and write_report() saves everything as JSON.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.now(timezone.utc); self.started_perf = time.perf_counter()
+            self.counters = {}; self.histograms = {}; self.stage_seconds = {}
+            self.last_progress_at = 0.0; self.progress_line_open = False
+
+    def count(self, name, amount=1):
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            if name not in self.histograms: self.histograms[name] = LatencyHistogram()
+            self.histograms[name].observe(seconds)
+
+    def add_stage_time(self, name, seconds):
+        with self.lock: self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the wall time of the block to stage `name` (stages may be entered more than once)."""
+        stage_started = time.perf_counter()
+        try: yield
+        finally: self.add_stage_time(name, time.perf_counter() - stage_started)
+
+    def elapsed_seconds(self):
+        return time.perf_counter() - self.started_perf
+
+    def progress_text(self):
+        with self.lock: counters = dict(self.counters)
+        elapsed = int(self.elapsed_seconds())
+        media_pending = counters.get('media_requested', 0) - counters.get('media_cache_hits', 0) - counters.get('media_downloads', 0) - counters.get('media_errors', 0)
+        throttled_seconds = sum(value for name, value in counters.items() if name.startswith('throttled_seconds.'))
+        return (f"[{elapsed // 60:02d}:{elapsed % 60:02d}] posts {counters.get('feed_items', 0):,} | pages {counters.get('feed_pages', 0):,} | "
+                f"media {counters.get('media_downloads', 0):,} downloaded, {counters.get('media_cache_hits', 0):,} reused, {max(0, media_pending):,} queued, "
+                f"{counters.get('media_bytes', 0) / 1e6:,.1f} MB | xrpc {counters.get('xrpc_requests', 0):,} req | throttled {throttled_seconds:.1f}s")
+
+    def progress(self, force=False):
+        """Redraws the progress line; calls in between redraw intervals are dropped."""
+        now = time.monotonic(); is_terminal = sys.stdout.isatty()
+        with self.lock:
+            if not force and now - self.last_progress_at < (PROGRESS_INTERVAL_SECONDS if is_terminal else PROGRESS_LOG_INTERVAL_SECONDS): return
+            self.last_progress_at = now
+        if is_terminal: print('\r' + self.progress_text() + '\x1b[K', end='', flush=True); self.progress_line_open = True
+        else: print(self.progress_text(), flush=True)
+
+    def end_progress(self):
+        """Leaves the progress line (showing the final counts) so regular output continues below it."""
+        if self.progress_line_open: self.progress(force=True); print(); self.progress_line_open = False
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': {name: round(value, 4) if isinstance(value, float) else value for name, value in sorted(self.counters.items())},
+                'latency_histograms': {name: histogram.as_dict() for name, histogram in sorted(self.histograms.items())},
+                'stage_seconds': {name: round(seconds, 4) for name, seconds in self.stage_seconds.items()}
+            }
+
+    def write_report(self, report_full_filepath, **run_details):
+        """Writes run_report.json: run details, stage timings, counters, histograms and where the time went."""
+        report = {'started_at': self.started_at.isoformat(), 'finished_at': datetime.now(timezone.utc).isoformat(), 'wall_seconds': round(self.elapsed_seconds(), 3)}
+        report.update(run_details); report.update(self.snapshot())
+        report['time_breakdown'] = time_breakdown(report)
+        try:
+            with open(report_full_filepath + '.tmp', 'w', encoding='utf-8') as f: json.dump(report, f, indent=2, default=str)
+            os.replace(report_full_filepath + '.tmp', report_full_filepath)
+            print(f"Run report saved to {report_full_filepath} (mostly {report['time_breakdown']['dominant']})")
+        except IOError as e: print(f"Error writing run report {report_full_filepath}: {e}")
+        return report
+
+
+def time_breakdown(report):
+    """Rough split of a run into waiting on the network, waiting on rate limits and local CPU work (rendering).
+
+    Network time is XRPC latency plus media download time spread over the download workers; throttle time is what
+    the rate limiters made callers wait. The largest of the three is reported as 'dominant'.
+    """
+    histograms = report.get('latency_histograms', {}); counters = report.get('counters', {}); stage_seconds = report.get('stage_seconds', {})
+    media_workers = max(1, report.get('media_download_workers') or 1)
+    network_seconds = histograms.get('xrpc_request_seconds', {}).get('total_seconds', 0) + histograms.get('media_download_seconds', {}).get('total_seconds', 0) / media_workers
+    throttled_seconds = counters.get('throttled_seconds.XRPC', 0) + counters.get('throttled_seconds.CDN', 0) / media_workers
+    rendering_seconds = sum(stage_seconds.get(name, 0) for name in RENDER_STAGES) + stage_seconds.get('extract', 0)
+    breakdown = {'network_seconds': round(network_seconds, 3), 'throttled_seconds': round(throttled_seconds, 3), 'cpu_rendering_seconds': round(rendering_seconds, 3)}
+    breakdown['dominant'] = {'network_seconds': 'network-bound', 'throttled_seconds': 'throttled', 'cpu_rendering_seconds': 'CPU-bound (extraction/rendering)'}[max(breakdown, key=breakdown.get)]
+    return breakdown
+
+
+metrics = RunMetrics()
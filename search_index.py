@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import unicodedata
+from array import array
+
+SEARCH_DB_FILENAME = 'search_index.sqlite3'
+SEARCH_JS_FILENAME = 'search_index.js'
+SEARCH_SHARDS_DIRNAME = 'search_index_shards' # Postings files the search box loads on demand: <shard number>.js
+SEARCH_SHARD_PREFIX_CHARS = 2 # A shard always holds every term sharing these leading characters
+SEARCH_SHARD_POSTINGS = 50000 # A shard is closed at the next prefix boundary once it holds this many postings
+SEARCH_SNIPPET_CHARS = 140
+SEARCH_TERM_PATTERN = re.compile(r'\w+')
+SEARCH_FTS_BATCH_ROWS = 1000
+
+
+def search_terms(text):
+    """Lower-cased, accent-stripped words of text, the same way the offline search box tokenizes a query."""
+    folded_text = ''.join(c for c in unicodedata.normalize('NFKD', (text or '').lower()) if not unicodedata.combining(c))
+    return [term for term in SEARCH_TERM_PATTERN.findall(folded_text) if len(term) > 1]
+
+
+def fts_match_expression(query):
+    """FTS5 MATCH expression for a free-text query: every word must match, the last one as a prefix."""
+    terms = search_terms(query)
+    if not terms: return None
+    return ' '.join(f'"{term}"' for term in terms[:-1]) + (' ' if len(terms) > 1 else '') + f'"{terms[-1]}"*'
+
+
+def search_term_sort_key(term):
+    """Orders terms by UTF-16 code units, as JavaScript compares strings, so the search box can binary search the list."""
+    return term.encode('utf-16-be')
+
+
+class SearchIndexWriter:
+    """Builds the archive's search indexes while the HTML timeline is written, one post at a time.
+
+    Two indexes come out of it: an SQLite FTS5 table (search_index.sqlite3, for search_archive and the command line)
+    over the post text, image alt text and link titles/descriptions, and a prebuilt inverted index for the offline
+    search box. Its search_index.js, loaded on first use, holds the documents and the sorted term list; the postings
+    are split by term prefix into files under search_index_shards/, each loaded the first time a query needs it.
+    Postings are kept as delta-encoded integer arrays and the document list is spooled to a temporary file, so
+    memory stays small for large archives.
+    """
+
+    def __init__(self, archive_folder_path):
+        self.archive_folder_path = archive_folder_path
+        self.db_full_filepath = os.path.join(archive_folder_path, SEARCH_DB_FILENAME)
+        self.js_full_filepath = os.path.join(archive_folder_path, SEARCH_JS_FILENAME)
+        self.shards_dir_full_path = os.path.join(archive_folder_path, SEARCH_SHARDS_DIRNAME)
+        if os.path.exists(self.db_full_filepath): os.remove(self.db_full_filepath) # Rebuilt from scratch with every timeline
+        self.connection = sqlite3.connect(self.db_full_filepath)
+        self.connection.execute(
+            'CREATE VIRTUAL TABLE posts_fts USING fts5(text, image_alts, external_title, external_description, '
+            "uri UNINDEXED, item_type UNINDEXED, created_at UNINDEXED, author_handle UNINDEXED, page UNINDEXED, anchor UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+        )
+        self.pending_fts_rows = []
+        self.page_numbers = {}
+        self.postings = {} # term -> array of doc-number gaps
+        self.last_doc_by_term = {}
+        self.docs_count = 0
+        self.docs_spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+
+    def add(self, post_data, page_filename, anchor):
+        """Indexes one post (a PostRecord) as it is written to page_filename under the HTML id anchor."""
+        text = post_data.text or ''; image_alts = '\n'.join(post_data.embed_image_alts)
+        external_title = post_data.embed_external_title or ''; external_description = post_data.embed_external_description or ''
+        self.pending_fts_rows.append((
+            text, image_alts, external_title, external_description, post_data.uri, post_data.item_type,
+            post_data.created_at, post_data.author_handle, page_filename, anchor
+        ))
+        if len(self.pending_fts_rows) >= SEARCH_FTS_BATCH_ROWS: self._flush_fts_rows()
+        if page_filename not in self.page_numbers: self.page_numbers[page_filename] = len(self.page_numbers)
+        doc_number = self.docs_count; self.docs_count += 1
+        snippet = ' '.join((text or external_title).split())[:SEARCH_SNIPPET_CHARS]
+        self.docs_spool.write(('' if doc_number == 0 else ',') + json.dumps([self.page_numbers[page_filename], anchor, (post_data.created_at or '')[:10], post_data.author_handle, snippet], ensure_ascii=False))
+        for term in set(search_terms(' '.join((text, image_alts, external_title, external_description)))):
+            if term not in self.postings: self.postings[term] = array('I'); self.last_doc_by_term[term] = 0
+            self.postings[term].append(doc_number - self.last_doc_by_term[term]); self.last_doc_by_term[term] = doc_number
+
+    def rename_page(self, old_page_filename, new_page_filename):
+        """Follows a page file that was renamed after its posts were indexed (a one-page timeline becomes the main HTML file)."""
+        self.page_numbers = {(new_page_filename if page_filename == old_page_filename else page_filename): page_number for page_filename, page_number in self.page_numbers.items()}
+        self.connection.execute('UPDATE posts_fts SET page = ? WHERE page = ?', (new_page_filename, old_page_filename))
+        self.pending_fts_rows = [fts_row[:8] + (new_page_filename if fts_row[8] == old_page_filename else fts_row[8],) + fts_row[9:] for fts_row in self.pending_fts_rows]
+
+    def _flush_fts_rows(self):
+        with self.connection: self.connection.executemany('INSERT INTO posts_fts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self.pending_fts_rows)
+        self.pending_fts_rows = []
+
+    def close(self):
+        """Finishes the FTS table and writes search_index.js and its postings shards (into temporary names, swapped in
+        when complete)."""
+        self._flush_fts_rows()
+        with self.connection: self.connection.execute("INSERT INTO posts_fts (posts_fts) VALUES ('optimize')")
+        self.connection.close()
+        sorted_terms = sorted(self.postings, key=search_term_sort_key)
+        temp_shards_dir_path = self.shards_dir_full_path + '.tmp'
+        shutil.rmtree(temp_shards_dir_path, ignore_errors=True); os.makedirs(temp_shards_dir_path)
+        shard_starts = self._write_shards(sorted_terms, temp_shards_dir_path)
+        temp_js_filepath = self.js_full_filepath + '.tmp'
+        with open(temp_js_filepath, 'w', encoding='utf-8') as f:
+            f.write('window.ARCHIVE_SEARCH_SHARDS={};window.ARCHIVE_SEARCH_INDEX={"pages":' + json.dumps(list(self.page_numbers), ensure_ascii=False) + ',"docs":[')
+            self.docs_spool.seek(0)
+            while True:
+                spooled_chunk = self.docs_spool.read(1 << 20)
+                if not spooled_chunk: break
+                f.write(spooled_chunk)
+            f.write('],"terms":' + json.dumps(sorted_terms, ensure_ascii=False) + ',"shardStarts":' + json.dumps(shard_starts) + '};\n')
+        shutil.rmtree(self.shards_dir_full_path, ignore_errors=True) # Shards of the previous index
+        os.replace(temp_shards_dir_path, self.shards_dir_full_path)
+        os.replace(temp_js_filepath, self.js_full_filepath)
+        self.docs_spool.close()
+        print(f"Search index built: {self.docs_count} posts, {len(self.postings)} terms in {len(shard_starts)} shards ({self.db_full_filepath}, {self.js_full_filepath})")
+
+    def _write_shards(self, sorted_terms, shards_dir_path):
+        """Writes the postings of consecutive runs of sorted_terms to <shard number>.js; returns each shard's first term number.
+        Shard n sets ARCHIVE_SEARCH_SHARDS[n] to the postings of its terms in order."""
+        shard_starts = []; shard_file = None; shard_postings = 0; previous_prefix = None
+        for term_number, term in enumerate(sorted_terms):
+            term_prefix = term[:SEARCH_SHARD_PREFIX_CHARS]
+            if shard_file is None or (shard_postings >= SEARCH_SHARD_POSTINGS and term_prefix != previous_prefix):
+                if shard_file: shard_file.write('];\n'); shard_file.close()
+                shard_file = open(os.path.join(shards_dir_path, f"{len(shard_starts)}.js"), 'w', encoding='utf-8')
+                shard_file.write(f"window.ARCHIVE_SEARCH_SHARDS[{len(shard_starts)}]=[")
+                shard_starts.append(term_number); shard_postings = 0
+            else: shard_file.write(',')
+            shard_file.write('[' + ','.join(map(str, self.postings[term])) + ']')
+            shard_postings += len(self.postings[term]); previous_prefix = term_prefix
+        if shard_file: shard_file.write('];\n'); shard_file.close()
+        return shard_starts
+
+
+def search_archive(archive_folder_path, query, limit=20):
+    """Best matches for query in an archive's FTS5 index, as dicts with a highlighted snippet and the page/anchor of the post."""
+    match_expression = fts_match_expression(query)
+    db_full_filepath = os.path.join(archive_folder_path, SEARCH_DB_FILENAME)
+    if not match_expression or not os.path.exists(db_full_filepath): return []
+    connection = sqlite3.connect(db_full_filepath); connection.row_factory = sqlite3.Row
+    try:
+        return [dict(found) for found in connection.execute(
+            "SELECT uri, item_type, created_at, author_handle, page, anchor, snippet(posts_fts, -1, '[', ']', '…', 12) AS snippet "
+            'FROM posts_fts WHERE posts_fts MATCH ? ORDER BY bm25(posts_fts) LIMIT ?', (match_expression, limit)
+        )]
+    finally: connection.close()
+
+
+# Offline search box: loads search_index.js on first use, then the postings shards each query needs, and answers from the prebuilt inverted index
+SEARCH_BOX_HTML = """<div class="archive-search"><input id="archive-search-input" type="search" placeholder="Search this archive…" autocomplete="off"><ol id="archive-search-results"></ol></div>
+<script>(function(){
+var input=document.getElementById('archive-search-input'),results=document.getElementById('archive-search-results'),index=null,loading=false,requestedShards={},loadedShards={},MAX_RESULTS=50;
+function fold(s){return s.toLowerCase().normalize('NFKD').replace(/[\\u0300-\\u036f]/g,'');}
+function queryTerms(s){return (fold(s).match(/[\\p{L}\\p{N}_]+/gu)||[]).filter(function(t){return t.length>1;});}
+function loadScript(src,then){var script=document.createElement('script');script.src=src;script.onload=script.onerror=then;document.head.appendChild(script);}
+function termRange(term,isPrefix){var terms=index.terms,lo=0,hi=terms.length;while(lo<hi){var mid=(lo+hi)>>1;if(terms[mid]<term)lo=mid+1;else hi=mid;}
+hi=lo;if(!isPrefix)return [lo,terms[lo]===term?lo+1:lo];while(hi<terms.length&&terms[hi].lastIndexOf(term,0)===0)hi++;return [lo,hi];}
+function shardOf(termNumber){var starts=index.shardStarts,lo=0,hi=starts.length-1;while(lo<hi){var mid=(lo+hi+1)>>1;if(starts[mid]<=termNumber)lo=mid;else hi=mid-1;}return lo;}
+function missingShards(ranges){var missing=[];ranges.forEach(function(range){if(range[0]<range[1])for(var s=shardOf(range[0]);s<=shardOf(range[1]-1);s++)if(!loadedShards[s]&&missing.indexOf(s)<0)missing.push(s);});return missing;}
+function loadShards(shards,then){var waiting=0;shards.forEach(function(s){if(requestedShards[s])return;requestedShards[s]=1;waiting++;
+loadScript('""" + SEARCH_SHARDS_DIRNAME + """/'+s+'.js',function(){loadedShards[s]=1;if(--waiting===0)then();});});}
+function postings(termNumber){var shard=shardOf(termNumber),gaps=(window.ARCHIVE_SEARCH_SHARDS[shard]||[])[termNumber-index.shardStarts[shard]]||[],docs=[],doc=0;for(var i=0;i<gaps.length;i++){doc+=gaps[i];docs.push(doc);}return docs;}
+function rangePostings(range){if(range[1]-range[0]===1)return postings(range[0]);
+var seen={},docs=[];for(var i=range[0];i<range[1];i++){postings(i).forEach(function(d){if(!seen[d]){seen[d]=1;docs.push(d);}});}return docs.sort(function(a,b){return a-b;});}
+function intersect(a,b){var keep={};b.forEach(function(d){keep[d]=1;});return a.filter(function(d){return keep[d];});}
+function search(){var terms=queryTerms(input.value);results.textContent='';if(!terms.length)return;
+var ranges=terms.map(function(term,i){return termRange(term,i===terms.length-1);}),missing=missingShards(ranges);if(missing.length)return loadShards(missing,search);
+var docs=rangePostings(ranges[ranges.length-1]);for(var i=0;i<ranges.length-1&&docs.length;i++)docs=intersect(docs,rangePostings(ranges[i]));
+docs.slice(0,MAX_RESULTS).forEach(function(d){var doc=index.docs[d],item=document.createElement('li'),link=document.createElement('a');
+link.href=index.pages[doc[0]]+'#'+doc[1];link.textContent=doc[2]+' · @'+doc[3];item.appendChild(link);var snippet=document.createElement('div');snippet.textContent=doc[4];item.appendChild(snippet);results.appendChild(item);});
+var summary=document.createElement('li');summary.textContent=docs.length>MAX_RESULTS?(docs.length+' matches, showing the first '+MAX_RESULTS):(docs.length+' matches');results.insertBefore(summary,results.firstChild);}
+function ready(then){if(index)return then();if(loading)return;loading=true;loadScript('""" + SEARCH_JS_FILENAME + """',function(){index=window.ARCHIVE_SEARCH_INDEX||null;if(index)then();});}
+var timer=null;input.addEventListener('input',function(){clearTimeout(timer);timer=setTimeout(function(){ready(search);},150);});
+})();</script>"""
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Search an archive folder's full-text index.")
+    arg_parser.add_argument('archive_dir', help="Archive folder (the one holding search_index.sqlite3).")
+    arg_parser.add_argument('query', help="Words to search for; the last word also matches as a prefix.")
+    arg_parser.add_argument('--limit', type=int, default=20, help="Maximum number of results (default 20).")
+    cli_args = arg_parser.parse_args()
+    if not os.path.exists(os.path.join(cli_args.archive_dir, SEARCH_DB_FILENAME)): print(f"No search index found in '{cli_args.archive_dir}'."); exit(1)
+    for found in search_archive(cli_args.archive_dir, cli_args.query, cli_args.limit):
+        print(f"{found['created_at'][:10]}  @{found['author_handle']}  {found['snippet']}")
+        print(f"    {found['uri']}  ({found['page']}#{found['anchor']})")
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from atproto import Session, SessionEvent
+from atproto_server.auth.jwt import get_jwt_payload
+from run_metrics import metrics
+
+# Live session tokens stay out of the working directory (usually a checkout): per-user config folder, owner-only
+SESSION_CACHE_DIR = os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config'), 'bluearch')
+SESSION_CACHE_FILENAME = os.path.join(SESSION_CACHE_DIR, 'bluesky_session.json')
+LEGACY_SESSION_CACHE_FILENAME = '.bluesky_session.json' # Where earlier versions saved it (the current directory); no longer read
+PRIVATE_SESSION_METHODS = ('_import_session_string', '_refresh_and_set_session') # atproto internals used below, tested with the atproto pinned in requirements.txt
+AUTH_ERROR_NAMES = ('ExpiredToken', 'InvalidToken', 'AuthenticationRequired')
+ACCESS_TOKEN_REFRESH_MARGIN_SECONDS = 15 * 60 # The client refreshes an access token this close to expiry before using it
+
+# The logged-in account as known from a restored session (no profile is fetched, so no display name)
+SessionAccount = namedtuple('SessionAccount', ['did', 'handle', 'display_name'])
+
+
+def is_auth_error(exception):
+    """True for a rejected or expired session: a 401, or a 400 whose XRPC error is ExpiredToken/InvalidToken."""
+    response = getattr(exception, 'response', None)
+    if response is not None: return response.status_code == 401 or getattr(response.content, 'error', None) in AUTH_ERROR_NAMES
+    return 'HTTPError: 401' in str(exception) or any(error_name in str(exception) for error_name in AUTH_ERROR_NAMES)
+
+
+def session_usable(session_string):
+    """True if the cached session's refresh token has not expired yet (the access token is refreshed on first use)."""
+    try: return get_jwt_payload(Session.decode(session_string).refresh_jwt).exp > time.time() + 60
+    except Exception: return False
+
+
+def check_private_session_api(client):
+    """Raises if this atproto version lacks the private Client methods session reuse relies on, so an SDK upgrade fails
+    loudly instead of quietly logging in with the app password on every run."""
+    missing_methods = [method_name for method_name in PRIVATE_SESSION_METHODS if not callable(getattr(client, method_name, None))]
+    if missing_methods: raise RuntimeError(f"this atproto version has no Client.{', Client.'.join(missing_methods)}; install the atproto version pinned in requirements.txt")
+
+
+def import_client_session(client, session_string):
+    """Sets a saved session on client without a request and returns it (Session: did, handle, tokens).
+    Client.login(session_string=...) would fetch the profile as well; this uses the private
+    Client._import_session_string of atproto 0.0.41 instead, so check it when upgrading the SDK."""
+    return client._import_session_string(session_string)
+
+
+def refresh_client_session(client):
+    """Trades the client's refresh token for a new session. The SDK has no public call for this: it relies on the
+    private Client._refresh_and_set_session of atproto 0.0.41, so check it when upgrading the SDK."""
+    client._refresh_and_set_session()
+
+
+class PersistedSession:
+    """Keeps a Client logged in across runs without calling createSession (rate limited per account) every time.
+
+    login() imports the session cached in session_cache_filepath when it belongs to login_handle and can still be
+    refreshed, and only falls back to the app password otherwise. Every created or refreshed session is written
+    back (readable by the owner only, mode 0600). The client itself refreshes the access token shortly before it
+    expires; reauthenticate() covers a token the server rejects anyway, so a long fetch can retry instead of stopping.
+    """
+
+    def __init__(self, client, login_handle, app_password, session_cache_filepath=SESSION_CACHE_FILENAME):
+        self.client = client
+        self.login_handle = login_handle
+        self.app_password = app_password
+        self.session_cache_filepath = session_cache_filepath
+        self.save_lock = threading.Lock(); self.reauthenticate_lock = threading.Lock()
+        check_private_session_api(client)
+        client.on_session_change(self._on_session_change)
+        client.persisted_session = self # Lets fetch loops find it, the way they find the client's rate limiter
+
+    def _load_session_string(self):
+        if not os.path.exists(self.session_cache_filepath): return None
+        try:
+            with open(self.session_cache_filepath, 'r', encoding='utf-8') as f: cached_session = json.load(f)
+        except (IOError, ValueError) as e:
+            print(f"    Warning: could not read session cache {self.session_cache_filepath}: {e}"); return None
+        if cached_session.get('login_handle') != self.login_handle: return None
+        return cached_session.get('session_string')
+
+    def _save_session_string(self, session_string):
+        temp_filepath = self.session_cache_filepath + '.tmp'
+        try:
+            if os.path.dirname(self.session_cache_filepath): os.makedirs(os.path.dirname(self.session_cache_filepath), mode=0o700, exist_ok=True)
+            file_descriptor = os.open(temp_filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(file_descriptor, 'w', encoding='utf-8') as f: json.dump({'login_handle': self.login_handle, 'session_string': session_string}, f)
+            os.chmod(temp_filepath, 0o600) # In case the temp file already existed with looser permissions
+            os.replace(temp_filepath, self.session_cache_filepath)
+        except OSError as e: print(f"    Warning: could not save session cache {self.session_cache_filepath}: {e}")
+
+    def _on_session_change(self, event, session):
+        if event == SessionEvent.IMPORT: return
+        metrics.count(f"session_{event.name.lower()}")
+        with self.save_lock: self._save_session_string(session.export())
+
+    def login(self):
+        """Logs the client in and returns the account (did, handle, display_name). A cached session is restored without
+        any request (its access token is refreshed first if it is about to expire, as the client would do anyway);
+        only when there is none, or it cannot be refreshed, is the app password used, which also fetches the profile."""
+        if os.path.exists(LEGACY_SESSION_CACHE_FILENAME) and os.path.abspath(LEGACY_SESSION_CACHE_FILENAME) != os.path.abspath(self.session_cache_filepath):
+            print(f"Note: {LEGACY_SESSION_CACHE_FILENAME} here holds live session tokens from an earlier version; sessions are now kept in {self.session_cache_filepath}, so delete it.")
+        session_string = self._load_session_string()
+        if session_string and session_usable(session_string):
+            try:
+                session = import_client_session(self.client, session_string)
+                if get_jwt_payload(session.access_jwt).exp < time.time() + ACCESS_TOKEN_REFRESH_MARGIN_SECONDS: refresh_client_session(self.client)
+                metrics.count('session_reused'); print(f"Reusing the saved session from {self.session_cache_filepath}.")
+                return SessionAccount(session.did, session.handle, None)
+            except Exception as e: print(f"Saved session could not be used ({type(e).__name__}); logging in with the app password.")
+        return self.client.login(self.login_handle, self.app_password)
+
+    def reauthenticate(self):
+        """Refreshes the session, or logs in again with the app password if the refresh token is rejected too. Returns True on success."""
+        with self.reauthenticate_lock:
+            try: refresh_client_session(self.client); return True
+            except Exception as e: print(f"    Session refresh failed ({type(e).__name__}); logging in again with the app password.")
+            try: self.client.login(self.login_handle, self.app_password); return True
+            except Exception as e: print(f"    Login failed: {e}"); return False
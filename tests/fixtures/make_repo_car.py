@@ -0,0 +1,65 @@
+"""Writes repo.car, the small repository CAR file test_repo_export decodes: python tests/fixtures/make_repo_car.py"""
+import base64
+import hashlib
+import os
+
+import libipld
+
+FIXTURE_DID = 'did:plc:fixture'
+FIXTURE_CAR_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'repo.car')
+AVATAR_CID = 'bafkreiavatarfixture'
+IMAGE_CID = 'bafkreiimagefixture'
+# createdAt values mix offsets and precisions on purpose: sorted as raw strings they come out in the wrong order
+FIXTURE_RECORDS = {
+    'app.bsky.actor.profile/self': {'$type': 'app.bsky.actor.profile', 'displayName': 'Fixture', 'avatar': {'$type': 'blob', 'ref': {'$link': AVATAR_CID}, 'mimeType': 'image/jpeg', 'size': 3}},
+    'app.bsky.feed.post/3k1': {'$type': 'app.bsky.feed.post', 'text': 'first', 'langs': ['en'], 'createdAt': '2024-03-01T10:00:00Z'},
+    'app.bsky.feed.post/3k2': {
+        '$type': 'app.bsky.feed.post', 'text': 'with an image', 'createdAt': '2024-03-01T12:30:00+02:00',
+        'embed': {'$type': 'app.bsky.embed.images', 'images': [{'alt': 'a, b', 'image': {'$type': 'blob', 'ref': {'$link': IMAGE_CID}, 'mimeType': 'image/jpeg', 'size': 3}}]}
+    },
+    'app.bsky.feed.post/3k3': {
+        '$type': 'app.bsky.feed.post', 'text': 'a reply', 'createdAt': '2024-03-01T10:15:00.123456+00:00',
+        'reply': {'parent': {'uri': f'at://{FIXTURE_DID}/app.bsky.feed.post/3k1', 'cid': 'x'}, 'root': {'uri': f'at://{FIXTURE_DID}/app.bsky.feed.post/3k1', 'cid': 'x'}}
+    },
+    'app.bsky.feed.post/3k5': {
+        '$type': 'app.bsky.feed.post', 'text': 'a link', 'createdAt': '2024-03-01T10:05:00.000-05:00',
+        'embed': {'$type': 'app.bsky.embed.external', 'external': {'uri': 'https://example.com/', 'title': 'Example', 'description': 'An example'}}
+    },
+    'app.bsky.feed.repost/3k4': {'$type': 'app.bsky.feed.repost', 'subject': {'uri': 'at://did:plc:other/app.bsky.feed.post/3z9', 'cid': 'bafyother'}, 'createdAt': '2024-03-01T09:00:00Z'},
+    'app.bsky.feed.like/3k6': {'$type': 'app.bsky.feed.like', 'subject': {'uri': 'at://did:plc:other/app.bsky.feed.post/3z9', 'cid': 'bafyother'}, 'createdAt': '2024-03-01T09:30:00Z'},
+}
+
+
+def varint(value):
+    encoded = b''
+    while True:
+        low_bits = value & 0x7f; value >>= 7
+        if not value: return encoded + bytes([low_bits])
+        encoded += bytes([low_bits | 0x80])
+
+
+def build_repo_car(did, records):
+    """A CAR with a commit over a two-level Merkle Search Tree (the first half of the keys in the left subtree)."""
+    blocks = {}
+    def put(block):
+        encoded = libipld.encode_dag_cbor(block)
+        cid_bytes = bytes([1, 0x71, 0x12, 0x20]) + hashlib.sha256(encoded).digest() # CIDv1, dag-cbor, sha2-256
+        cid = 'b' + base64.b32encode(cid_bytes).decode().lower().rstrip('=')
+        blocks[cid] = (cid_bytes, encoded); return cid
+    def node_entries(keys):
+        entries = []; previous_key = ''
+        for key in keys:
+            shared_length = len(os.path.commonprefix([previous_key, key]))
+            entries.append({'p': shared_length, 'k': key[shared_length:].encode(), 'v': put(records[key]), 't': None}); previous_key = key
+        return entries
+    keys = sorted(records); half = len(keys) // 2
+    left_node = put({'l': None, 'e': node_entries(keys[:half])})
+    root_node = put({'l': left_node, 'e': node_entries(keys[half:])})
+    commit = put({'did': did, 'version': 3, 'data': root_node, 'rev': 'fixture', 'prev': None, 'sig': b'\x00'})
+    header = libipld.encode_dag_cbor({'roots': [commit], 'version': 1})
+    return varint(len(header)) + header + b''.join(varint(len(cid_bytes) + len(encoded)) + cid_bytes + encoded for cid_bytes, encoded in blocks.values())
+
+
+if __name__ == "__main__":
+    with open(FIXTURE_CAR_FILEPATH, 'wb') as f: f.write(build_repo_car(FIXTURE_DID, FIXTURE_RECORDS))
+    print(f"Wrote {FIXTURE_CAR_FILEPATH}")
@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures'))
+
+from make_repo_car import AVATAR_CID, FIXTURE_CAR_FILEPATH, FIXTURE_DID, FIXTURE_RECORDS, IMAGE_CID
+from repo_export import blob_url, extract_repo_rows, iter_repo_records
+
+PDS_ENDPOINT = 'https://pds.example'
+
+
+class RepoExportTest(unittest.TestCase):
+    """The repo engine against tests/fixtures/repo.car, with no network (regenerate it with make_repo_car.py)."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(FIXTURE_CAR_FILEPATH, 'rb') as f: cls.car_bytes = f.read()
+
+    def test_iter_repo_records_walks_the_whole_tree(self):
+        records = {f"{collection}/{rkey}": record for collection, rkey, _, record in iter_repo_records(self.car_bytes)}
+        self.assertEqual(sorted(records), sorted(FIXTURE_RECORDS))
+        self.assertEqual(records['app.bsky.feed.post/3k1']['text'], 'first')
+
+    def test_extract_repo_rows_newest_first_by_parsed_time(self):
+        rows = extract_repo_rows(self.car_bytes, FIXTURE_DID, 'fixture.test', PDS_ENDPOINT)
+        self.assertEqual([row.uri.rsplit('/', 1)[1] for row in rows], ['3k5', '3k2', '3k3', '3k1', '3z9']) # Likes and the profile are skipped
+
+    def test_extract_repo_rows_values(self):
+        rows = {row.uri.rsplit('/', 1)[1]: row for row in extract_repo_rows(self.car_bytes, FIXTURE_DID, 'fixture.test', PDS_ENDPOINT)}
+        self.assertEqual(rows['3k1'].author_display_name, 'Fixture')
+        self.assertEqual(rows['3k1'].author_avatar_url, blob_url(PDS_ENDPOINT, FIXTURE_DID, AVATAR_CID))
+        self.assertEqual(rows['3k1'].langs, ('en',))
+        self.assertEqual(rows['3k2'].embed_image_urls, (blob_url(PDS_ENDPOINT, FIXTURE_DID, IMAGE_CID),))
+        self.assertEqual(rows['3k2'].embed_image_alts, ('a, b',))
+        self.assertEqual((rows['3k3'].item_type, rows['3k3'].reply_to_post_uri), ('reply', f'at://{FIXTURE_DID}/app.bsky.feed.post/3k1'))
+        self.assertEqual((rows['3k5'].embed_type, rows['3k5'].embed_external_url), ('external', 'https://example.com/'))
+        self.assertEqual((rows['3z9'].item_type, rows['3z9'].author_did), ('repost', 'did:plc:other'))
+        self.assertEqual(rows['3z9'].like_count, 0) # A repository holds no engagement
+
+
+if __name__ == "__main__":
+    unittest.main()
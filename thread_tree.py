@@ -0,0 +1,84 @@
+from array import array
+from collections import namedtuple
+
+from feed_window import parse_timestamp
+
+# What threading needs of an archived item; row_ref locates the full row (byte offset in a rows file, database rowid)
+ThreadIndexEntry = namedtuple('ThreadIndexEntry', 'uri author_did item_type reply_to_post_uri reply_root_post_uri created_at row_ref')
+CONVERSATION_GROUP_PREFIX = 'conversation:' # Children key of a conversation whose root post is not in the archive
+
+
+def thread_sort_time(created_at):
+    """Replies under one parent are shown oldest first, by their parsed createdAt (raw strings mis-sort mixed offsets)."""
+    parsed = parse_timestamp(created_at) if created_at else None
+    return parsed.timestamp() if parsed else 0.0
+
+
+def thread_child_sort_key(entry, feed_position):
+    """Order of the replies under one parent, shared by every threading path (in memory, rows file, archive database):
+    oldest first by thread_sort_time, ties in feed order."""
+    return (thread_sort_time(entry.created_at), feed_position)
+
+
+def thread_display_order(entries, profile_did_of_archived_user, whole_conversations=False):
+    """Threaded display order of a feed-ordered sequence of items (PostRecords or ThreadIndexEntry rows).
+
+    Returns (order, depths): indexes into entries in display order and each one's nesting depth (0 for items shown
+    at their feed position). By default the archived user's replies follow the post they answer, as they always
+    have. With whole_conversations every reply (reposts aside) joins its conversation: replies whose parent is not
+    archived hang under the conversation root (reply_root_post_uri), and the whole tree is shown from its root where
+    the conversation first comes up in the feed; replies to a root that is not archived are shown together, each at
+    depth 0. Parent->children lists are built in one pass and walked with an explicit stack, so time and memory stay
+    linear and long self-reply chains cannot hit the recursion limit. Like the feed, an item is shown once per URI.
+    """
+    entry_count = len(entries)
+    order = array('q'); depths = array('l')
+    if not entry_count: return order, depths
+    archived_indexes = {}
+    if whole_conversations:
+        for index, entry in enumerate(entries):
+            if entry.item_type != 'repost': archived_indexes.setdefault(entry.uri, index)
+    children = {} # parent URI (or CONVERSATION_GROUP_PREFIX + root URI) -> [child indexes]
+    for index, entry in enumerate(entries):
+        parent_uri = entry.reply_to_post_uri
+        if not parent_uri: continue
+        if not whole_conversations:
+            if entry.author_did != profile_did_of_archived_user: continue
+        elif entry.item_type == 'repost': continue
+        elif parent_uri not in archived_indexes:
+            root_uri = entry.reply_root_post_uri or parent_uri
+            parent_uri = root_uri if root_uri in archived_indexes and root_uri != entry.uri else CONVERSATION_GROUP_PREFIX + root_uri
+        children.setdefault(parent_uri, []).append(index)
+    for child_indexes in children.values():
+        if len(child_indexes) > 1: child_indexes.sort(key=lambda index: thread_child_sort_key(entries[index], index))
+    processed_uris = set()
+    def show_trees(top_indexes, depth=0):
+        pending = [(iter(top_indexes), depth)] # Explicit DFS stack of (children still to show, their depth)
+        while pending:
+            index = next(pending[-1][0], None)
+            if index is None: pending.pop(); continue
+            entry = entries[index]
+            if entry.uri in processed_uris: continue
+            depth = pending[-1][1]
+            order.append(index); depths.append(depth); processed_uris.add(entry.uri)
+            if entry.uri in children: pending.append((iter(children[entry.uri]), depth + 1))
+    def show_tree(index):
+        entry_uri = entries[index].uri
+        order.append(index); depths.append(0); processed_uris.add(entry_uri)
+        if entry_uri in children: show_trees(children[entry_uri], 1)
+    for index, entry in enumerate(entries):
+        if entry.uri in processed_uris: continue
+        if not whole_conversations or entry.item_type == 'repost': show_tree(index); continue
+        root_uri = entry.reply_root_post_uri or entry.uri
+        root_index = archived_indexes.get(root_uri)
+        if root_index is not None and entries[root_index].uri not in processed_uris: show_tree(root_index)
+        elif root_index is None: show_trees(children.get(CONVERSATION_GROUP_PREFIX + root_uri, ()))
+        if entry.uri not in processed_uris: show_tree(index) # Not reachable from its root (e.g. a reply cycle)
+    return order, depths
+
+
+def apply_thread_depths(rows, depths):
+    """Yields rows (PostRecords in display order) with thread_depth set from a thread_display_order depths array."""
+    for row, depth in zip(rows, depths):
+        row.thread_depth = depth
+        yield row